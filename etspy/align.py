@@ -10,8 +10,11 @@ Alignment module for ETSpy package.
 
 import numpy as np
 import copy
-from scipy import optimize, ndimage
+from scipy import optimize, ndimage, fft, sparse
+from scipy.sparse.linalg import spsolve
 import tqdm
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pystackreg import StackReg
 import logging
 from skimage.registration import phase_cross_correlation as pcc
@@ -19,7 +22,7 @@ from skimage.transform import hough_line, hough_line_peaks
 from skimage.feature import canny
 from skimage.filters import sobel
 import matplotlib.pylab as plt
-import astra
+from etspy import recon
 
 has_cupy = True
 try:
@@ -170,62 +173,58 @@ def calc_shifts_cl(stack, cl_ref_index, cl_resolution, cl_div_factor):
 
     """
 
-    def align_line(ref_line, line, cl_resolution, cl_div_factor):
+    def align_lines(ref_line, lines, cl_resolution, cl_div_factor):
         npad = len(ref_line) * 2 - 1
 
         # Pad with zeros while preserving the center location
+        start_index = (npad - len(ref_line)) // 2
         ref_line_pad = pad_line(ref_line, npad)
-        line_pad = pad_line(line, npad)
+        lines_pad = np.zeros([len(lines), npad])
+        lines_pad[:, start_index:start_index + len(ref_line)] = lines
 
         niters = int(np.abs(np.floor(np.log(cl_resolution) / np.log(cl_div_factor))))
-        start, end = -0.5, 0.5
+        start, end = np.full(len(lines), -0.5), np.full(len(lines), 0.5)
 
-        ref_line_pad_FT = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(ref_line_pad)))
-        line_pad_FT = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(line_pad)))
+        # The reference transform is shared by all lines
+        ref_line_pad_FT = np.conj(np.fft.fftshift(np.fft.fft(np.fft.ifftshift(ref_line_pad))))
+        lines_pad_FT = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(lines_pad, axes=-1)), axes=-1)
+        conjugate = ref_line_pad_FT * lines_pad_FT
 
         midpoint = (npad - 1) / 2
         kx = np.arange(-midpoint, midpoint + 1)
 
+        # Narrow down the subpixel shift of all lines at once by evaluating
+        # the cross correlation of every candidate shift in one batch.  The
+        # shifts of the FFT do not change the maximum, so they are skipped.
+        subpixel_shifts = np.zeros(len(lines))
         for i in range(niters):
-            boundary = np.linspace(start, end, cl_div_factor, False)
-            index = (boundary[:-1] + boundary[1:]) / 2
+            fractions = np.arange(cl_div_factor + 1) / cl_div_factor
+            boundary = start[:, np.newaxis] + (end - start)[:, np.newaxis] * fractions[:-1]
+            index = (boundary[:, :-1] + boundary[:, 1:]) / 2
 
-            max_vals = np.zeros(len(index))
-            for j, idx in enumerate(index):
-                pfactor = np.exp(2 * np.pi * 1j * (idx * kx / npad))
-                conjugate = np.conj(ref_line_pad_FT) * line_pad_FT * pfactor
-                xcorr = np.abs(np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(conjugate))))
-                max_vals[j] = np.max(xcorr)
+            pfactor = np.exp(2 * np.pi * 1j * (index[:, :, np.newaxis] * kx / npad))
+            max_vals = np.abs(np.fft.ifft(conjugate[:, np.newaxis, :] * pfactor)).max(-1)
 
-            max_loc = np.argmax(max_vals)
-            start, end = boundary[max_loc], boundary[max_loc + 1]
+            max_loc = np.argmax(max_vals, axis=1)
+            rows = np.arange(len(lines))
+            start, end = boundary[rows, max_loc], boundary[rows, max_loc + 1]
+            subpixel_shifts = index[rows, max_loc]
 
-        subpixel_shift = index[max_loc]
-        max_pfactor = np.exp(2 * np.pi * 1j * (subpixel_shift * kx / npad))
+        max_pfactor = np.exp(2 * np.pi * 1j * (subpixel_shifts[:, np.newaxis] * kx / npad))
 
         # Determine integer shift via cross correlation
-        conjugate = np.conj(ref_line_pad_FT) * line_pad_FT * max_pfactor
-        xcorr = np.abs(np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(conjugate))))
-        max_loc = np.argmax(xcorr)
-
-        integer_shift = max_loc
-        integer_shift = integer_shift - midpoint
+        xcorr = np.abs(np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(conjugate * max_pfactor, axes=-1)), axes=-1))
+        integer_shifts = np.argmax(xcorr, axis=1) - midpoint
 
         # Calculate full shift
-        shift = integer_shift + subpixel_shift
-        return -shift
+        return -(integer_shifts + subpixel_shifts)
 
     if cl_ref_index is None:
         cl_ref_index = stack.data.shape[0] // 2
 
-    yshifts = np.zeros(stack.data.shape[0])
-    ref_cm_line = stack.data[cl_ref_index].sum(0)
-
-    for i in tqdm.tqdm(range(stack.data.shape[0])):
-        if i == cl_ref_index:
-            continue
-        curr_cm_line = stack.data[i].sum(0)
-        yshifts[i] = align_line(ref_cm_line, curr_cm_line, cl_resolution, cl_div_factor)
+    cm_lines = stack.data.sum(1)
+    yshifts = align_lines(cm_lines[cl_ref_index], cm_lines, cl_resolution, cl_div_factor)
+    yshifts[cl_ref_index] = 0
     return yshifts
 
 
@@ -321,7 +320,240 @@ def calculate_shifts_com(stack, nslices):
     return yshifts
 
 
-def calculate_shifts_pc(stack, start, show_progressbar, upsample_factor, cuda):
+def map_threads(func, items, ncores=None, executor=None, show_progressbar=False):
+    """
+    Apply a function to each item concurrently in a pool of threads.
+
+    Args
+    ----------
+    func : callable
+        Function of one item
+    items : list
+        Items to which func is applied
+    ncores : int
+        Number of threads.  If None, 90% of the available cores are used.
+    executor : concurrent.futures.Executor
+        Executor to use instead of creating a thread pool
+    show_progressbar : boolean
+        Enable/disable progress bar
+
+    Returns
+    ----------
+    results : list
+        Result of func for each item, in the order of the items
+
+    """
+    items = list(items)
+    pool = None
+    if executor is None:
+        if ncores is None:
+            ncores = max(1, int(0.9 * os.cpu_count()))
+        pool = executor = ThreadPoolExecutor(ncores)
+    results = []
+    try:
+        with tqdm.tqdm(total=len(items), desc="Calculating shifts", disable=not show_progressbar) as pbar:
+            for result in executor.map(func, items):
+                results.append(result)
+                pbar.update(1)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+def calculate_neighbor_shifts_pc(data, neighbors=1, upsample_factor=1, chunk_size=16, workers=None,
+                                 show_progressbar=False, ncores=None, executor=None):
+    """
+    Calculate the phase correlation shifts between each projection and its next neighbors.
+
+    This is a batched version of the phase correlation of scikit-image.  The
+    real FFT of each projection is computed once, in chunks of projections,
+    and the cross-power spectra, integer peak search, and upsampled DFT
+    refinement are computed for all pairs of a chunk at once.  The chunks
+    are registered concurrently in a pool of threads, and the first
+    projections of each chunk are shared with the previous chunk, so only
+    the projections at the chunk boundaries are transformed twice.
+
+    Args
+    ----------
+    data : NumPy array
+        Image series of shape [nimages, ny, nx]
+    neighbors : int
+        Number of following images each image is registered to.
+        Default is 1.
+    upsample_factor : int
+        Images are registered to within 1 / upsample_factor of a pixel.
+        Default is 1.
+    chunk_size : int
+        Number of reference projections transformed at once. Default is 16.
+    workers : int
+        Number of threads for each FFT.  If None, all cores are used when
+        the chunks are registered one at a time, and one otherwise.
+    show_progressbar : boolean
+        Enable/disable progress bar
+    ncores : int
+        Number of chunks registered concurrently.  If None, 90% of the
+        available cores are used.
+    executor : concurrent.futures.Executor
+        Executor for the chunks instead of a new thread pool
+
+    Returns
+    ----------
+    pairs : NumPy array
+        Indices [i, j] of the registered images of shape [npairs, 2], with
+        i < j <= i + neighbors
+    pair_shifts : NumPy array
+        Shift of shape [npairs, 2] which registers image j to image i, as
+        returned by phase_cross_correlation(data[i], data[j])
+
+    """
+    nimages, ny, nx = data.shape
+    if ncores is None and executor is None:
+        ncores = max(1, int(0.9 * os.cpu_count()))
+    if workers is None:
+        workers = -1 if ncores == 1 else 1
+    shape = np.array([ny, nx])
+    midpoints = np.fix(shape / 2)
+    eps = np.finfo(np.float32).eps
+    freq_y = np.fft.fftfreq(ny)
+    freq_x = np.fft.rfftfreq(nx)
+    # Each column of the half spectrum also stands for its complex conjugate,
+    # except for the zero and Nyquist frequencies
+    weights = np.full(len(freq_x), 2.0)
+    weights[0] = 1
+    if nx % 2 == 0:
+        weights[-1] = 1
+
+    def register_chunk(start):
+        stop = min(start + chunk_size, nimages - 1)
+        chunk_fft = fft.rfft2(np.asarray(data[start:min(stop + neighbors, nimages)], np.float32), workers=workers)
+        pairs = np.array([[i, i + offset] for i in range(start, stop) for offset in range(1, neighbors + 1)
+                          if i + offset < nimages])
+        reference, moving = chunk_fft[pairs[:, 0] - start], chunk_fft[pairs[:, 1] - start]
+        npairs = len(pairs)
+
+        product = reference * moving.conj()
+        product /= np.maximum(np.abs(product), 100 * eps)
+        cross_correlation = fft.irfft2(product, s=(ny, nx), workers=workers)
+        maxima = np.abs(cross_correlation).reshape([npairs, -1]).argmax(1)
+        shifts = np.stack(np.unravel_index(maxima, (ny, nx)), axis=1).astype(float)
+        shifts = np.where(shifts > midpoints, shifts - shape, shifts)
+
+        if upsample_factor > 1:
+            shifts = np.round(shifts * upsample_factor) / upsample_factor
+            region_size = int(np.ceil(upsample_factor * 1.5))
+            dftshift = np.fix(region_size / 2.0)
+            offsets = (np.arange(region_size) - dftshift) / upsample_factor
+            # Cross-correlation on a grid of 1 / upsample_factor pixels around
+            # each integer peak, evaluated as a matrix product with the spectra
+            kernel_y = np.exp(2j * np.pi * (shifts[:, 0:1] + offsets)[:, :, np.newaxis] * freq_y)
+            kernel_x = weights * np.exp(2j * np.pi * (shifts[:, 1:2] + offsets)[:, :, np.newaxis] * freq_x)
+            upsampled = (kernel_y.astype(np.complex64) @ product @ kernel_x.astype(np.complex64).transpose(0, 2, 1)).real
+            maxima = np.abs(upsampled).reshape([npairs, -1]).argmax(1)
+            maxima = np.stack(np.unravel_index(maxima, (region_size, region_size)), axis=1) - dftshift
+            shifts += maxima / upsample_factor
+        return pairs, shifts
+
+    chunks = map_threads(register_chunk, range(0, nimages - 1, chunk_size), ncores, executor, show_progressbar)
+    if len(chunks) == 0:
+        return np.zeros([0, 2], int), np.zeros([0, 2])
+    pairs, pair_shifts = zip(*chunks)
+    return np.concatenate(pairs), np.concatenate(pair_shifts)
+
+
+def calculate_pair_shifts_pc(data, upsample_factor=1, chunk_size=16, workers=None, show_progressbar=False,
+                             ncores=None, executor=None):
+    """
+    Calculate the phase correlation shifts between all neighboring projections.
+
+    See calculate_neighbor_shifts_pc.
+
+    Args
+    ----------
+    data : NumPy array
+        Image series of shape [nimages, ny, nx]
+    upsample_factor : int
+        Images are registered to within 1 / upsample_factor of a pixel.
+        Default is 1.
+    chunk_size : int
+        Number of projections transformed at once. Default is 16.
+    workers : int
+        Number of threads for each FFT.  If None, all cores are used when
+        the chunks are registered one at a time, and one otherwise.
+    show_progressbar : boolean
+        Enable/disable progress bar
+    ncores : int
+        Number of chunks registered concurrently.  If None, 90% of the
+        available cores are used.
+    executor : concurrent.futures.Executor
+        Executor for the chunks instead of a new thread pool
+
+    Returns
+    ----------
+    pair_shifts : NumPy array
+        Shift of shape [nimages - 1, 2] which registers each image to the
+        previous one, as returned by phase_cross_correlation(data[i], data[i + 1])
+
+    """
+    return calculate_neighbor_shifts_pc(data, 1, upsample_factor, chunk_size, workers, show_progressbar,
+                                        ncores, executor)[1]
+
+
+def solve_global_shifts(pairs, pair_shifts, nimages, start, iterations=10, scale=None):
+    """
+    Find the shifts of all images which best agree with the pairwise shifts.
+
+    The pairwise shifts are combined by a sparse weighted least-squares fit,
+    shifts[j] - shifts[i] = pair_shift, with shifts[start] fixed at zero.
+    Pairs which disagree with the fit are down-weighted by iteratively
+    reweighted least squares with Cauchy weights, so that a single failed
+    registration does not corrupt the shifts of the following images as it
+    does when the pairwise shifts are accumulated.
+
+    Args
+    ----------
+    pairs : NumPy array
+        Indices [i, j] of the registered images of shape [npairs, 2]
+    pair_shifts : NumPy array
+        Shift of shape [npairs, 2] which registers image j to image i
+    nimages : int
+        Number of images
+    start : int
+        Index of the reference image
+    iterations : int
+        Number of reweighting iterations.  Default is 10.
+    scale : float
+        Residual in pixels at which the weight of a pair is halved.  If
+        None, it is estimated from the median residual of each iteration,
+        but not below 0.5 pixels.
+
+    Returns
+    ----------
+    shifts : NumPy array
+        The X- and Y-shifts to be applied to each image
+
+    """
+    pairs = np.asarray(pairs)
+    npairs = len(pairs)
+    design = sparse.csr_matrix((np.concatenate([-np.ones(npairs), np.ones(npairs)]),
+                                (np.tile(np.arange(npairs), 2), np.concatenate([pairs[:, 0], pairs[:, 1]]))),
+                               shape=(npairs, nimages))
+    # Fix the reference image by removing its column
+    design = design[:, np.delete(np.arange(nimages), start)]
+    pair_weights = np.ones(npairs)
+    shifts = np.zeros([nimages, 2])
+    for _ in range(iterations + 1):
+        weighted = sparse.diags(pair_weights) @ design
+        normal = (design.T @ weighted).tocsc()
+        shifts[np.arange(nimages) != start] = spsolve(normal, weighted.T @ pair_shifts).reshape([-1, 2])
+        residuals = np.linalg.norm(shifts[pairs[:, 1]] - shifts[pairs[:, 0]] - pair_shifts, axis=1)
+        cutoff = scale if scale is not None else max(0.5, 1.4826 * np.median(residuals))
+        pair_weights = 1 / (1 + (residuals / cutoff) ** 2)
+    return shifts
+
+
+def calculate_shifts_pc(stack, start, show_progressbar, upsample_factor, cuda, chunk_size=16, workers=None,
+                        ncores=None, executor=None, neighbors=1):
     """
 
     Calculate shifts using the phase correlation algorithm.
@@ -330,6 +562,22 @@ def calculate_shifts_pc(stack, start, show_progressbar, upsample_factor, cuda):
     ----------
     stack : TomoStack object
         The image series to be aligned
+    neighbors : int
+        Number of following projections each projection is registered to.
+        If greater than 1, the shifts are found by a global least-squares
+        fit of all pairwise shifts (see solve_global_shifts) on the CPU
+        instead of accumulating the shifts between neighbors. Default is 1.
+    chunk_size : int
+        Number of projections transformed at once on the CPU (see
+        calculate_pair_shifts_pc). Default is 16.
+    workers : int
+        Number of threads for each FFT on the CPU (see
+        calculate_pair_shifts_pc).
+    ncores : int
+        Number of threads registering chunks of projections concurrently on
+        the CPU. If None, 90% of the available cores are used.
+    executor : concurrent.futures.Executor
+        Executor to use on the CPU instead of a new thread pool
 
     Returns
     ----------
@@ -386,7 +634,7 @@ def calculate_shifts_pc(stack, start, show_progressbar, upsample_factor, cuda):
             shift += maxima / upsample_factor
         return shift
 
-    if has_cupy and astra.use_cuda() and cuda:
+    if has_cupy and recon.use_cuda() and cuda and neighbors == 1:
         stack_cp = cp.array(stack.data)
         shifts = cp.zeros([stack_cp.shape[0], 2])
         ref_cp = stack_cp[0]
@@ -403,30 +651,41 @@ def calculate_shifts_pc(stack, start, show_progressbar, upsample_factor, cuda):
                 pbar.update(1)
         shifts = shifts.get()
 
+    elif neighbors > 1:
+        pairs, pair_shifts = calculate_neighbor_shifts_pc(stack.data, neighbors, upsample_factor, chunk_size,
+                                                          workers, show_progressbar, ncores, executor)
+        shifts = solve_global_shifts(pairs, pair_shifts, stack.data.shape[0], start)
+
     else:
+        pair_shifts = calculate_pair_shifts_pc(stack.data, upsample_factor, chunk_size, workers, show_progressbar,
+                                               ncores, executor)
+        # Accumulate the shifts between neighbors relative to the start image
         shifts = np.zeros((stack.data.shape[0], 2))
-        with tqdm.tqdm(total=stack.data.shape[0] - 1, desc="Calculating shifts", disable=not show_progressbar) as pbar:
-            for i in range(start, 0, -1):
-                shift = pcc(stack.data[i], stack.data[i - 1], upsample_factor=upsample_factor)[0]
-                shifts[i - 1] = shifts[i] + shift
-                pbar.update(1)
-
-            for i in range(start, stack.data.shape[0] - 1):
-                shift = pcc(stack.data[i], stack.data[i + 1], upsample_factor=upsample_factor)[0]
-                shifts[i + 1] = shifts[i] + shift
-                pbar.update(1)
+        shifts[1:] = np.cumsum(pair_shifts, axis=0)
+        shifts -= shifts[start]
 
     return shifts
 
 
-def calculate_shifts_stackreg(stack, start, show_progressbar):
+def calculate_shifts_stackreg(stack, start, show_progressbar, ncores=None, executor=None, neighbors=1):
     """
     Calculate shifts using PyStackReg.
 
+    The neighboring pairs of images are registered concurrently in a pool
+    of threads and the shifts are accumulated afterwards.
+
     Args
     ----------
     stack : TomoStack object
         The image series to be aligned
+    neighbors : int
+        Number of following images each image is registered to.  If greater
+        than 1, the shifts are found by a global least-squares fit of all
+        pairwise shifts (see solve_global_shifts). Default is 1.
+    ncores : int
+        Number of threads.  If None, 90% of the available cores are used.
+    executor : concurrent.futures.Executor
+        Executor to use instead of a new thread pool
 
     Returns
     ----------
@@ -439,22 +698,279 @@ def calculate_shifts_stackreg(stack, start, show_progressbar):
     if start is None:
         start = stack.data.shape[0] // 2  # Use the midpoint if start is not provided
 
-    # Initialize pystackreg object with TranslationTransform2D
-    reg = StackReg(StackReg.TRANSLATION)
-
-    with tqdm.tqdm(total=stack.data.shape[0] - 1, desc="Calculating shifts", disable=not show_progressbar) as pbar:
-        # Calculate shifts relative to the image at the 'start' index
-        for i in range(start, 0, -1):
-            transformation = reg.register(stack.data[i], stack.data[i - 1])
-            shift = -transformation[0:2, 2][::-1]
-            shifts[i - 1] = shifts[i] + shift
-            pbar.update(1)
-
-        for i in range(start, stack.data.shape[0] - 1):
-            transformation = reg.register(stack.data[i], stack.data[i + 1])
-            shift = -transformation[0:2, 2][::-1]
-            shifts[i + 1] = shifts[i] + shift
-            pbar.update(1)
+    def register_pair(pair):
+        # Use a pystackreg object with TranslationTransform2D for each pair so that threads do not share it
+        reference, moving = pair
+        transformation = StackReg(StackReg.TRANSLATION).register(stack.data[reference], stack.data[moving])
+        return -transformation[0:2, 2][::-1]
+
+    if neighbors > 1:
+        pairs = [(i, i + offset) for i in range(stack.data.shape[0] - 1) for offset in range(1, neighbors + 1)
+                 if i + offset < stack.data.shape[0]]
+        pair_shifts = map_threads(register_pair, pairs, ncores, executor, show_progressbar)
+        return solve_global_shifts(pairs, np.array(pair_shifts), stack.data.shape[0], start)
+
+    # Register each image to its neighbor closer to the image at the 'start' index
+    pairs = [(i, i - 1) for i in range(start, 0, -1)] + [(i, i + 1) for i in range(start, stack.data.shape[0] - 1)]
+    pair_shifts = map_threads(register_pair, pairs, ncores, executor, show_progressbar)
+    for (reference, moving), shift in zip(pairs, pair_shifts):
+        shifts[moving] = shift
+    shifts[0:start] = np.cumsum(shifts[0:start][::-1], axis=0)[::-1]
+    shifts[start + 1:] = np.cumsum(shifts[start + 1:], axis=0)
+    return shifts
+
+
+def bin_images(data, factor):
+    """
+    Bin an image series by averaging blocks of pixels.
+
+    Args
+    ----------
+    data : NumPy array
+        Image series of shape [nimages, ny, nx]
+    factor : int
+        Binning factor.  Rows and columns beyond the last full block are
+        discarded.
+
+    Returns
+    ----------
+    binned : NumPy array
+        Binned image series of shape [nimages, ny // factor, nx // factor]
+
+    """
+    if factor == 1:
+        return data
+    nimages, ny, nx = data.shape
+    ny, nx = ny // factor, nx // factor
+    binned = np.asarray(data[:, 0:ny * factor, 0:nx * factor], np.float32)
+    return binned.reshape([nimages, ny, factor, nx, factor]).mean((2, 4))
+
+
+def calculate_neighbor_shifts_pyramid(data, neighbors=1, levels=(4,), window=256, upsample_factor=1,
+                                      method="PC", show_progressbar=False, ncores=None, executor=None):
+    """
+    Calculate the shifts between neighboring projections from coarse to fine.
+
+    Integer shifts are first found by phase correlation of the whole
+    projections binned by the first (coarsest) factor of levels.  At each
+    following level and finally at full resolution, the shift is refined by
+    registering windows of at most window pixels cropped from the overlap
+    of the two projections predicted by the previous level, so that the
+    whole projections are never correlated at full resolution.  The windows
+    are tapered by a Hann window before phase correlation.
+
+    Args
+    ----------
+    data : NumPy array
+        Image series of shape [nimages, ny, nx]
+    neighbors : int
+        Number of following images each image is registered to.
+        Default is 1.
+    levels : list
+        Binning factors of the pyramid from coarse to fine, excluding the
+        full resolution.  Default is (4,).
+    window : int
+        Largest size of the windows registered at the finer levels.
+        Default is 256.
+    upsample_factor : int
+        Shifts are refined at full resolution to within 1 / upsample_factor
+        of a pixel.  Only used for 'PC' method.  Default is 1.
+    method : string
+        Registration of the windows, either 'PC' or 'StackReg'.  The coarse
+        level always uses phase correlation.
+    show_progressbar : boolean
+        Enable/disable progress bar
+    ncores : int
+        Number of threads.  If None, 90% of the available cores are used.
+    executor : concurrent.futures.Executor
+        Executor to use instead of a new thread pool
+
+    Returns
+    ----------
+    pairs : NumPy array
+        Indices [i, j] of the registered images of shape [npairs, 2], with
+        i < j <= i + neighbors
+    pair_shifts : NumPy array
+        Shift of shape [npairs, 2] which registers image j to image i
+
+    """
+    method = method.lower()
+    if method not in ["pc", "stackreg", "sr"]:
+        raise ValueError("Unknown pyramid registration method: %s. Must be PC or StackReg" % method)
+    levels = sorted(levels, reverse=True)
+    pairs, coarse_shifts = calculate_neighbor_shifts_pc(bin_images(data, levels[0]), neighbors,
+                                                        ncores=ncores, executor=executor)
+    pair_shifts = coarse_shifts * levels[0]
+
+    for factor in levels[1:] + [1]:
+        binned = bin_images(data, factor)
+        shape = np.array(binned.shape[1:])
+        final = factor == 1
+
+        def refine_pair(index):
+            reference, moving = pairs[index]
+            predicted = np.round(pair_shifts[index] / factor).astype(int)
+            # Crop the reference window from the region which also lies within the shifted moving image
+            low = np.maximum(predicted, 0)
+            high = np.minimum(shape + predicted, shape)
+            size = np.minimum(high - low, window)
+            low = low + (high - low - size) // 2
+            ref_window = binned[reference, low[0]:low[0] + size[0], low[1]:low[1] + size[1]]
+            low = low - predicted
+            mov_window = binned[moving, low[0]:low[0] + size[0], low[1]:low[1] + size[1]]
+            if final and method != "pc":
+                transformation = StackReg(StackReg.TRANSLATION).register(ref_window, mov_window)
+                residual = -transformation[0:2, 2][::-1]
+            else:
+                # Taper the edges of the windows so that they do not correlate at the predicted shift
+                taper = np.outer(np.hanning(size[0]), np.hanning(size[1]))
+                residual = pcc(ref_window * taper, mov_window * taper,
+                               upsample_factor=upsample_factor if final else 1)[0]
+            return (predicted + residual) * factor
+
+        pair_shifts = np.array(map_threads(refine_pair, range(len(pairs)), ncores, executor,
+                                           show_progressbar and final)).reshape([-1, 2])
+    return pairs, pair_shifts
+
+
+def calculate_shifts_pyramid(stack, start, method="PC", levels=(4,), window=256, upsample_factor=1, neighbors=1,
+                             show_progressbar=False, ncores=None, executor=None):
+    """
+    Calculate shifts by registration of an image pyramid.
+
+    See calculate_neighbor_shifts_pyramid.  The shifts between neighbors are
+    accumulated, or combined by a global least-squares fit if neighbors is
+    greater than 1 (see solve_global_shifts).
+
+    Args
+    ----------
+    stack : TomoStack object
+        The image series to be aligned
+    start : integer
+        Position in tilt series to use as starting point for the alignment.
+    method : string
+        Registration at the finer levels, either 'PC' or 'StackReg'.
+    levels : list
+        Binning factors of the pyramid from coarse to fine, excluding the
+        full resolution.  Default is (4,).
+    window : int
+        Largest size of the windows registered at the finer levels.
+        Default is 256.
+    upsample_factor : int
+        Shifts are refined at full resolution to within 1 / upsample_factor
+        of a pixel.  Only used for 'PC' method.  Default is 1.
+    neighbors : int
+        Number of following images each image is registered to.
+        Default is 1.
+    show_progressbar : boolean
+        Enable/disable progress bar
+    ncores : int
+        Number of threads.  If None, 90% of the available cores are used.
+    executor : concurrent.futures.Executor
+        Executor to use instead of a new thread pool
+
+    Returns
+    ----------
+    shifts : NumPy array
+        The X- and Y-shifts to be applied to each image
+
+    """
+    nimages = stack.data.shape[0]
+    pairs, pair_shifts = calculate_neighbor_shifts_pyramid(stack.data, neighbors, levels, window, upsample_factor,
+                                                           method, show_progressbar, ncores, executor)
+    if neighbors > 1:
+        return solve_global_shifts(pairs, pair_shifts, nimages, start)
+    shifts = np.zeros((nimages, 2))
+    shifts[1:] = np.cumsum(pair_shifts, axis=0)
+    return shifts - shifts[start]
+
+
+def calculate_shifts_pm(stack, iterations=5, tol=0.1, recon_method="SIRT", recon_iterations=10, thickness=None,
+                        upsample_factor=10, sigma=2.0, cuda=False, show_progressbar=False):
+    """
+    Calculate shifts by projection matching.
+
+    Each iteration reconstructs the currently aligned stack, reprojects the
+    reconstruction at the tilt angles, and registers every projection to
+    its reprojection by cross-correlation of the low-pass filtered images.
+    Phase correlation is not used, as the reconstruction reproduces the
+    fine details of the misaligned projections.  The Fourier transforms of
+    the projections are computed once and shifted in Fourier space, and the
+    reconstruction and reprojection share the cached system matrix (or the
+    ASTRA 3D projector if CUDA is used).
+
+    Args
+    ----------
+    stack : TomoStack object
+        The image series to be aligned
+    iterations : int
+        Maximum number of projection matching iterations. Default is 5.
+    tol : float
+        Stop once the largest shift update is below this value in pixels.
+        Default is 0.1.
+    recon_method : str
+        Reconstruction method for each iteration, 'SIRT' (default), 'SART',
+        'CGLS', or 'FBP'
+    recon_iterations : int
+        Number of iterations of each reconstruction. Default is 10.
+    thickness : int
+        Height of the reconstruction. If None, the width of the
+        projections is used.
+    upsample_factor : int
+        Upsampling factor of the subpixel cross-correlation. Default is 10.
+    sigma : float
+        Standard deviation in pixels of the Gaussian low-pass filter applied
+        before the cross-correlation. Default is 2.0.
+    cuda : boolean
+        If True, reconstruct and reproject using the CUDA-accelerated
+        'astra3d' engine
+    show_progressbar : boolean
+        Enable/disable progress bar
+
+    Returns
+    ----------
+    shifts : NumPy array
+        The X- and Y-shifts to be applied to each image
+
+    """
+    nangles, ny, nx = stack.data.shape
+    thetas = np.pi * np.asarray(stack.metadata.Tomography.tilts, float) / 180.0
+    if thickness is None:
+        thickness = ny
+    engine = "astra3d" if cuda else "matrix"
+    if recon_method.lower() == "fbp" and not cuda:
+        engine = "numpy"
+
+    data_fft = np.fft.fft2(np.asarray(stack.data, np.float32))
+    freq_y = np.fft.fftfreq(ny)[:, np.newaxis]
+    freq_x = np.fft.fftfreq(nx)[np.newaxis, :]
+    low_pass = np.exp(-2 * (np.pi * sigma) ** 2 * (freq_y ** 2 + freq_x ** 2))
+    modes = np.stack([np.cos(thetas), np.sin(thetas)], axis=1)
+    shifts = np.zeros([nangles, 2])
+    for iteration in tqdm.tqdm(range(iterations), desc="Projection matching", disable=not show_progressbar):
+        # Shift the projections by multiplying their Fourier transforms with phase ramps
+        ramp_y = np.exp(-2j * np.pi * shifts[:, 0, np.newaxis, np.newaxis] * freq_y)
+        ramp_x = np.exp(-2j * np.pi * shifts[:, 1, np.newaxis, np.newaxis] * freq_x)
+        aligned_fft = data_fft * ramp_y * ramp_x
+        aligned = np.fft.ifft2(aligned_fft).real.astype(np.float32)
+        rec = recon.run_sinograms(aligned, thetas, recon_method, recon_iterations, constrain=True, thresh=0,
+                                  cuda=cuda, thickness=thickness, engine=engine, show_progressbar=False)
+        reprojection_fft = np.fft.fft2(recon.forward_project(rec, thetas, cuda)) * low_pass
+
+        updates = np.zeros([nangles, 2])
+        for i in range(nangles):
+            updates[i] = pcc(reprojection_fft[i], aligned_fft[i] * low_pass, upsample_factor=upsample_factor,
+                             space="fourier", normalization=None)[0]
+        # Translations of the object are not constrained by the reprojections.  They shift the
+        # projections by a common amount along the tilt axis and by y*cos(theta) + z*sin(theta)
+        # perpendicular to it, so these components are removed to keep the object in place.
+        updates[:, 0] -= modes @ np.linalg.lstsq(modes, updates[:, 0], rcond=None)[0]
+        updates[:, 1] -= updates[:, 1].mean()
+        shifts += updates
+        max_update = np.abs(updates).max()
+        logger.info("Projection matching iteration %s: maximum shift update %.2f pixels" % (iteration + 1, max_update))
+        if max_update < tol:
+            break
     return shifts
 
 
@@ -548,6 +1064,9 @@ def align_stack(stack, method, start, show_progressbar, **kwargs):
             M. C. Scott, et al. Electron tomography at 2.4-ångström resolution,
             Nature 483, 444–447 (2012).
             https://doi.org/10.1038/nature10934
+        5.) Projection matching (PM), which iteratively reconstructs the
+            stack and registers each projection to the reprojection of the
+            reconstruction (see calculate_shifts_pm).
 
     Shifts are then applied and the aligned stack is returned.  The tilts are
     stored in stack.metadata.Tomography.shifts for later use.
@@ -558,7 +1077,7 @@ def align_stack(stack, method, start, show_progressbar, **kwargs):
         3-D numpy array containing the tilt series data
     method : string
         Method by which to calculate the alignments. Valid options
-        are 'StackReg', 'PC', 'COM', or 'COM-CL'.
+        are 'StackReg', 'PC', 'COM', 'COM-CL', or 'PM'.
     start : integer
         Position in tilt series to use as starting point for the alignment.
         If None, the central projection is used.
@@ -582,6 +1101,12 @@ def align_stack(stack, method, start, show_progressbar, **kwargs):
         shifts = np.zeros([stack.data.shape[0], 2])
         shifts[:, 1] = calculate_shifts_conservation_of_mass(stack, xrange, p)
         shifts[:, 0] = calculate_shifts_com(stack, nslices)
+    elif method.lower() in ["pc", "stackreg", "sr"] and kwargs.get('pyramid', None):
+        logger.info("Performing stack registration using a pyramid with binning %s" % kwargs['pyramid'])
+        shifts = calculate_shifts_pyramid(stack, start, method, list(kwargs['pyramid']),
+                                          kwargs.get('pyramid_window', 256),
+                                          kwargs.get('upsample_factor', 3), kwargs.get('neighbors', 1),
+                                          show_progressbar, kwargs.get('ncores', None), kwargs.get('executor', None))
     elif method.lower() == 'pc':
         cuda = kwargs.get('cuda', False)
         upsample_factor = kwargs.get('upsample_factor', 3)
@@ -589,10 +1114,14 @@ def align_stack(stack, method, start, show_progressbar, **kwargs):
             logger.info("Performing stack registration using CUDA-accelerated phase correlation")
         else:
             logger.info("Performing stack registration using phase correlation")
-        shifts = calculate_shifts_pc(stack, start, show_progressbar, upsample_factor, cuda)
+        shifts = calculate_shifts_pc(stack, start, show_progressbar, upsample_factor, cuda,
+                                     kwargs.get('chunk_size', 16), kwargs.get('workers', None),
+                                     kwargs.get('ncores', None), kwargs.get('executor', None),
+                                     kwargs.get('neighbors', 1))
     elif method.lower() in ["stackreg", 'sr']:
         logger.info("Performing stack registration using PyStackReg")
-        shifts = calculate_shifts_stackreg(stack, start, show_progressbar)
+        shifts = calculate_shifts_stackreg(stack, start, show_progressbar, kwargs.get('ncores', None),
+                                           kwargs.get('executor', None), kwargs.get('neighbors', 1))
     elif method.lower() == "com-cl":
         logger.info("Performing stack registration using combined center of mass and common line methods")
         com_ref_index = kwargs.get('com_ref_index', stack.data.shape[1] // 2)
@@ -600,6 +1129,12 @@ def align_stack(stack, method, start, show_progressbar, **kwargs):
         cl_resolution = kwargs.get('cl_resolution', 0.05)
         cl_div_factor = kwargs.get('cl_div_factor', 8)
         shifts = calc_shifts_com_cl(stack, com_ref_index, cl_ref_index, cl_resolution, cl_div_factor)
+    elif method.lower() == "pm":
+        logger.info("Performing stack registration using projection matching")
+        shifts = calculate_shifts_pm(stack, kwargs.get('iterations', 5), kwargs.get('tol', 0.1),
+                                     kwargs.get('recon_method', 'SIRT'), kwargs.get('recon_iterations', 10),
+                                     kwargs.get('thickness', None), kwargs.get('upsample_factor', 10),
+                                     kwargs.get('sigma', 2.0), kwargs.get('cuda', False), show_progressbar)
     else:
         raise ValueError('Invalid alignment method %s' % method)
     aligned = apply_shifts(stack, shifts)
@@ -5,7 +5,7 @@
 
 import logging
 from etspy.io import load, create_stack
-from etspy.base import TomoStack
+from etspy.base import TomoStack, StreamingReconstructor
 from etspy import io
 from etspy import utils
 from etspy import align
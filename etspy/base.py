@@ -16,11 +16,12 @@ import os
 from skimage import transform
 import pylab as plt
 import matplotlib.animation as animation
-from hyperspy.signals import Signal2D, Signal1D
+from hyperspy.signals import Signal2D, Signal1D, LazySignal
+import dask.array as da
+import h5py
 from scipy import ndimage
 import matplotlib as mpl
 import logging
-import astra
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -516,14 +517,15 @@ class TomoStack(CommonStack):
         Register stack spatially.
 
         Options are phase correlation (PC) maximization, StackReg, center of
-        mass ('COM'), or combined center of mass and common line methods.
+        mass ('COM'), combined center of mass and common line methods, or
+        projection matching ('PM').
         See docstring for etspy.align.align_stack for details.
 
         Args
         ----------
         method : string
             Algorithm to use for registration calculation. Must be either
-            'PC', 'StackReg', 'COM', or 'COM-CL'.
+            'PC', 'StackReg', 'COM', 'COM-CL', or 'PM'.
         start : integer
             Position in tilt series to use as starting point for the
             alignment. If None, the central projection is used.
@@ -551,6 +553,49 @@ class TomoStack(CommonStack):
         cl_div_factor : integer
             Factor which determines the number of iterations of common line
             alignment to perform.  Default is 8.
+        iterations : integer
+            Maximum number of projection matching iterations.  Default is 5.
+            Only used for 'PM' method.
+        tol : float
+            Projection matching stops once the largest shift update is below
+            this value in pixels.  Default is 0.1.  Only used for 'PM' method.
+        recon_method : string
+            Reconstruction method of each projection matching iteration.
+            Default is 'SIRT'.  Only used for 'PM' method.
+        recon_iterations : integer
+            Number of iterations of each reconstruction.  Default is 10.
+            Only used for 'PM' method.
+        cuda : boolean
+            If True, use CUDA for the 'PC' and 'PM' methods.
+        chunk_size : integer
+            Number of projections Fourier transformed at once by the CPU
+            'PC' method.  Default is 16.
+        workers : integer
+            Number of threads for each FFT of the CPU 'PC' method.  If None,
+            all cores are used when ncores is 1, and one otherwise.
+        ncores : integer
+            Number of threads registering neighboring projections
+            concurrently with the CPU 'PC' and 'StackReg' methods.  If None,
+            90% of the available cores are used.
+        executor : concurrent.futures.Executor
+            Executor for the CPU 'PC' and 'StackReg' methods to use instead
+            of creating a new thread pool.
+        neighbors : integer
+            Number of following projections each projection is registered
+            to by the 'PC' and 'StackReg' methods.  If greater than 1, the
+            shifts are found by a robust global least-squares fit of all
+            pairwise shifts instead of accumulating the shifts between
+            neighbors, so that one failed pair does not displace all the
+            following projections.  Default is 1.
+        pyramid : list
+            Binning factors from coarse to fine, e.g. [8, 2].  If provided,
+            the 'PC' and 'StackReg' methods first find integer shifts of
+            the binned projections and then refine them on windows cropped
+            from the predicted overlap at each finer level and at full
+            resolution (see align.calculate_neighbor_shifts_pyramid).
+        pyramid_window : integer
+            Largest size of the windows registered at the finer levels of
+            the pyramid.  Default is 256.
 
         Returns
         ----------
@@ -564,6 +609,16 @@ class TomoStack(CommonStack):
         >>> stack = ds.get_needle_data()
         >>> regPC = stack.stack_register('PC')
 
+        Global registration of each projection to its three nearest tilts
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data()
+        >>> regGlobal = stack.stack_register('PC', neighbors=3)
+
+        Registration of large projections binned by 8 and then 2
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data()
+        >>> regPyramid = stack.stack_register('PC', pyramid=[8, 2])
+
         Registration with center of mass tracking (COM)
         >>> import etspy.datasets as ds
         >>> stack = ds.get_needle_data()
@@ -574,19 +629,30 @@ class TomoStack(CommonStack):
         >>> stack = ds.get_needle_data()
         >>> regSR = stack.stack_register('StackReg')
 
+        Registration with StackReg using four threads
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data()
+        >>> regSR = stack.stack_register('StackReg', ncores=4)
+
         Registration with center of mass and common line (COM-CL)
         >>> import etspy.datasets as ds
         >>> stack = ds.get_needle_data()
         >>> regCOMCL = stack.stack_register('COM-CL')
 
+        Refinement of a PC registration with projection matching (PM)
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data()
+        >>> regPC = stack.stack_register('PC')
+        >>> regPM = regPC.stack_register('PM', iterations=3)
+
         """
         method = method.lower()
-        if method in ["pc", "com", "stackreg", "com-cl"]:
+        if method in ["pc", "com", "stackreg", "com-cl", "pm"]:
             out = align.align_stack(self, method, start, show_progressbar, **kwargs)
         else:
             raise ValueError(
                 "Unknown registration method: "
-                "%s. Must be PC, StackReg, or COM" % method
+                "%s. Must be PC, StackReg, COM, COM-CL, or PM" % method
             )
 
         if crop:
@@ -687,7 +753,9 @@ class TomoStack(CommonStack):
         Args
         ----------
         method : string
-            Reconstruction algorithm to use.  Must be'FBP' (default), 'SIRT', 'SART', or 'DART'
+            Reconstruction algorithm to use.  Must be'FBP' (default), 'SIRT', 'SART', 'DART',
+            'CGLS', 'LSQR', or 'TV'.  CGLS, LSQR and TV (total variation regularized) are computed
+            on slabs of slices with the 'matrix' engine, or with the 'astra3d' engine if CUDA is used.
         iterations : integer
             Number of iterations for the SIRT reconstruction (for astraSIRT
             and astraSIRT_GPU, methods only)
@@ -706,6 +774,50 @@ class TomoStack(CommonStack):
         - ncores (int): Number of cores to use for multithreaded reconstructions.
         - sino_filter (str): Filter to apply for filtered backprojection.  Default is shepp-logan.
         - dart_iterations (int): Number of iterations to employ for DART reconstruction.
+        - seed (int): Seed for the random free pixel selection of DART reconstruction.
+        - engine (str): Reconstruction engine. 'astra' (default), 'astra3d' for batched
+          reconstruction of slabs of slices using the ASTRA 3D geometry (requires CUDA),
+          'numpy' for FBP without ASTRA, or 'matrix' for SIRT/SART using a sparse system
+          matrix computed once for all slices.
+        - slab_size (int): Number of slices per slab for the 'astra3d', 'numpy' and 'matrix'
+          engines. Default is 128.
+        - out (str or array-like): Output target for out-of-core reconstruction. Either a
+          filename ('.hdf5'/'.h5', '.zarr', '.npy', or any other extension for a raw memmap)
+          or an array-like of shape [nx, thickness, ny]. Slices are written to the target as
+          they are reconstructed and a LazyRecStack backed by it is returned.
+        - chunk_size (int): Number of slices held in memory at one time and the chunk size of
+          the returned LazyRecStack. Default is 64.
+        - tol (float): For SIRT, SART, CGLS and LSQR, stop iterating each slice once the relative change of
+          the residual norm falls below this value, and for TV once the relative primal-dual gap does.
+          The number of iterations performed for each slice is stored in
+          metadata.Reconstruction.iterations.
+        - max_iterations (int): Maximum number of iterations when tol is given. Default is 'iterations'.
+        - check_every (int): Number of iterations between residual checks. Default is 10.
+        - slices (slice): Slices along the tilt axis to reconstruct, e.g. slice(100, 164).
+        - roi_y (tuple): Range (y0, y1) of pixels perpendicular to the tilt axis to reconstruct.
+        - roi_z (tuple): Range (z0, z1) of pixels along the beam direction to reconstruct, where
+          the full height is given by 'thickness'. Only the selected sub-volume is allocated and
+          reconstructed, and the axes offsets of the output are set accordingly.
+        - multigrid (list): Binning factors for a coarse-to-fine iterative reconstruction,
+          e.g. [4, 2]. The binned sinograms are reconstructed first and each result is
+          upsampled as the starting volume of the next level. 'iterations' is then the number
+          of iterations at full resolution.
+        - multigrid_iterations (int or list): Number of iterations for each coarse level.
+          Default is 'iterations'.
+        - initial (RecStack, array, or str): Starting volume for an iterative method. Either a
+          previous reconstruction of the same shape, e.g. to continue it with more iterations,
+          or 'fbp' to start from an FBP reconstruction. Default is None, which starts from zero.
+        - nsubsets (int): Number of subsets of projections for ordered-subsets SART with all
+          engines. Each iteration is then one pass over all subsets. Default is None, which
+          uses one projection per subset.
+        - ordering (str): Order in which the SART subsets are visited: 'sequential', 'random',
+          or 'golden' (default) for golden-ratio interleaving.
+        - tv_weight (float): Weight of the total variation term for TV reconstruction. It scales
+          with the intensity of the projection data. Default is 1.0.
+        - aligned_geometry (bool): If True, the alignment stored in metadata.Tomography (shifts,
+          xshift, yshift and tiltaxis) is applied in the projection geometry rather than to the
+          data, so unaligned projections are reconstructed directly without resampling. Uses the
+          'astra3d' engine and requires CUDA. Default is False.
 
         Returns
         ----------
@@ -736,6 +848,20 @@ class TomoStack(CommonStack):
         >>> thresh = 0
         >>> rec = slices.reconstruct('SIRT',iterations, constrain, thresh, cuda=False)
 
+        Continue a SIRT reconstruction with 30 more iterations
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data(True)
+        >>> slices = stack.isig[:, 120:121].deepcopy()
+        >>> rec = slices.reconstruct('SIRT', iterations=20, cuda=False)
+        >>> rec = slices.reconstruct('SIRT', iterations=30, cuda=False, initial=rec)
+
+        Reconstruct the unaligned data using the alignment of a registered copy
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data()
+        >>> reg = stack.stack_register('PC')
+        >>> stack.metadata.Tomography.shifts = reg.metadata.Tomography.shifts
+        >>> rec = stack.reconstruct('SIRT', iterations=5, cuda=True, aligned_geometry=True)  # doctest: +SKIP
+
         Discreate algebraice reconstruction technique (DART) reconstruction
         >>> import etspy.datasets as ds
         >>> stack = ds.get_needle_data(True)
@@ -749,10 +875,13 @@ class TomoStack(CommonStack):
             "sirt",
             "sart",
             "dart",
+            "cgls",
+            "lsqr",
+            "tv",
         ]:
             raise ValueError("Unknown reconstruction algorithm: %s" % method)
         if cuda is None:
-            if astra.use_cuda():
+            if recon.use_cuda():
                 logger.info("CUDA detected with Astra")
                 cuda = True
             else:
@@ -761,9 +890,49 @@ class TomoStack(CommonStack):
 
         ncores = kwargs.get('ncores', None)
         sino_filter = kwargs.get('sino_filter', 'shepp-logan')
+        engine = kwargs.get('engine', 'astra')
+        slab_size = kwargs.get('slab_size', 128)
+        out = kwargs.get('out', None)
+        chunk_size = kwargs.get('chunk_size', 64)
+        tol = kwargs.get('tol', None)
+        max_iterations = kwargs.get('max_iterations', None)
+        check_every = kwargs.get('check_every', 10)
+        slices = kwargs.get('slices', None)
+        roi_y = kwargs.get('roi_y', None)
+        roi_z = kwargs.get('roi_z', None)
+        multigrid = kwargs.get('multigrid', None)
+        multigrid_iterations = kwargs.get('multigrid_iterations', None)
+        initial = kwargs.get('initial', None)
+        nsubsets = kwargs.get('nsubsets', None)
+        ordering = kwargs.get('ordering', 'golden')
+        tv_weight = kwargs.get('tv_weight', 1.0)
+        aligned_geometry = kwargs.get('aligned_geometry', False)
+
+        ny = self.data.shape[1]
+        if len(self.data.shape) == 3:
+            nx = self.data.shape[2]
+        else:
+            nx = 1
+        slice_index = np.arange(nx)
+        if slices is not None:
+            slice_index = slice_index[slices]
+        z0, z1, y0, y1 = recon.get_roi(ny if thickness is None else thickness, ny, roi_y, roi_z)
+        if isinstance(initial, str):
+            if initial.lower() != 'fbp':
+                raise ValueError("Unknown initial volume: %s" % initial)
+            logger.info("Computing FBP reconstruction for the initial volume")
+            initial = recon.run(self, 'FBP', cuda=cuda, thickness=thickness, ncores=ncores, filter=sino_filter,
+                                show_progressbar=show_progressbar, slices=slices, roi_y=roi_y, roi_z=roi_z,
+                                aligned_geometry=aligned_geometry)
+        elif isinstance(initial, RecStack):
+            initial = np.asarray(initial.data, np.float32)
+        out_opened = isinstance(out, str)
+        if out_opened:
+            out = recon.create_output_volume(out, [len(slice_index), z1 - z0, y1 - y0], chunk_size=chunk_size)
         if method.lower() == 'dart':
             dart_iterations = kwargs.get('dart_iterations', 5)
             p = kwargs.get('p', 0.99)
+            seed = kwargs.get('seed', None)
             gray_levels = kwargs.get('gray_levels', None)
             if not isinstance(gray_levels, (np.ndarray, list)):
                 raise ValueError("Unknown type (%s) for gray_levels" % type(gray_levels))
@@ -773,6 +942,11 @@ class TomoStack(CommonStack):
             dart_iterations = None
             p = None
             gray_levels = None
+            seed = None
+        if tol is not None and method.lower() in ["sirt", "sart", "cgls", "lsqr", "tv"]:
+            rec_iterations = np.zeros(len(slice_index), int)
+        else:
+            rec_iterations = None
         rec = recon.run(
             self,
             method,
@@ -786,16 +960,157 @@ class TomoStack(CommonStack):
             gray_levels,
             dart_iterations,
             p,
-            show_progressbar
+            show_progressbar,
+            engine=engine,
+            slab_size=slab_size,
+            out=out,
+            chunk_size=chunk_size,
+            tol=tol,
+            max_iterations=max_iterations,
+            check_every=check_every,
+            seed=seed,
+            slices=slices,
+            roi_y=roi_y,
+            roi_z=roi_z,
+            multigrid=multigrid,
+            multigrid_iterations=multigrid_iterations,
+            initial=initial,
+            nsubsets=nsubsets,
+            ordering=ordering,
+            tv_weight=tv_weight,
+            aligned_geometry=aligned_geometry,
+            iterations_out=rec_iterations,
         )
 
         axes_dict = self.axes_manager.as_dictionary()
-        rec_axes_dict = [axes_dict['axis-2'], dict(axes_dict['axis-1']), axes_dict['axis-1']]
+        rec_axes_dict = [dict(axes_dict['axis-2']), dict(axes_dict['axis-1']), dict(axes_dict['axis-1'])]
         rec_axes_dict[1]['name'] = 'z'
-        rec_axes_dict[1]['size'] = rec.shape[1]
-        rec = RecStack(rec, axes=rec_axes_dict)
+        if len(slice_index) > 1:
+            rec_axes_dict[0]['scale'] *= slice_index[1] - slice_index[0]
+        rec_axes_dict[0]['offset'] += slice_index[0] * axes_dict['axis-2']['scale']
+        rec_axes_dict[1]['offset'] += z0 * rec_axes_dict[1]['scale']
+        rec_axes_dict[2]['offset'] += y0 * rec_axes_dict[2]['scale']
+        for i in range(3):
+            rec_axes_dict[i]['size'] = rec.shape[i]
+        if out is None or type(out) is np.ndarray:
+            rec = RecStack(rec, axes=rec_axes_dict)
+        else:
+            if isinstance(rec, np.memmap):
+                rec.flush()
+            elif out_opened and isinstance(rec, h5py.Dataset):
+                # Release the writable file opened above and back the result by
+                # a read-only handle, which LazyRecStack.close_file() closes.  A
+                # dataset supplied by the caller is left open as it is.
+                filename, name = rec.file.filename, rec.name
+                rec.file.close()
+                rec = h5py.File(filename, "r")[name]
+            rec = LazyRecStack(da.from_array(rec, chunks=(chunk_size,) + tuple(rec.shape[1:])), axes=rec_axes_dict)
+        if rec_iterations is not None:
+            rec.metadata.set_item("Reconstruction.iterations", rec_iterations)
         return rec
 
+    def reconstruct_channels(
+        self,
+        others=None,
+        method="FBP",
+        iterations=None,
+        constrain=False,
+        thresh=0,
+        cuda=None,
+        thickness=None,
+        show_progressbar=True,
+        **kwargs
+    ):
+        """
+        Reconstruct several signals acquired over the same tilt series in one pass.
+
+        The channels are reconstructed together as a single series of slices,
+        so the projector, system matrix, and filter are only set up once for
+        all of them.  The channels are first copied into one combined stack,
+        so this needs memory for a second copy of the input data of every
+        channel in addition to the reconstructed volumes.
+
+        Args
+        ----------
+        others : list of TomoStacks
+            Tilt series of the additional channels. They must have the same
+            shape and tilts as this TomoStack. If None, this TomoStack must have
+            a second navigation axis of channels, i.e. data of shape
+            [nchannels, nangles, ny, nx].
+        method, iterations, constrain, thresh, cuda, thickness, show_progressbar :
+            See reconstruct.
+        **kwargs: Additional keyword arguments as for reconstruct.  'slices'
+            selects the same slices of every channel. 'out', 'initial', and
+            'aligned_geometry' are not supported.
+
+        Returns
+        ----------
+        recs : list of RecStacks
+            Reconstructed volume of each channel
+
+        Examples
+        ----------
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data(True)
+        >>> slices = stack.isig[:, 120:121].deepcopy()
+        >>> inverted = slices.deepcopy()
+        >>> inverted.data = inverted.data.max() - inverted.data
+        >>> recs = slices.reconstruct_channels([inverted], 'SIRT', iterations=5, cuda=False)
+
+        """
+        for key in ["out", "initial"]:
+            if kwargs.get(key, None) is not None:
+                raise ValueError("'%s' is not supported for multi-channel reconstruction" % key)
+        if kwargs.get("aligned_geometry", False):
+            raise ValueError("'aligned_geometry' is not supported for multi-channel reconstruction")
+        tilts = self.metadata.Tomography.tilts
+        if len(self.data.shape) == 4:
+            if others is not None:
+                raise ValueError("Additional channels cannot be given for a stack with a channel axis")
+            channels = [self.data[i] for i in range(self.data.shape[0])]
+        else:
+            if others is None or len(others) == 0:
+                raise ValueError("At least one additional channel must be provided")
+            channels = [np.atleast_3d(self.data)]
+            for other in others:
+                if not np.allclose(other.metadata.Tomography.tilts, tilts):
+                    raise ValueError("Tilts of all channels must be the same")
+                channels.append(np.atleast_3d(other.data))
+        if any(i.shape != channels[0].shape for i in channels):
+            raise ValueError("Shapes of all channels must be the same")
+
+        slices = kwargs.pop("slices", None)
+        slice_index = np.arange(channels[0].shape[2])
+        if slices is not None:
+            slice_index = slice_index[slices]
+            channels = [i[:, :, slices] for i in channels]
+        nx = len(slice_index)
+
+        axes = [self.axes_manager[0].get_axis_dictionary(),
+                self.axes_manager.signal_axes[1].get_axis_dictionary(),
+                self.axes_manager.signal_axes[0].get_axis_dictionary()]
+        if nx > 1:
+            axes[2]["scale"] *= slice_index[1] - slice_index[0]
+        axes[2]["offset"] += slice_index[0] * self.axes_manager.signal_axes[0].scale
+        axes[2]["size"] = nx * len(channels)
+        combined = TomoStack(np.concatenate(channels, axis=2), axes=axes)
+        combined.metadata.add_node("Tomography")
+        combined.metadata.Tomography.add_dictionary(self.metadata.Tomography.as_dictionary())
+        logger.info("Reconstructing %s channels of %s slices" % (len(channels), nx))
+
+        rec = combined.reconstruct(method, iterations, constrain, thresh, cuda, thickness, show_progressbar,
+                                   **kwargs)
+        rec_axes = [dict(x) for _, x in sorted(rec.axes_manager.as_dictionary().items())]
+        rec_axes[0]["size"] = nx
+        recs = []
+        for i in range(len(channels)):
+            channel_rec = RecStack(rec.data[i * nx:(i + 1) * nx], axes=rec_axes)
+            if rec.metadata.has_item("Reconstruction.iterations"):
+                channel_rec.metadata.set_item("Reconstruction.iterations",
+                                              rec.metadata.Reconstruction.iterations[i * nx:(i + 1) * nx])
+            recs.append(channel_rec)
+        return recs
+
     def test_align(self,
                    tilt_shift=0.0,
                    tilt_rotation=0.0,
@@ -828,7 +1143,7 @@ class TomoStack(CommonStack):
             Reconstruction algorithm to use.  Must be 'FBP', 'SIRT', or 'SART'.
         cuda : bool
             If True, use CUDA-accelerated Astra algorithms.  If None, use
-            CUDA if astra.use_cuda() is True.
+            CUDA if recon.use_cuda() is True.
         thresh : float
             Minimum value for reconstruction
         vmin_std, vmax_std : float
@@ -846,7 +1161,7 @@ class TomoStack(CommonStack):
 
         shifted.axes_manager[0].axis = self.axes_manager[0].axis
         if cuda is None:
-            if astra.use_cuda():
+            if recon.use_cuda():
                 logger.info("CUDA detected with Astra")
                 cuda = True
             else:
@@ -1001,7 +1316,8 @@ class TomoStack(CommonStack):
 
         return output
 
-    def recon_error(self, nslice=None, algorithm='SIRT', iterations=50, constrain=True, cuda=None, thresh=0):
+    def recon_error(self, nslice=None, algorithm='SIRT', iterations=50, constrain=True, cuda=None, thresh=0,
+                    snapshots=None):
         """
         Determine the optimum number of iterations for reconstruction.
 
@@ -1013,8 +1329,10 @@ class TomoStack(CommonStack):
         ----------
         algorithm : str
             Reconstruction algorithm use.  Must be 'SIRT' (default) or 'SART'.
-        nslice : int
-            Location at which to perform the evaluation.
+        nslice : int or list
+            Location at which to perform the evaluation.  If a list of
+            locations is given, each slice is evaluated and the outputs gain
+            a navigation axis for the slices.
         constrain : boolean
             If True, perform SIRT reconstruction with a non-negativity
             constraint.  Default is True
@@ -1023,6 +1341,10 @@ class TomoStack(CommonStack):
             Default is True
         thresh : integer or float
             Value above which to constrain the reconstructed data
+        snapshots : list or NumPy array
+            Iterations (starting at 0) at which the reconstruction is kept.
+            If None (default), every iteration is kept.  An empty list keeps
+            only the error, in which case rec_stack is None.
 
         Returns
         ----------
@@ -1043,17 +1365,21 @@ class TomoStack(CommonStack):
         if self.metadata.Tomography.tilts is None:
             raise ValueError("Tilt angles not defined")
 
-        if not nslice:
+        if nslice is None:
             nslice = int(self.data.shape[2] / 2)
 
         if cuda is None:
-            if astra.use_cuda():
+            if recon.use_cuda():
                 logger.info("CUDA detected with Astra")
                 cuda = True
             else:
                 cuda = False
                 logger.info("CUDA not detected with Astra")
-        sinogram = self.isig[nslice, :].data
+        multiple = isinstance(nslice, (list, tuple, np.ndarray))
+        if multiple:
+            sinogram = self.data[:, :, np.asarray(nslice)]
+        else:
+            sinogram = self.isig[nslice, :].data
         angles = self.metadata.Tomography.tilts
         rec_stack, error = recon.astra_error(
             sinogram,
@@ -1063,20 +1389,36 @@ class TomoStack(CommonStack):
             constrain=constrain,
             thresh=thresh,
             cuda=cuda,
+            snapshots=snapshots,
         )
-        rec_stack = Signal2D(rec_stack)
-        rec_stack.axes_manager[0].name = algorithm.upper() + " iteration"
-        rec_stack.axes_manager[0].scale = 1
-        rec_stack.axes_manager[1].name = self.axes_manager[2].name
-        rec_stack.axes_manager[1].scale = self.axes_manager[2].scale
-        rec_stack.axes_manager[1].units = self.axes_manager[2].units
-        rec_stack.axes_manager[2].name = "z"
-        rec_stack.axes_manager[2].scale = self.axes_manager[2].scale
-        rec_stack.axes_manager[2].units = self.axes_manager[2].units
-        rec_stack.navigator = "slider"
+        nav = 1 if multiple else 0
+        if rec_stack.shape[nav] == 0:
+            rec_stack = None
+        else:
+            rec_stack = Signal2D(rec_stack)
+            rec_stack.axes_manager[0].name = algorithm.upper() + " iteration"
+            rec_stack.axes_manager[0].scale = 1
+            if snapshots is not None:
+                rec_stack.axes_manager[0].convert_to_non_uniform_axis()
+                rec_stack.axes_manager[0].axis = np.asarray(snapshots, float)
+            if multiple:
+                rec_stack.axes_manager[1].name = "Slice"
+                rec_stack.axes_manager[1].convert_to_non_uniform_axis()
+                rec_stack.axes_manager[1].axis = np.asarray(nslice, float)
+            rec_stack.axes_manager[1 + nav].name = self.axes_manager[2].name
+            rec_stack.axes_manager[1 + nav].scale = self.axes_manager[2].scale
+            rec_stack.axes_manager[1 + nav].units = self.axes_manager[2].units
+            rec_stack.axes_manager[2 + nav].name = "z"
+            rec_stack.axes_manager[2 + nav].scale = self.axes_manager[2].scale
+            rec_stack.axes_manager[2 + nav].units = self.axes_manager[2].units
+            rec_stack.navigator = "slider"
 
         error = Signal1D(error)
-        error.axes_manager[0].name = algorithm.upper() + " Iteration"
+        if multiple:
+            error.axes_manager[0].name = "Slice"
+            error.axes_manager[0].convert_to_non_uniform_axis()
+            error.axes_manager[0].axis = np.asarray(nslice, float)
+        error.axes_manager[nav].name = algorithm.upper() + " Iteration"
         error.metadata.Signal.quantity = "Sum of Squared Difference"
         return rec_stack, error
 
@@ -1146,3 +1488,199 @@ class RecStack(CommonStack):
         [i.set_xticks([]) for i in [ax1, ax2, ax3]]
         [i.set_yticks([]) for i in [ax1, ax2, ax3]]
         return fig
+
+    def forward_project(self, tilts, cuda=None, ncores=None, slab_size=128, show_progressbar=False):
+        """
+        Forward project the reconstruction into a tilt series.
+
+        Args
+        ----------
+        tilts : NumPy array
+            Tilt angles in degrees
+        cuda : boolean
+            If True, use the CUDA-accelerated ASTRA 3D projector. If None, it is
+            used if CUDA is detected.
+        ncores : int
+            Number of threads for the CPU projection
+        slab_size : int
+            Maximum number of slices projected at once. Default is 128.
+        show_progressbar : bool
+            If True, show a progress bar. Default is False.
+
+        Returns
+        ----------
+        stack : TomoStack object
+            Tilt series of the reconstruction of shape [ntilts, ny, nx]
+
+        Examples
+        ----------
+        >>> import etspy.datasets as ds
+        >>> stack = ds.get_needle_data(True)
+        >>> slices = stack.isig[:, 120:121].deepcopy()
+        >>> rec = slices.reconstruct('SIRT', iterations=5, cuda=False)
+        >>> reprojection = rec.forward_project(slices.metadata.Tomography.tilts, cuda=False)
+
+        """
+        if cuda is None:
+            cuda = recon.use_cuda()
+        tilts = np.asarray(tilts, float)
+        proj = recon.forward_project(self.data, np.pi * tilts / 180.0, cuda, slab_size, ncores, show_progressbar)
+
+        axes_dict = self.axes_manager.as_dictionary()
+        axes = [{"name": "Tilt", "units": "degrees", "size": len(tilts)},
+                dict(axes_dict["axis-2"]), dict(axes_dict["axis-0"])]
+        axes[1]["size"] = proj.shape[1]
+        axes[1]["navigate"] = False
+        axes[2]["size"] = proj.shape[2]
+        axes[2]["navigate"] = False
+        stack = TomoStack(proj, axes=axes)
+        tomo_metadata = {"cropped": False, "shifts": np.zeros([len(tilts), 2]), "tiltaxis": 0,
+                         "tilts": tilts, "xshift": 0, "yshift": 0}
+        stack.metadata.add_node("Tomography")
+        stack.metadata.Tomography.add_dictionary(tomo_metadata)
+        return stack
+
+
+class LazyRecStack(LazySignal, RecStack):
+    """
+    Lazy version of RecStack for reconstructions stored out of core.
+
+    Returned by TomoStack.reconstruct when an output target is provided.
+    The data are read from the target on demand.
+
+    Parameters
+    ----------
+    RecStack : RecStack
+        RecStack class
+    """
+
+    def compute(self, *args, **kwargs):
+        """Load the reconstruction into memory, converting to a RecStack."""
+        super().compute(*args, **kwargs)
+        self.__class__ = RecStack
+
+
+class StreamingReconstructor:
+    """
+    Filtered backprojection (FBP) reconstruction updated as projections arrive.
+
+    Each projection is filtered and backprojected into a running volume as
+    soon as it is added, so a preview of the reconstruction is available at
+    any point of the acquisition.  Every projection is weighted by the
+    angular interval it covers, which is recomputed as new tilts are added,
+    so unevenly spaced and unordered tilts are handled.  For evenly spaced
+    tilts, the result is that of FBP with the 'numpy' engine.
+
+    Args
+    ----------
+    ny : int
+        Number of pixels perpendicular to the tilt axis
+    nx : int
+        Number of pixels along the tilt axis
+    thickness : int
+        Height of the reconstructed volume. If None, ny is used.
+    sino_filter : str
+        Filter to apply to each projection. Default is 'shepp-logan'.
+
+    Examples
+    ----------
+    >>> import etspy.datasets as ds
+    >>> from etspy.base import StreamingReconstructor
+    >>> stack = ds.get_needle_data(True)
+    >>> slices = stack.isig[120:121, :].deepcopy()
+    >>> streaming = StreamingReconstructor(256, 1)
+    >>> for projection, tilt in zip(slices.data, slices.metadata.Tomography.tilts):
+    ...     streaming.add(projection, tilt)
+    >>> rec = streaming.preview()
+
+    """
+
+    def __init__(self, ny, nx, thickness=None, sino_filter="shepp-logan"):
+        """Allocate the running volume."""
+        self.ny = ny
+        self.nx = nx
+        self.thickness = ny if thickness is None else thickness
+        self.sino_filter = sino_filter
+        self.tilts = np.zeros(0)
+        self._filtered = []
+        self._weights = np.zeros(0)
+        self._volume = np.zeros([nx, self.thickness, ny], np.float32)
+
+    def _get_weights(self, thetas):
+        """Return the angular interval covered by each projection."""
+        if len(thetas) == 1:
+            return np.array([np.pi])
+        order = np.argsort(thetas)
+        gaps = np.diff(thetas[order])
+        sorted_weights = np.zeros(len(thetas))
+        sorted_weights[1:-1] = (gaps[:-1] + gaps[1:]) / 2
+        sorted_weights[0] = gaps[0]
+        sorted_weights[-1] = gaps[-1]
+        weights = np.zeros(len(thetas))
+        weights[order] = sorted_weights
+        return weights
+
+    def _backproject(self, i, weight):
+        """Add the weighted backprojection of projection i to the volume."""
+        theta = np.pi * self.tilts[i:i + 1] / 180.0
+        self._volume += weight * recon.backproject(self._filtered[i][np.newaxis], theta, self.thickness)
+
+    def add(self, projection, tilt):
+        """
+        Add a projection to the reconstruction.
+
+        Only the new projection and its neighbors in tilt, whose angular
+        intervals change, are backprojected.
+
+        Args
+        ----------
+        projection : NumPy array or Signal2D
+            Projection of shape [ny, nx], or [ny] if nx is 1
+        tilt : float
+            Tilt angle of the projection in degrees
+
+        """
+        projection = np.asarray(getattr(projection, "data", projection))
+        if projection.ndim == 1:
+            projection = projection[:, np.newaxis]
+        if projection.shape != (self.ny, self.nx):
+            raise ValueError("Shape of projection %s does not match (%s, %s)"
+                             % (projection.shape, self.ny, self.nx))
+        if np.any(np.isclose(self.tilts, tilt)):
+            raise ValueError("A projection at tilt %s has already been added" % tilt)
+        filtered = recon.filter_sinograms(np.asarray(projection, np.float32)[np.newaxis],
+                                          self.sino_filter.lower(), axis=1)[0]
+        self._filtered.append(filtered.astype(np.float32))
+        self.tilts = np.append(self.tilts, tilt)
+        weights = self._get_weights(np.pi * self.tilts / 180.0)
+        old_weights = np.append(self._weights, 0)
+        for i in np.nonzero(~np.isclose(weights, old_weights))[0]:
+            self._backproject(i, weights[i] - old_weights[i])
+        self._weights = weights
+
+    @property
+    def nprojections(self):
+        """Number of projections added so far."""
+        return len(self.tilts)
+
+    def preview(self):
+        """
+        Return the current state of the reconstruction.
+
+        Returns
+        ----------
+        rec : RecStack object
+            Copy of the reconstruction of shape [nx, thickness, ny] from the
+            projections added so far
+
+        """
+        if self.nprojections == 0:
+            rec = np.zeros_like(self._volume)
+        else:
+            # Scaled as FBP over 180 degrees for evenly spaced tilts
+            rec = self._volume * np.float32(np.pi / (2 * self._weights.sum()))
+        axes = [{"name": "x", "size": self.nx}, {"name": "z", "size": self.thickness},
+                {"name": "y", "size": self.ny}]
+        rec = RecStack(rec, axes=axes)
+        rec.metadata.set_item("Reconstruction.tilts", np.sort(self.tilts))
+        return rec
@@ -8,134 +8,2540 @@ Reconstruction module for ETSpy package.
 @author: Andrew Herzing
 """
 import numpy as np
-import astra
 import logging
 import multiprocessing as mp
+from multiprocessing import shared_memory
 import tqdm
-import copy
-from scipy.ndimage import gaussian_filter, convolve
+import os
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import h5py
+from scipy.ndimage import gaussian_filter, zoom
+from scipy import sparse
+
+has_astra = True
+try:
+    import astra
+    import astra.experimental
+except ImportError:
+    has_astra = False
+
+has_zarr = True
+try:
+    import zarr
+except ImportError:
+    has_zarr = False
 
 ncpus = mp.cpu_count()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def run_alg(sino, iters, sino_id, alg_id, rec_id):
+def use_cuda():
+    """
+    Check whether ASTRA is installed and can use CUDA.
+
+    Returns
+    ----------
+    cuda : bool
+        True if the ASTRA CUDA algorithms are available
+
+    """
+    return has_astra and astra.use_cuda()
+
+
+def geometry_key(kind, thetas=None, ny=None, thickness=None, projector=None, filter=None, roi=None):
+    """
+    Create a hash identifying a geometry-dependent object.
+
+    Args
+    ----------
+    kind : str
+        Type of object, e.g. 'matrix' or 'filter'
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    thickness : int
+        Height of the reconstructed volume
+    projector : str
+        ASTRA projector type
+    filter : str
+        Filter used for filtered backprojection
+    roi : tuple
+        Bounds (z0, z1, y0, y1) of the region of interest
+
+    Returns
+    ----------
+    key : str
+        SHA-1 hex digest of the inputs
+
+    """
+    key = hashlib.sha1(repr((kind, ny, thickness, projector, filter, roi)).encode())
+    if thetas is not None:
+        key.update(np.asarray(thetas, np.float64).tobytes())
+    return key.hexdigest()
+
+
+def get_nbytes(value):
+    """
+    Calculate the memory used by the arrays of a cached object.
+
+    Args
+    ----------
+    value : object
+        NumPy array, SciPy sparse matrix, or other object
+
+    Returns
+    ----------
+    nbytes : int
+        Size of the array, or of the data, indices and index pointers of a
+        sparse matrix, in bytes.  Zero for other objects.
+
+    """
+    if sparse.issparse(value):
+        value = value.tocsr() if value.format not in ["csr", "csc"] else value
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
+
+
+class GeometryCache:
+    """
+    Least-recently-used cache of objects which depend only on the geometry.
+
+    System matrices and FBP filters are the same for every tilt series
+    acquired with the same tilts and detector size, so they are kept here
+    between reconstructions.  The least recently used objects are evicted
+    once more than 'maxsize' objects or more than 'max_bytes' bytes are held,
+    and an object larger than 'max_bytes' is not kept at all.  If
+    'cache_dir' is set, NumPy arrays and SciPy sparse matrices are also
+    saved to disk and reloaded by later sessions.
+
+    The cache used by the reconstructions is recon.geometry_cache, which is
+    set up with configure_geometry_cache and emptied with
+    clear_geometry_cache.
+
+    Args
+    ----------
+    maxsize : int
+        Maximum number of objects held in memory
+    cache_dir : str
+        Directory of the on-disk store.  If None, objects are only cached
+        in memory.
+    max_bytes : int
+        Maximum memory held by the cached objects (see get_nbytes).
+        Default is 2 GiB.
+
+    """
+
+    def __init__(self, maxsize=16, cache_dir=None, max_bytes=2 * 1024 ** 3):
+        """Create an empty cache."""
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._nbytes = OrderedDict()
+
+    def __len__(self):
+        """Return the number of objects held in memory."""
+        return len(self._items)
+
+    @property
+    def nbytes(self):
+        """Memory held by the cached objects in bytes."""
+        return sum(self._nbytes.values())
+
+    def _evict(self):
+        while len(self._items) > self.maxsize or (self._items and self.nbytes > self.max_bytes):
+            key, _ = self._items.popitem(last=False)
+            del self._nbytes[key]
+
+    def __contains__(self, key):
+        """Return True if the key is held in memory."""
+        return key in self._items
+
+    def _disk_path(self, key, value=None):
+        if value is None:
+            for ext in [".npz", ".npy"]:
+                filename = os.path.join(self.cache_dir, key + ext)
+                if os.path.isfile(filename):
+                    return filename
+            return None
+        elif sparse.issparse(value):
+            return os.path.join(self.cache_dir, key + ".npz")
+        elif isinstance(value, np.ndarray):
+            return os.path.join(self.cache_dir, key + ".npy")
+        return None
+
+    def get(self, key, factory):
+        """
+        Return the cached object for a key, creating it if necessary.
+
+        Args
+        ----------
+        key : str
+            Key as returned by geometry_key
+        factory : callable
+            Function without arguments which creates the object
+
+        Returns
+        ----------
+        value : object
+            Cached or newly created object
+
+        """
+        if key in self._items:
+            self._items.move_to_end(key)
+            self._nbytes.move_to_end(key)
+            return self._items[key]
+
+        value = None
+        if self.cache_dir is not None:
+            filename = self._disk_path(key)
+            if filename is not None and filename.endswith(".npz"):
+                value = sparse.load_npz(filename).tocsr()
+            elif filename is not None:
+                value = np.load(filename)
+        if value is None:
+            value = factory()
+            if self.cache_dir is not None:
+                filename = self._disk_path(key, value)
+                if filename is not None:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    if sparse.issparse(value):
+                        sparse.save_npz(filename, value)
+                    else:
+                        np.save(filename, value)
+
+        nbytes = get_nbytes(value)
+        if nbytes <= self.max_bytes:
+            self._items[key] = value
+            self._nbytes[key] = nbytes
+            self._evict()
+        return value
+
+    def configure(self, maxsize=None, max_bytes=None, cache_dir=None):
+        """
+        Change the limits or the on-disk store of the cache.
+
+        Objects beyond the new limits are evicted at once.
+
+        Args
+        ----------
+        maxsize : int
+            Maximum number of objects held in memory.  If None, it is not
+            changed.
+        max_bytes : int
+            Maximum memory held by the cached objects.  If None, it is not
+            changed.
+        cache_dir : str
+            Directory of the on-disk store.  If None, it is not changed.
+
+        """
+        if maxsize is not None:
+            self.maxsize = maxsize
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if cache_dir is not None:
+            self.cache_dir = cache_dir
+        self._evict()
+
+    def clear(self):
+        """Remove all objects held in memory.  The on-disk store is kept."""
+        self._items.clear()
+        self._nbytes.clear()
+
+
+geometry_cache = GeometryCache()
+
+
+def configure_geometry_cache(maxsize=None, max_bytes=None, cache_dir=None):
+    """
+    Change the limits or the on-disk store of the reconstruction cache.
+
+    System matrices and FBP filters are kept in recon.geometry_cache between
+    reconstructions (see GeometryCache).  A system matrix for a large
+    detector can use several GB, so 'max_bytes' limits the memory held
+    after the reconstructions return.
+
+    Args
+    ----------
+    maxsize : int
+        Maximum number of objects held in memory.  Default is 16.
+    max_bytes : int
+        Maximum memory held by the cached objects.  Default is 2 GiB.  Zero
+        disables the in-memory cache.
+    cache_dir : str
+        Directory in which system matrices and filters are also saved and
+        reloaded by later sessions.
+
+    Examples
+    --------
+    >>> from etspy import recon
+    >>> recon.configure_geometry_cache(max_bytes=512 * 1024 ** 2)
+
+    """
+    geometry_cache.configure(maxsize, max_bytes, cache_dir)
+
+
+def clear_geometry_cache():
+    """
+    Release the system matrices and filters kept in memory between reconstructions.
+
+    Examples
+    --------
+    >>> from etspy import recon
+    >>> recon.clear_geometry_cache()
+
+    """
+    geometry_cache.clear()
+
+
+def get_roi(thickness, ny, roi_y=None, roi_z=None):
+    """
+    Check and complete the bounds of a reconstruction region of interest.
+
+    Args
+    ----------
+    thickness : int
+        Height of the full reconstructed volume
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+
+    Returns
+    ----------
+    roi : tuple
+        Bounds (z0, z1, y0, y1) of the region of interest
+
+    """
+    y0, y1 = (0, ny) if roi_y is None else roi_y
+    z0, z1 = (0, thickness) if roi_z is None else roi_z
+    if not (0 <= y0 < y1 <= ny and 0 <= z0 < z1 <= thickness):
+        raise ValueError("Region of interest y=%s, z=%s is outside of the %s x %s volume"
+                         % ((y0, y1), (z0, z1), thickness, ny))
+    return int(z0), int(z1), int(y0), int(y1)
+
+
+def get_vol_geom(thickness, ny, roi_y=None, roi_z=None, nslices=None):
+    """
+    Create the ASTRA volume geometry of a reconstruction.
+
+    The region of interest is expressed as a window on the full volume of
+    'thickness' x 'ny' pixels, so only the pixels inside it are allocated
+    and reconstructed.
+
+    Args
+    ----------
+    thickness : int
+        Height of the full reconstructed volume
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+    nslices : int
+        If given, create a 3D geometry with this many slices along the
+        tilt axis.
+
+    Returns
+    ----------
+    vol_geom : dict
+        ASTRA volume geometry
+
+    """
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+    window = [y0 - ny / 2, y1 - ny / 2, thickness / 2 - z1, thickness / 2 - z0]
+    if nslices is None:
+        return astra.create_vol_geom(z1 - z0, y1 - y0, *window)
+    return astra.create_vol_geom(z1 - z0, y1 - y0, nslices, *window, -nslices / 2, nslices / 2)
+
+
+def run_alg(sino, iters, sino_id, alg_id, rec_id, initial=None):
     """
     Run FBP, SIRT, or SART reconstruction algorithm.
 
     Args
     ----------
-    sino : NumPy array
-       Sinogram of shape (nangles, ny)
-    iters : int
-        Number of iterations for the reconstruction
-    sino_id : int
-        ASTRA sinogram identity
-    alg_id : int
-        ASTRA algorithm identity
-    rec_id : boolean
-        ASTRA reconstruction identity
+    sino : NumPy array
+       Sinogram of shape (nangles, ny)
+    iters : int
+        Number of iterations for the reconstruction
+    sino_id : int
+        ASTRA sinogram identity
+    alg_id : int or OrderedSubsets
+        ASTRA algorithm identity
+    rec_id : boolean
+        ASTRA reconstruction identity
+    initial : NumPy array
+        Starting reconstruction.  If None, the reconstruction starts from zero.
+
+    Returns
+    ----------
+    Numpy array
+        Reconstruction of input sinogram
+
+    """
+    astra.data2d.store(sino_id, sino)
+    astra.data2d.store(rec_id, 0 if initial is None else initial)
+    if isinstance(alg_id, OrderedSubsets):
+        alg_id.run(iters)
+    else:
+        astra.algorithm.run(alg_id, iters)
+    return astra.data2d.get(rec_id)
+
+
+def run_alg_tol(sino, max_iterations, sino_id, alg_id, rec_id, fp_id, fp_sino_id, tol, check_every=10,
+                initial=None):
+    """
+    Run SIRT or SART until the residual stops decreasing.
+
+    Every 'check_every' iterations the reconstruction is reprojected and the
+    iterations stop once the relative change of the residual norm falls
+    below 'tol'.  Empty sinograms are not reconstructed at all.
+
+    Args
+    ----------
+    sino : NumPy array
+       Sinogram of shape (nangles, ny)
+    max_iterations : int
+        Maximum number of iterations for the reconstruction
+    sino_id : int
+        ASTRA sinogram identity
+    alg_id : int or OrderedSubsets
+        ASTRA algorithm identity
+    rec_id : int
+        ASTRA reconstruction identity
+    fp_id : int
+        ASTRA forward projection algorithm identity (see get_fp_config)
+    fp_sino_id : int
+        ASTRA sinogram identity receiving the forward projection
+    tol : float
+        Relative change of the residual norm below which to stop
+    check_every : int
+        Number of iterations between residual checks
+    initial : NumPy array
+        Starting reconstruction.  If None, the reconstruction starts from zero.
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstruction of input sinogram
+    iterations : int
+        Number of iterations performed
+
+    """
+    astra.data2d.store(sino_id, sino)
+    astra.data2d.store(rec_id, 0 if initial is None else initial)
+    iterations = 0
+    if not np.any(sino):
+        return astra.data2d.get(rec_id), iterations
+    res_prev = None
+    while iterations < max_iterations:
+        n = min(check_every, max_iterations - iterations)
+        if isinstance(alg_id, OrderedSubsets):
+            alg_id.run(n)
+        else:
+            astra.algorithm.run(alg_id, n)
+        iterations += n
+        astra.algorithm.run(fp_id)
+        res = np.linalg.norm(astra.data2d.get_shared(fp_sino_id) - sino)
+        if res == 0 or (res_prev is not None and abs(res_prev - res) < tol * res_prev):
+            break
+        res_prev = res
+    return astra.data2d.get(rec_id), iterations
+
+
+def get_fp_config(proj_id, fp_sino_id, rec_id, cuda=False):
+    """
+    Create the ASTRA configuration used to reproject a reconstruction.
+
+    Args
+    ----------
+    proj_id : int
+        ASTRA projector identity
+    fp_sino_id : int
+        ASTRA sinogram identity receiving the forward projection
+    rec_id : int
+        ASTRA reconstruction identity
+    cuda : boolean
+        If True, use the CUDA-accelerated forward projection
+
+    Returns
+    ----------
+    cfg : dict
+        ASTRA algorithm configuration
+
+    """
+    cfg = astra.astra_dict("FP_CUDA" if cuda else "FP")
+    cfg["ProjectorId"] = proj_id
+    cfg["ProjectionDataId"] = fp_sino_id
+    cfg["VolumeDataId"] = rec_id
+    return cfg
+
+
+def get_cpu_alg_config(method, proj_id, sino_id, rec_id, constrain=False, thresh=0, filter="shepp-logan"):
+    """
+    Create the ASTRA configuration for a CPU-based FBP or SIRT reconstruction.
+
+    SART is performed by OrderedSubsets instead.
+
+    Args
+    ----------
+    method : str
+        Reconstruction algorithm.  Must be 'FBP' or 'SIRT'
+    proj_id : int
+        ASTRA projector identity
+    sino_id : int
+        ASTRA sinogram identity
+    rec_id : int
+        ASTRA reconstruction identity
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    filter : str
+        Filter to use for filtered backprojection
+
+    Returns
+    ----------
+    cfg : dict
+        ASTRA algorithm configuration
+
+    """
+    if method.lower() == "fbp":
+        cfg = astra.astra_dict("FBP")
+        cfg["option"] = {}
+        cfg["option"]["FilterType"] = filter.lower()
+    else:
+        cfg = astra.astra_dict("SIRT")
+        if constrain:
+            cfg["option"] = {}
+            cfg["option"]["MinConstraint"] = thresh
+    cfg["ProjectorId"] = proj_id
+    cfg["ProjectionDataId"] = sino_id
+    cfg["ReconstructionDataId"] = rec_id
+    return cfg
+
+
+def get_subsets(thetas, nsubsets=None):
+    """
+    Divide the projections into interleaved subsets for ordered-subsets reconstruction.
+
+    The projections are sorted by angle and subset k contains every
+    nsubsets-th projection starting from the k-th, so that each subset
+    covers the full tilt range.
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles
+    nsubsets : int
+        Number of subsets.  If None, each projection is its own subset.
+
+    Returns
+    ----------
+    subsets : list
+        Projection indices of each subset
+
+    """
+    nangles = len(thetas)
+    if nsubsets is None:
+        nsubsets = nangles
+    if nsubsets < 1 or nsubsets > nangles:
+        raise ValueError("Number of subsets must be between 1 and the number of projections (%s)" % nangles)
+    indices = np.argsort(thetas, kind="stable")
+    return [indices[k::nsubsets] for k in range(nsubsets)]
+
+
+def get_subset_order(nsubsets, ordering="golden", rng=None):
+    """
+    Get the order in which the subsets are visited during one iteration.
+
+    Args
+    ----------
+    nsubsets : int
+        Number of subsets
+    ordering : str
+        'sequential' visits the subsets in order of their first angle.
+        'random' visits them in a new random order for each iteration.
+        'golden' visits them in a fixed order in which each subset is
+        offset from the previous one by the golden ratio of the angular
+        interval between projections, so that successive subsets are never
+        close in angle.
+    rng : NumPy Generator
+        Random number generator for the 'random' ordering.  If None, a new
+        unseeded generator is used.
+
+    Returns
+    ----------
+    order : NumPy array
+        Subset indices in the order they are visited
+
+    """
+    ordering = ordering.lower()
+    if ordering == "sequential":
+        return np.arange(nsubsets)
+    elif ordering == "random":
+        if rng is None:
+            rng = np.random.default_rng()
+        return rng.permutation(nsubsets)
+    elif ordering == "golden":
+        positions = (np.arange(nsubsets) * (np.sqrt(5) - 1) / 2) % 1
+        return np.argsort(np.argsort(positions, kind="stable"), kind="stable")
+    else:
+        raise ValueError("Unknown subset ordering: %s" % ordering)
+
+
+class OrderedSubsets:
+    """
+    Ordered-subsets SART (OS-SART) for single slices using ASTRA.
+
+    One ASTRA SIRT algorithm is created for each subset of projections and
+    all of them update the same reconstruction data object, so running one
+    iteration of each in turn performs one OS-SART iteration.  With one
+    projection per subset this is SART.
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    vol_geom : dict
+        ASTRA volume geometry of the reconstruction
+    sino_id : int
+        ASTRA sinogram identity holding all projections
+    rec_id : int
+        ASTRA reconstruction identity
+    nsubsets : int
+        Number of subsets.  If None, each projection is its own subset.
+    ordering : str
+        Order in which the subsets are visited (see get_subset_order)
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    cuda : boolean
+        If True, use the CUDA-accelerated ASTRA algorithms
+    rng : NumPy Generator
+        Random number generator for the 'random' ordering
+
+    """
+
+    def __init__(self, thetas, ny, vol_geom, sino_id, rec_id, nsubsets=None, ordering="golden",
+                 constrain=False, thresh=0, cuda=False, rng=None):
+        """Create the ASTRA objects for each subset."""
+        self.subsets = get_subsets(thetas, nsubsets)
+        self.ordering = ordering
+        self.rng = rng
+        self.sino_id = sino_id
+        self.sino_ids = []
+        self.alg_ids = []
+        for subset in self.subsets:
+            proj_geom = astra.create_proj_geom("parallel", 1.0, ny, thetas[subset])
+            proj_id = astra.create_projector("cuda" if cuda else "linear", proj_geom, vol_geom)
+            self.sino_ids.append(astra.data2d.create("-sino", proj_geom, 0))
+            cfg = astra.astra_dict("SIRT_CUDA" if cuda else "SIRT")
+            cfg["ProjectorId"] = proj_id
+            cfg["ProjectionDataId"] = self.sino_ids[-1]
+            cfg["ReconstructionDataId"] = rec_id
+            if constrain:
+                cfg["option"] = {}
+                cfg["option"]["MinConstraint"] = thresh
+            self.alg_ids.append(astra.algorithm.create(cfg))
+
+    def run(self, niterations):
+        """Run niterations passes over all subsets using the sinogram currently stored in sino_id."""
+        sino = astra.data2d.get_shared(self.sino_id)
+        for subset, sino_id in zip(self.subsets, self.sino_ids):
+            astra.data2d.store(sino_id, sino[subset])
+        for _ in range(niterations):
+            for k in get_subset_order(len(self.subsets), self.ordering, self.rng):
+                astra.algorithm.run(self.alg_ids[k], 1)
+
+
+_worker = {}
+
+
+def _init_worker(sino_name, rec_name, sino_shape, thickness, thetas, method, niterations,
+                 constrain, thresh, filter, tol=None, check_every=10, dart_args=None, roi_y=None, roi_z=None,
+                 warm_start=False, nsubsets=None, ordering="golden"):
+    """Attach to the shared buffers and build the ASTRA objects once per worker process."""
+    nslices, nangles, ny = sino_shape
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+    sino_shm = shared_memory.SharedMemory(name=sino_name)
+    rec_shm = shared_memory.SharedMemory(name=rec_name)
+    if method.lower() == "dart":
+        _worker["shm"] = [sino_shm, rec_shm]
+        _worker["sinos"] = np.ndarray(sino_shape, np.float32, buffer=sino_shm.buf)
+        _worker["rec"] = np.ndarray([nslices, z1 - z0, y1 - y0], np.float32, buffer=rec_shm.buf)
+        _worker["dart"] = DartEngine(thetas, ny, thickness, niterations=niterations, roi_y=roi_y, roi_z=roi_z,
+                                     **dart_args)
+        _worker["warm_start"] = warm_start
+        return
+
+    proj_geom = astra.create_proj_geom("parallel", 1.0, ny, thetas)
+    vol_geom = get_vol_geom(thickness, ny, roi_y, roi_z)
+    proj_id = astra.create_projector("linear", proj_geom, vol_geom)
+    rec_id = astra.data2d.create("-vol", vol_geom)
+    sino_id = astra.data2d.create("-sino", proj_geom, 0)
+
+    _worker["shm"] = [sino_shm, rec_shm]
+    _worker["sinos"] = np.ndarray(sino_shape, np.float32, buffer=sino_shm.buf)
+    _worker["rec"] = np.ndarray([nslices, z1 - z0, y1 - y0], np.float32, buffer=rec_shm.buf)
+    _worker["sino_id"] = sino_id
+    _worker["rec_id"] = rec_id
+    if method.lower() == "sart":
+        _worker["alg_id"] = OrderedSubsets(thetas, ny, vol_geom, sino_id, rec_id, nsubsets, ordering,
+                                           constrain, thresh)
+    else:
+        cfg = get_cpu_alg_config(method, proj_id, sino_id, rec_id, constrain, thresh, filter)
+        _worker["alg_id"] = astra.algorithm.create(cfg)
+    _worker["niterations"] = 1 if method.lower() == "fbp" else niterations
+    _worker["tol"] = None if method.lower() == "fbp" else tol
+    _worker["check_every"] = check_every
+    _worker["warm_start"] = warm_start
+    if _worker["tol"] is not None:
+        _worker["fp_sino_id"] = astra.data2d.create("-sino", proj_geom, 0)
+        _worker["fp_id"] = astra.algorithm.create(get_fp_config(proj_id, _worker["fp_sino_id"], rec_id))
+
+
+def _run_worker(i):
+    """Reconstruct slice i from the shared sinogram buffer into the shared output buffer."""
+    initial = _worker["rec"][i] if _worker["warm_start"] else None
+    if _worker["tol"] is None:
+        run_alg(_worker["sinos"][i], _worker["niterations"], _worker["sino_id"], _worker["alg_id"],
+                _worker["rec_id"], initial)
+        iterations = _worker["niterations"]
+    else:
+        _, iterations = run_alg_tol(_worker["sinos"][i], _worker["niterations"], _worker["sino_id"],
+                                    _worker["alg_id"], _worker["rec_id"], _worker["fp_id"],
+                                    _worker["fp_sino_id"], _worker["tol"], _worker["check_every"], initial)
+    _worker["rec"][i] = astra.data2d.get_shared(_worker["rec_id"])
+    return i, iterations
+
+
+def _run_dart_worker(args):
+    """Reconstruct slice i with DART using a generator seeded for that slice."""
+    i, seed = args
+    initial = _worker["rec"][i] if _worker["warm_start"] else None
+    _worker["rec"][i] = _worker["dart"].reconstruct(_worker["sinos"][i], np.random.default_rng(seed), initial)
+    return i, _worker["dart"].niterations
+
+
+def run_pool(sinos, thetas, method, niterations, thickness, constrain=False, thresh=0,
+             filter="shepp-logan", ncores=None, show_progressbar=True, out=None, chunk_size=64,
+             tol=None, check_every=10, iterations=None, dart_args=None, seed=None, roi_y=None, roi_z=None,
+             initial=None, nsubsets=None, ordering="golden"):
+    """
+    Reconstruct a tilt series with a pool of CPU worker processes.
+
+    The tilt series is processed in chunks of 'chunk_size' slices.  Each
+    chunk is copied once into a shared memory buffer with one contiguous
+    sinogram per slice, and the workers write their results directly into
+    a shared output buffer which is then copied to 'out'.  Each worker
+    builds its own projector and algorithm in the pool initializer, so
+    nothing but the slice index is sent to the workers.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Tilt series data of shape [nangles, ny, nx]
+    thetas : NumPy array
+        Projection angles in radians
+    method : str
+        Reconstruction algorithm.  Must be 'FBP', 'SIRT', 'SART', or 'DART'
+    niterations : int
+        Number of iterations for SIRT or SART, or of the SART steps of DART
+    thickness : int
+        Height of the reconstructed volume
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    filter : str
+        Filter to use for filtered backprojection
+    ncores : int
+        Number of worker processes.  If None, 90% of the available cores are used.
+    show_progressbar : bool
+        If True, show a progress bar for the reconstruction
+    out : array-like
+        Array of shape [nx, thickness, ny] which receives the reconstruction.
+        If None, a new array is allocated.
+    chunk_size : int
+        Number of slices held in the shared buffers at one time.
+    tol : float
+        If given, SIRT and SART stop once the relative change of the residual
+        norm falls below this value (see run_alg_tol).  'niterations' is then
+        the maximum number of iterations.
+    check_every : int
+        Number of iterations between residual checks
+    iterations : NumPy array
+        If given, receives the number of iterations performed for each slice
+    dart_args : dict
+        Keyword arguments 'gray_levels', 'dart_iterations' and 'p' for
+        DartEngine.  Required for DART.
+    seed : int
+        Seed for the DART free pixel selection.  The generator for each
+        slice is seeded with [seed, slice index], so the result does not
+        depend on the number of workers.
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+    initial : array-like
+        Starting volume for SIRT, SART, or DART of the same shape as the
+        reconstruction.  If None, each slice starts from zero.
+    nsubsets : int
+        Number of subsets for SART (see OrderedSubsets)
+    ordering : str
+        Order in which the SART subsets are visited (see get_subset_order)
+
+    Returns
+    ----------
+    rec : NumPy array or array-like
+        Reconstructed volume of shape [nx, thickness, ny]
+
+    """
+    nangles, ny, nx = sinos.shape
+    if ncores is None:
+        ncores = max(1, min(nx, int(0.9 * mp.cpu_count())))
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+    if out is None:
+        out = np.zeros([nx, z1 - z0, y1 - y0], np.float32)
+    chunk_size = max(1, min(chunk_size, nx))
+    sino_shape = (chunk_size, nangles, ny)
+    rec_shape = (chunk_size, z1 - z0, y1 - y0)
+
+    sino_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(sino_shape)) * 4)
+    rec_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(rec_shape)) * 4)
+    shared_sinos = np.ndarray(sino_shape, np.float32, buffer=sino_shm.buf)
+    shared_rec = np.ndarray(rec_shape, np.float32, buffer=rec_shm.buf)
+    try:
+        initargs = (sino_shm.name, rec_shm.name, sino_shape, thickness, thetas, method,
+                    niterations, constrain, thresh, filter, tol, check_every, dart_args, roi_y, roi_z,
+                    initial is not None, nsubsets, ordering)
+        with mp.Pool(ncores, initializer=_init_worker, initargs=initargs) as pool:
+            with tqdm.tqdm(total=nx, disable=not (show_progressbar)) as pbar:
+                for start in range(0, nx, chunk_size):
+                    stop = min(start + chunk_size, nx)
+                    shared_sinos[0:stop - start] = np.transpose(sinos[:, :, start:stop], [2, 0, 1])
+                    if initial is not None:
+                        shared_rec[0:stop - start] = initial[start:stop]
+                    chunksize = max(1, (stop - start) // (4 * ncores))
+                    if method.lower() == "dart":
+                        tasks = pool.imap_unordered(_run_dart_worker,
+                                                    [(i, [seed, start + i]) for i in range(stop - start)],
+                                                    chunksize)
+                    else:
+                        tasks = pool.imap_unordered(_run_worker, range(stop - start), chunksize)
+                    for i, n in tasks:
+                        if iterations is not None:
+                            iterations[start + i] = n
+                        pbar.update(1)
+                    out[start:stop] = shared_rec[0:stop - start]
+    finally:
+        del shared_sinos, shared_rec
+        sino_shm.close()
+        sino_shm.unlink()
+        rec_shm.close()
+        rec_shm.unlink()
+    return out
+
+
+class DartEngine:
+    """
+    Discrete algebraic reconstruction technique (DART) for single slices.
+
+    Adapted from pseudo-code published in:
+    K. J. Batenburg and J. Sijbers, "DART: A Practical Reconstruction
+    Algorithm for Discrete Tomography," doi: 10.1109/TIP.2011.2131661.
+
+    The ASTRA data objects, the forward projection of the fixed pixels and
+    all working arrays are created once and reused for every slice.  The
+    arrays are views of the ASTRA data objects, so no data is copied
+    between NumPy and ASTRA during the iterations.
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    thickness : int
+        Height of the reconstructed volume
+    gray_levels : list or NumPy array
+        Gray levels for DART reconstruction
+    niterations : int
+        Number of iterations for the SART reconstruction
+    dart_iterations : int
+        Number of iterations for the DART reconstruction
+    p : float
+        Probability for free pixel determination
+    cuda : boolean
+        If True, use the CUDA-accelerated ASTRA algorithms
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+
+    """
+
+    def __init__(self, thetas, ny, thickness, gray_levels, niterations, dart_iterations, p, cuda=False,
+                 roi_y=None, roi_z=None):
+        """Create the ASTRA objects and working arrays."""
+        self.gray_levels = np.asarray(gray_levels, np.float32)
+        self.thresholds = [(gray_levels[i] + gray_levels[i + 1]) // 2 for i in range(len(gray_levels) - 1)]
+        self.niterations = niterations
+        self.dart_iterations = dart_iterations
+        self.p = p
+
+        proj_geom = astra.create_proj_geom("parallel", 1.0, ny, thetas)
+        vol_geom = get_vol_geom(thickness, ny, roi_y, roi_z)
+        self.proj_id = astra.create_projector("cuda" if cuda else "linear", proj_geom, vol_geom)
+        self.sino_id = astra.data2d.create("-sino", proj_geom, 0)
+        self.fp_sino_id = astra.data2d.create("-sino", proj_geom, 0)
+        self.rec_id = astra.data2d.create("-vol", vol_geom, 0)
+        self.fixed_id = astra.data2d.create("-vol", vol_geom, 0)
+        self.mask_id = astra.data2d.create("-vol", vol_geom, 1)
+
+        self.cfg = astra.astra_dict("SART_CUDA" if cuda else "SART")
+        self.cfg["ProjectorId"] = self.proj_id
+        self.cfg["ProjectionDataId"] = self.sino_id
+        self.cfg["ReconstructionDataId"] = self.rec_id
+        self.cfg["option"] = {}
+        self.cfg["option"]["MinConstraint"] = 0
+        self.cfg["option"]["MaxConstraint"] = 255
+        self.cfg["option"]["ReconstructionMaskId"] = self.mask_id
+        self.cfg["option"]["ProjectionOrder"] = "custom"
+        self.alg_id = None
+        self.fp_id = astra.algorithm.create(get_fp_config(self.proj_id, self.fp_sino_id, self.fixed_id, cuda))
+
+        self.free_sino = astra.data2d.get_shared(self.sino_id)
+        self.fp_sino = astra.data2d.get_shared(self.fp_sino_id)
+        self.rec = astra.data2d.get_shared(self.rec_id)
+        self.fixed = astra.data2d.get_shared(self.fixed_id)
+        self.mask = astra.data2d.get_shared(self.mask_id)
+        self.sino = np.zeros_like(self.free_sino)
+        self.segmented = np.zeros_like(self.rec)
+        self.smooth = np.zeros_like(self.rec)
+        self.free = np.zeros(self.rec.shape, bool)
+
+    def reconstruct(self, sino, rng=None, initial=None):
+        """
+        Reconstruct a single sinogram.
+
+        Args
+        ----------
+        sino : NumPy array
+           Sinogram of shape (nangles, ny)
+        rng : NumPy Generator
+            Random number generator used to select the free pixels.  If None,
+            a new unseeded generator is used.
+        initial : NumPy array
+            Starting volume for the initial SART reconstruction.  If None,
+            the reconstruction starts from zero.
+
+        Returns
+        ----------
+        Numpy array
+            Reconstruction of input sinogram
+
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+
+        # SART keeps its position in the projection order between runs, so a new
+        # algorithm with an order drawn from rng makes each slice reproducible
+        if self.alg_id is not None:
+            astra.algorithm.delete(self.alg_id)
+        self.cfg["option"]["ProjectionOrderList"] = rng.permutation(self.sino.shape[0])
+        self.alg_id = astra.algorithm.create(self.cfg)
+
+        self.sino[:] = sino
+        self.free_sino[:] = sino
+        self.rec[:] = 0 if initial is None else initial
+        self.mask[:] = 1
+        astra.algorithm.run(self.alg_id, self.niterations)
+        for j in range(self.dart_iterations):
+            dart_segment(self.rec, self.thresholds, self.gray_levels, out=self.segmented)
+            get_dart_boundaries(self.segmented, out=self.free)
+
+            # Free pixels are the boundary pixels plus a random selection of the others
+            self.free |= rng.random(self.free.shape, np.float32) < 1 - self.p
+
+            # Set fixed pixels to segmented values and subtract their projection
+            np.copyto(self.rec, self.segmented, where=~self.free)
+            np.multiply(self.segmented, ~self.free, out=self.fixed)
+            astra.algorithm.run(self.fp_id)
+            np.subtract(self.sino, self.fp_sino, out=self.free_sino)
+
+            # Run SART reconstruction on free sinogram with free pixel mask
+            self.mask[:] = self.free
+            astra.algorithm.run(self.alg_id, self.niterations)
+
+            # Smooth the free pixels
+            if j < self.dart_iterations - 1:
+                gaussian_filter(self.rec, sigma=1, output=self.smooth)
+                np.copyto(self.rec, self.smooth, where=self.free)
+        return self.rec.copy()
+
+
+def get_fbp_filter(filter_name, filter_length, cutoff=0.5, ramp="spatial"):
+    """
+    Calculate the frequency response of a filtered backprojection filter.
+
+    Args
+    ----------
+    filter_name : str
+        Type of filter. Must be 'ram-lak', 'shepp-logan', 'hann' ('hanning'),
+        or 'cosine' ('cos').
+    filter_length : int
+        Length of the (padded) signal to which the filter will be applied.
+    cutoff : float
+        Factor of sampling rate to use as the cutoff.  Default is 0.5 which
+        corresponds to the Nyquist frequency.
+    ramp : str
+        Ramp to which the window is applied.  If 'spatial', the ramp is
+        designed in the spatial domain and zeroed above the cutoff, as used
+        for reconstruction.  If 'linear', the ramp is sampled linearly
+        between cutoff / filter_length and 1 - cutoff / filter_length, as
+        used by utils.filter_stack.
+
+    Returns
+    ----------
+    filt : NumPy array
+        Filter values for the non-negative frequencies of a real FFT of
+        length filter_length
+
+    """
+    freq = np.arange(filter_length // 2 + 1) / filter_length
+    if ramp == "spatial":
+        # Ramp filter designed in the spatial domain to avoid the DC offset of
+        # a ramp sampled directly in frequency space (Kak & Slaney, Ch. 3)
+        n = np.concatenate([np.arange(0, filter_length // 2 + 1), np.arange(-(filter_length // 2) + 1, 0)])
+        kernel = np.zeros(filter_length)
+        kernel[0] = 0.25
+        odd = n % 2 == 1
+        kernel[odd] = -1 / (np.pi * n[odd]) ** 2
+        filt = 2 * np.real(np.fft.rfft(kernel))
+    elif ramp == "linear":
+        filt = np.linspace(cutoff / filter_length, 1 - cutoff / filter_length, len(freq))
+    else:
+        raise ValueError("Invalid ramp type: %s." % ramp)
+
+    omega = 2 * np.pi * freq
+
+    if filter_name == "ram-lak":
+        pass
+    elif filter_name == "shepp-logan":
+        filt[1:] = filt[1:] * np.sinc(omega[1:] / (2 * np.pi))
+    elif filter_name in ["hanning", "hann"]:
+        filt[1:] = filt[1:] * (1 + np.cos(omega[1:])) / 2
+    elif filter_name in ["cosine", "cos"]:
+        filt[1:] = filt[1:] * np.cos(omega[1:] / 2)
+    else:
+        raise ValueError("Invalid filter type: %s." % filter_name)
+    if ramp == "spatial":
+        filt[freq > cutoff] = 0
+    return filt
+
+
+def filter_sinograms(sinograms, filter_name="shepp-logan", cutoff=0.5, axis=1, ramp="spatial"):
+    """
+    Apply a Fourier filter to any number of sinograms at once.
+
+    Args
+    ----------
+    sinograms : NumPy array
+        Projection data. The filter is applied along the detector axis
+        given by 'axis'.
+    filter_name : str
+        Type of filter to apply.
+    cutoff : float
+        Factor of sampling rate to use as the cutoff.  Default is 0.5 which
+        corresponds to the Nyquist frequency.
+    axis : int
+        Detector axis of the data. Default is 1, which is the axis
+        perpendicular to the tilt axis in a TomoStack.
+    ramp : str
+        Ramp to which the filter window is applied (see get_fbp_filter)
+
+    Returns
+    ----------
+    filtered : NumPy array
+        Filtered projection data with the same shape as the input
+
+    """
+    ny = sinograms.shape[axis]
+    filter_length = max(64, 2 ** (int(np.ceil(np.log2(2 * ny)))))
+    key = geometry_key("filter", ny=filter_length, filter="%s_%s_%s" % (filter_name, cutoff, ramp))
+    filt = geometry_cache.get(key, lambda: get_fbp_filter(filter_name, filter_length, cutoff, ramp))
+    filt_shape = [1] * sinograms.ndim
+    filt_shape[axis] = len(filt)
+
+    pad_length = (filter_length - ny) // 2
+    padding = [[0, 0]] * sinograms.ndim
+    padding[axis] = [pad_length, filter_length - ny - pad_length]
+    padded = np.pad(sinograms, padding)
+
+    proj_fft = np.fft.rfft(padded, axis=axis)
+    filtered = np.fft.irfft(proj_fft * filt.reshape(filt_shape), n=filter_length, axis=axis)
+    return np.take(filtered, np.arange(pad_length, pad_length + ny), axis=axis)
+
+
+def get_alignment_vectors(thetas, ny, nx, shifts=None, xshift=0, yshift=0, tiltaxis=0):
+    """
+    Compute the ASTRA parallel3d_vec geometry of an unaligned tilt series.
+
+    The alignment is described as in metadata.Tomography, i.e. the shifts
+    applied by align.apply_shifts followed by the translation and rotation
+    applied by CommonStack.trans_stack.  Instead of resampling the
+    projections, each detector is placed where its pixels would land after
+    the alignment, so the raw data can be reconstructed directly.
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    nx : int
+        Number of detector pixels along the tilt axis
+    shifts : NumPy array
+        Shifts [row, column] of each projection of shape [nangles, 2].  If
+        None, no shifts are applied.
+    xshift : float
+        Translation of all projections along the tilt axis
+    yshift : float
+        Translation of all projections perpendicular to the tilt axis
+    tiltaxis : float
+        Rotation of all projections in degrees
+
+    Returns
+    ----------
+    vectors : NumPy array
+        ASTRA parallel3d_vec vectors of shape [nangles, 12]
+
+    """
+    thetas = np.asarray(thetas)
+    proj_geom = astra.create_proj_geom("parallel3d", 1.0, 1.0, nx, ny, thetas)
+    vectors = astra.geom_2vec(proj_geom)["Vectors"]
+    if shifts is None:
+        shifts = np.zeros([len(thetas), 2])
+    angle = np.pi * tiltaxis / 180.0
+    rot_mat = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+
+    # Offsets of the aligned pixels in (column, row) image coordinates.  The
+    # rotation of trans_stack is about the point half a pixel beyond the
+    # detector center used by ASTRA.
+    half = 0.5
+    offsets = (np.asarray(shifts, float)[:, ::-1] - half) @ rot_mat.T + [xshift, -yshift] + half
+    det_u = vectors[:, 6:9].copy()
+    det_v = vectors[:, 9:12].copy()
+    vectors[:, 3:6] += offsets[:, 0:1] * det_v + offsets[:, 1:2] * det_u
+    vectors[:, 6:9] = rot_mat[0, 1] * det_v + rot_mat[1, 1] * det_u
+    vectors[:, 9:12] = rot_mat[0, 0] * det_v + rot_mat[1, 0] * det_u
+    return vectors
+
+
+def vectors_separate_slices(vectors, atol=1e-6):
+    """
+    Check whether an aligned geometry keeps each slice in its own detector row.
+
+    This is the case if the rays, the detector center, and the detector
+    columns all lie in the plane of a slice and the detector rows run along
+    the tilt axis, so that any slab of slices can be reconstructed from the
+    same detector rows with the same vectors.
+
+    Args
+    ----------
+    vectors : NumPy array
+        ASTRA parallel3d_vec vectors of shape [nangles, 12] (see
+        get_alignment_vectors)
+    atol : float
+        Absolute tolerance of the comparison
+
+    Returns
+    ----------
+    separate : bool
+        True if the slices can be reconstructed independently
+
+    """
+    vectors = np.asarray(vectors)
+    out_of_plane = vectors[:, [2, 5, 8, 9, 10]]
+    return bool(np.allclose(out_of_plane, 0, atol=atol) and np.allclose(vectors[:, 11], 1, atol=atol))
+
+
+class Astra3DProjector:
+    """
+    Parallel-beam ASTRA projector operating on a slab of slices at once.
+
+    Volumes are of shape [nslices, thickness, ny] and sinograms are of shape
+    [nslices, nangles, ny], which is the native layout of the ASTRA 3D
+    data objects.  Requires CUDA.
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    thickness : int
+        Height of the reconstructed volume
+    nslices : int
+        Number of slices along the tilt axis in the slab
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+    vectors : NumPy array
+        ASTRA parallel3d_vec vectors of each projection (see
+        get_alignment_vectors).  If None, the standard parallel3d geometry
+        is used.
+
+    """
+
+    def __init__(self, thetas, ny, thickness, nslices, roi_y=None, roi_z=None, vectors=None):
+        """Create the ASTRA geometries and projector."""
+        self.thetas = np.asarray(thetas)
+        self.thickness = thickness
+        self.roi_y = roi_y
+        self.roi_z = roi_z
+        self.vectors = vectors
+        z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+        self.vol_shape = (nslices, z1 - z0, y1 - y0)
+        self.sino_shape = (nslices, len(self.thetas), ny)
+        self.vol_geom = get_vol_geom(thickness, ny, roi_y, roi_z, nslices)
+        if vectors is None:
+            self.proj_geom = astra.create_proj_geom("parallel3d", 1.0, 1.0, nslices, ny, self.thetas)
+        else:
+            self.proj_geom = astra.create_proj_geom("parallel3d_vec", nslices, ny, vectors)
+        self.proj_id = astra.create_projector("cuda3d", self.proj_geom, self.vol_geom)
+
+    def forward(self, vol):
+        """Forward project a volume slab into a sinogram slab."""
+        sino = np.zeros(self.sino_shape, np.float32)
+        astra.experimental.direct_FP3D(self.proj_id, np.ascontiguousarray(vol, np.float32), sino)
+        return sino
+
+    def backward(self, sino):
+        """Backproject a sinogram slab into a volume slab."""
+        vol = np.zeros(self.vol_shape, np.float32)
+        astra.experimental.direct_BP3D(self.proj_id, vol, np.ascontiguousarray(sino, np.float32))
+        return vol
+
+    def subset(self, indices):
+        """Return a projector restricted to the projections given by indices."""
+        vectors = None if self.vectors is None else self.vectors[indices]
+        return Astra3DProjector(self.thetas[indices], self.sino_shape[2], self.thickness, self.vol_shape[0],
+                                self.roi_y, self.roi_z, vectors)
+
+    def delete(self):
+        """Free the ASTRA projector."""
+        astra.projector3d.delete(self.proj_id)
+
+
+def get_subset_projectors(projector, nsubsets=None):
+    """
+    Split a projector into the subsets of projections visited by sart_batch.
+
+    Args
+    ----------
+    projector : SparseProjector or Astra3DProjector
+        Projector for the full set of projections
+    nsubsets : int
+        Number of subsets.  If None, each projection is its own subset.
+
+    Returns
+    ----------
+    subsets : list of tuples
+        Projection indices, projector, row sums, and column sums of each
+        subset
+
+    """
+    subsets = []
+    for indices in get_subsets(projector.thetas, nsubsets):
+        sub = projector.subset(indices)
+        row_sums = sub.forward(np.ones(sub.vol_shape, np.float32))[0:1]
+        col_sums = sub.backward(np.ones(sub.sino_shape, np.float32))[0:1]
+        subsets.append((indices, sub, row_sums, col_sums))
+    return subsets
+
+
+def sart_batch(projector, sinos, niterations, constrain=False, thresh=0, rec=None, nsubsets=None,
+               ordering="golden", rng=None, subsets=None):
+    """
+    Run ordered-subsets SART on a slab of sinograms using a batched projector.
+
+    Each iteration is one pass over all subsets of projections (see
+    get_subsets), applying the SIRT update restricted to each subset in
+    turn.  With one projection per subset this is SART.
+
+    Args
+    ----------
+    projector : SparseProjector or Astra3DProjector
+        Projector for the full set of projections
+    sinos : NumPy array
+        Sinograms of shape [nslices, nangles, ny]
+    niterations : int
+        Number of passes over all subsets
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    rec : NumPy array
+        Starting volume.  If None, the reconstruction starts from zero.
+    nsubsets : int
+        Number of subsets.  If None, each projection is its own subset.
+    ordering : str
+        Order in which the subsets are visited (see get_subset_order)
+    rng : NumPy Generator
+        Random number generator for the 'random' ordering
+    subsets : list of tuples
+        Subsets as returned by get_subset_projectors, so that they can be
+        shared between slabs.  If None, they are computed from 'projector'
+        and 'nsubsets'.
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstructed volume of shape [nslices, thickness, ny]
+
+    """
+    if rec is None:
+        rec = np.zeros(projector.vol_shape, np.float32)
+    if subsets is None:
+        subsets = get_subset_projectors(projector, nsubsets)
+    for _ in range(niterations):
+        for k in get_subset_order(len(subsets), ordering, rng):
+            indices, sub, row_sums, col_sums = subsets[k]
+            residual = sinos[:, indices, :] - sub.forward(rec)
+            np.divide(residual, row_sums, out=residual, where=row_sums > 0)
+            update = sub.backward(residual)
+            np.divide(update, col_sums, out=update, where=col_sums > 0)
+            rec += update
+            if constrain:
+                np.maximum(rec, thresh, out=rec)
+    return rec
+
+
+def run_astra3d(sinos, thetas, method, niterations, thickness, constrain=False, thresh=0,
+                filter="shepp-logan", slab_size=128, show_progressbar=True, out=None, roi_y=None, roi_z=None,
+                initial=None, nsubsets=None, ordering="golden", tol=None, check_every=10, iterations=None,
+                tv_weight=1.0, vectors=None):
+    """
+    Reconstruct a tilt series in slabs using the ASTRA 3D parallel geometry.
+
+    Each slab of up to 'slab_size' slices is reconstructed in a single ASTRA
+    call.  The final slab is zero-padded so that the same projector and data
+    objects are reused for every slab.  Requires CUDA.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Tilt series data of shape [nangles, ny, nx]
+    thetas : NumPy array
+        Projection angles in radians
+    method : str
+        Reconstruction algorithm to use.  Must be 'FBP', 'SIRT', 'SART',
+        'CGLS', 'LSQR', or 'TV'
+    niterations : int
+        Number of iterations for the iterative methods
+    thickness : int
+        Height of the reconstructed volume
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    filter : str
+        Filter to use for filtered backprojection
+    slab_size : int
+        Number of slices reconstructed in each call
+    show_progressbar : bool
+        If True, show a progress bar for the reconstruction
+    out : array-like
+        Array of shape [nx, thickness, ny] which receives the reconstruction.
+        If None, a new array is allocated.
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+    initial : array-like
+        Starting volume for SIRT or SART of the same shape as the
+        reconstruction.  If None, each slab starts from zero.
+    nsubsets : int
+        Number of subsets for SART (see sart_batch)
+    ordering : str
+        Order in which the SART subsets are visited (see get_subset_order)
+    tol : float
+        If given, CGLS and LSQR stop iterating each slice once the relative
+        change of its residual norm falls below this value, and TV once its
+        relative primal-dual gap does.
+    check_every : int
+        Number of iterations between residual checks
+    iterations : NumPy array
+        If given, receives the number of CGLS, LSQR, or TV iterations
+        performed for each slice
+    tv_weight : float
+        Weight of the total variation term for TV (see tv_batch)
+    vectors : NumPy array
+        ASTRA parallel3d_vec vectors which apply the alignment of the tilt
+        series (see get_alignment_vectors).  The volume is reconstructed in
+        slabs only if the alignment keeps each slice in its own detector row,
+        i.e. with shifts perpendicular to the tilt axis alone.  Otherwise the
+        alignment couples the slices and the whole volume is reconstructed as
+        a single slab.
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstructed volume of shape [nx, thickness, ny]
+
+    """
+    nangles, ny, nx = sinos.shape
+    slab_size = min(slab_size, nx)
+    if vectors is not None and slab_size < nx and not vectors_separate_slices(vectors):
+        logger.warning("The alignment couples the slices. Reconstructing all %s slices as a single slab "
+                       "instead of slabs of %s slices." % (nx, slab_size))
+        slab_size = nx
+    method = method.lower()
+    if method not in ["fbp", "sirt", "sart", "cgls", "lsqr", "tv"]:
+        raise ValueError("Method %s is not available with the astra3d engine" % method)
+
+    projector = Astra3DProjector(thetas, ny, thickness, slab_size, roi_y, roi_z, vectors)
+    if out is None:
+        rec = np.zeros((nx,) + projector.vol_shape[1:], np.float32)
+    else:
+        rec = out
+
+    if method == "sirt":
+        sino_id = astra.data3d.create("-sino", projector.proj_geom, 0)
+        rec_id = astra.data3d.create("-vol", projector.vol_geom, 0)
+        cfg = astra.astra_dict("SIRT3D_CUDA")
+        cfg["ProjectionDataId"] = sino_id
+        cfg["ReconstructionDataId"] = rec_id
+        if constrain:
+            cfg["option"] = {}
+            cfg["option"]["MinConstraint"] = thresh
+        alg = astra.algorithm.create(cfg)
+    subsets = []
+    if method == "sart":
+        # The subset projectors and their normalizations are shared by all slabs
+        subsets = get_subset_projectors(projector, nsubsets)
+
+    logger.info("Reconstructing with batched CUDA-accelerated %s algorithm (%s slices per slab)"
+                % (method.upper(), slab_size))
+    slab = np.zeros(projector.sino_shape, np.float32)
+    slab_initial = np.zeros(projector.vol_shape, np.float32)
+    try:
+        for start in tqdm.tqdm(range(0, nx, slab_size), disable=not (show_progressbar)):
+            stop = min(start + slab_size, nx)
+            slab[:] = 0
+            slab[0:stop - start] = np.transpose(sinos[:, :, start:stop], [2, 0, 1])
+            slab_initial[:] = 0
+            if initial is not None:
+                slab_initial[0:stop - start] = initial[start:stop]
+            if method == "fbp":
+                filtered = filter_sinograms(slab, filter.lower(), axis=2)
+                slab_rec = projector.backward(filtered) * np.pi / (2 * nangles)
+            elif method == "sirt":
+                astra.data3d.store(sino_id, slab)
+                astra.data3d.store(rec_id, slab_initial)
+                astra.algorithm.run(alg, niterations)
+                slab_rec = astra.data3d.get(rec_id)
+            elif method == "sart":
+                slab_rec = sart_batch(projector, slab, niterations, constrain, thresh, rec=slab_initial,
+                                      ordering=ordering, subsets=subsets)
+            else:
+                if method == "cgls":
+                    solver = cgls_batch
+                elif method == "lsqr":
+                    solver = lsqr_batch
+                else:
+                    solver = partial(tv_batch, tv_weight=tv_weight)
+                slab_iterations = np.zeros(slab_size, int)
+                slab_rec = solver(projector, slab, niterations, constrain=constrain, thresh=thresh,
+                                  rec=slab_initial, tol=tol, check_every=check_every, iterations=slab_iterations)
+                if iterations is not None:
+                    iterations[start:stop] = slab_iterations[0:stop - start]
+            rec[start:stop] = slab_rec[0:stop - start]
+    finally:
+        if method == "sirt":
+            astra.algorithm.delete(alg)
+            astra.data3d.delete([sino_id, rec_id])
+        for _, sub, _, _ in subsets:
+            sub.delete()
+        projector.delete()
+    return rec
+
+
+def backproject(sinos, thetas, thickness, roi_y=None, roi_z=None):
+    """
+    Backproject a batch of sinograms using linear interpolation.
+
+    The geometry matches that of the ASTRA 2D parallel-beam projectors used
+    elsewhere in this module.  For each projection angle the interpolation
+    is expressed as a sparse matrix with two entries per pixel, which is
+    applied to all slices at once.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Sinograms of shape [nangles, ny, nslices]
+    thetas : NumPy array
+        Projection angles in radians
+    thickness : int
+        Height of the reconstructed volume
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+
+    Returns
+    ----------
+    rec : NumPy array
+        Unscaled backprojection of shape [nslices, thickness, ny], or of the
+        shape of the region of interest
+
+    """
+    nangles, ny, nslices = sinos.shape
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+    padded = np.zeros([nangles, ny + 2, nslices], np.float32)
+    padded[:, 1:-1, :] = sinos
+
+    x = np.arange(y0, y1) - ny / 2 + 0.5
+    y = thickness / 2 - np.arange(z0, z1) - 0.5
+    npixels = len(x) * len(y)
+    indptr = np.arange(0, 2 * npixels + 1, 2)
+    rec = np.zeros([npixels, nslices], np.float32)
+    for k, theta in enumerate(thetas):
+        # Detector position of every pixel, offset by one for the zero padding
+        idx = x[np.newaxis, :] * np.cos(theta) + y[:, np.newaxis] * np.sin(theta) + ny / 2 + 0.5
+        idx = np.clip(idx.ravel(), 0, ny + 1)
+        lower = np.minimum(np.floor(idx), ny).astype(np.int32)
+        weight = (idx - lower).astype(np.float32)
+        interp = sparse.csr_matrix((np.stack([1 - weight, weight], 1).ravel(),
+                                    np.stack([lower, lower + 1], 1).ravel(), indptr),
+                                   shape=(npixels, ny + 2))
+        rec += interp @ padded[k]
+    return np.transpose(rec.reshape([len(y), len(x), nslices]), [2, 0, 1])
+
+
+def run_numpy_fbp(sinos, thetas, thickness, filter="shepp-logan", slab_size=128, show_progressbar=True,
+                  out=None, roi_y=None, roi_z=None):
+    """
+    Reconstruct by filtered backprojection implemented in NumPy.
+
+    Does not require ASTRA.  Sinograms are filtered and backprojected in
+    slabs of 'slab_size' slices.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Tilt series data of shape [nangles, ny, nx]
+    thetas : NumPy array
+        Projection angles in radians
+    thickness : int
+        Height of the reconstructed volume
+    filter : str
+        Filter to use for filtered backprojection
+    slab_size : int
+        Number of slices reconstructed at once
+    show_progressbar : bool
+        If True, show a progress bar for the reconstruction
+    out : array-like
+        Array of shape [nx, thickness, ny] which receives the reconstruction.
+        If None, a new array is allocated.
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstructed volume of shape [nx, thickness, ny]
+
+    """
+    nangles, ny, nx = sinos.shape
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+    if out is None:
+        rec = np.zeros([nx, z1 - z0, y1 - y0], np.float32)
+    else:
+        rec = out
+    logger.info("Reconstructing with NumPy FBP algorithm")
+    for start in tqdm.tqdm(range(0, nx, slab_size), disable=not (show_progressbar)):
+        stop = min(start + slab_size, nx)
+        filtered = filter_sinograms(np.asarray(sinos[:, :, start:stop], np.float32), filter.lower(), axis=1)
+        rec[start:stop] = backproject(filtered, thetas, thickness, roi_y, roi_z) * np.pi / (2 * nangles)
+    return rec
+
+
+def get_joseph_matrix(thetas, ny, thickness, roi_y=None, roi_z=None):
+    """
+    Calculate the system matrix of the ASTRA 2D 'linear' projector in NumPy.
+
+    Each ray is traced through the volume with Joseph's method: the volume
+    is stepped through along the rows for projection angles within 45
+    degrees of zero, and along the columns otherwise, and each step
+    contributes the linear interpolation of the two nearest pixels,
+    weighted by the step length.
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    thickness : int
+        Height of the reconstructed volume
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+
+    Returns
+    ----------
+    matrix : SciPy sparse matrix
+        CSR matrix of shape [nangles * ny, thickness * ny], or with as many
+        columns as there are pixels in the region of interest
+
+    """
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+    nrows, ncols = z1 - z0, y1 - y0
+    detector = np.arange(ny) - ny / 2 + 0.5
+    rows, columns, values = [], [], []
+    for k, theta in enumerate(thetas):
+        cos, sin = np.cos(theta), np.sin(theta)
+        by_rows = abs(cos) >= abs(sin)
+        if by_rows:
+            # Column position of each ray in each row of the volume
+            y = thickness / 2 - np.arange(z0, z1) - 0.5
+            position = (detector[:, np.newaxis] - y * sin) / cos + ny / 2 - 0.5 - y0
+            step, size = abs(cos), ncols
+        else:
+            # Row position of each ray in each column of the volume
+            x = np.arange(y0, y1) - ny / 2 + 0.5
+            position = thickness / 2 - 0.5 - z0 - (detector[:, np.newaxis] - x * cos) / sin
+            step, size = abs(sin), nrows
+        lower = np.floor(position)
+        weight = position - lower
+        ray, other = np.meshgrid(k * ny + np.arange(ny), np.arange(position.shape[1]), indexing="ij")
+        for index, interp in [(lower, 1 - weight), (lower + 1, weight)]:
+            valid = (index >= 0) & (index < size)
+            index = index[valid].astype(np.int64)
+            rows.append(ray[valid])
+            if by_rows:
+                columns.append(other[valid] * ncols + index)
+            else:
+                columns.append(index * ncols + other[valid])
+            values.append(interp[valid] / step)
+    return sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                             shape=(len(thetas) * ny, nrows * ncols), dtype=np.float32)
+
+
+def get_system_matrix(thetas, ny, thickness, roi_y=None, roi_z=None):
+    """
+    Calculate the system matrix of the ASTRA 2D 'linear' projector.
+
+    If ASTRA is not installed, the matrix is calculated in NumPy (see
+    get_joseph_matrix).
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    thickness : int
+        Height of the reconstructed volume
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+
+    Returns
+    ----------
+    matrix : SciPy sparse matrix
+        CSR matrix of shape [nangles * ny, thickness * ny], or with as many
+        columns as there are pixels in the region of interest
+
+    """
+    if not has_astra:
+        return get_joseph_matrix(thetas, ny, thickness, roi_y, roi_z)
+    proj_geom = astra.create_proj_geom("parallel", 1.0, ny, thetas)
+    vol_geom = get_vol_geom(thickness, ny, roi_y, roi_z)
+    proj_id = astra.create_projector("linear", proj_geom, vol_geom)
+    matrix_id = astra.projector.matrix(proj_id)
+    matrix = sparse.csr_matrix(astra.matrix.get(matrix_id), dtype=np.float32)
+    astra.matrix.delete(matrix_id)
+    astra.projector.delete(proj_id)
+    return matrix
+
+
+class SparseProjector:
+    """
+    Parallel-beam projector using a cached sparse system matrix.
+
+    The system matrix of the ASTRA 2D 'linear' projector is identical for
+    every slice of a tilt series, so it is built once and applied to a slab
+    of slices as a single sparse-dense matrix product.  Volumes are of shape
+    [nslices, thickness, ny] and sinograms of shape [nslices, nangles, ny],
+    as for Astra3DProjector.
+
+    Args
+    ----------
+    thetas : NumPy array
+        Projection angles in radians
+    ny : int
+        Number of detector pixels perpendicular to the tilt axis
+    thickness : int
+        Height of the reconstructed volume
+    nslices : int
+        Number of slices along the tilt axis in the slab
+    matrix : SciPy sparse matrix
+        System matrix of shape [nangles * ny, thickness * ny].  If None,
+        it is computed by ASTRA or taken from the geometry cache.
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+
+    """
+
+    def __init__(self, thetas, ny, thickness, nslices, matrix=None, roi_y=None, roi_z=None):
+        """Build or store the system matrix."""
+        self.thetas = np.asarray(thetas)
+        self.thickness = thickness
+        self.roi_y = roi_y
+        self.roi_z = roi_z
+        z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+        self.vol_shape = (nslices, z1 - z0, y1 - y0)
+        self.sino_shape = (nslices, len(self.thetas), ny)
+        if matrix is None:
+            key = geometry_key("matrix", self.thetas, ny, thickness, "linear", roi=(z0, z1, y0, y1))
+            matrix = geometry_cache.get(key, lambda: get_system_matrix(self.thetas, ny, thickness, roi_y, roi_z))
+        if matrix.format != "csr" or matrix.dtype != np.float32:
+            matrix = sparse.csr_matrix(matrix, dtype=np.float32)
+        self.matrix = matrix
+        self._matrix_t = None
+
+    @property
+    def matrix_t(self):
+        """Transpose of the system matrix, computed when first needed."""
+        if self._matrix_t is None:
+            self._matrix_t = self.matrix.T.tocsr()
+        return self._matrix_t
+
+    def forward(self, vol):
+        """Forward project a volume slab into a sinogram slab of float32, or float64 for float64 input."""
+        nslices = vol.shape[0]
+        sino = self.matrix @ np.reshape(vol, [nslices, -1]).T
+        dtype = np.result_type(vol, np.float32)
+        return np.ascontiguousarray(sino.T, dtype).reshape([nslices, self.sino_shape[1], self.sino_shape[2]])
+
+    def backward(self, sino):
+        """Backproject a sinogram slab into a volume slab of float32, or float64 for float64 input."""
+        nslices = sino.shape[0]
+        vol = self.matrix_t @ np.reshape(sino, [nslices, -1]).T
+        dtype = np.result_type(sino, np.float32)
+        return np.ascontiguousarray(vol.T, dtype).reshape([nslices, self.vol_shape[1], self.vol_shape[2]])
+
+    def subset(self, indices):
+        """Return a projector restricted to the projections given by indices."""
+        ny = self.sino_shape[2]
+        rows = (ny * np.asarray(indices)[:, np.newaxis] + np.arange(ny)).ravel()
+        return SparseProjector(self.thetas[indices], ny, self.thickness, self.vol_shape[0],
+                               matrix=self.matrix[rows], roi_y=self.roi_y, roi_z=self.roi_z)
+
+
+def forward_project(vol, thetas, cuda=False, slab_size=128, ncores=None, show_progressbar=False):
+    """
+    Forward project a reconstructed volume into a tilt series.
+
+    The volume is projected in slabs of slices with a single projector,
+    either the ASTRA 3D projector on the GPU or the cached sparse system
+    matrix on the CPU.  On the CPU, the slabs are projected by a pool of
+    threads sharing the system matrix.
+
+    Args
+    ----------
+    vol : NumPy array or array-like
+        Volume of shape [nx, thickness, ny]
+    thetas : NumPy array
+        Projection angles in radians
+    cuda : boolean
+        If True, use the CUDA-accelerated ASTRA 3D projector
+    slab_size : int
+        Maximum number of slices projected at once. Default is 128.
+    ncores : int
+        Number of threads for the CPU projection.  If None, 90% of the
+        available cores are used.
+    show_progressbar : bool
+        If True, show a progress bar. Default is False.
+
+    Returns
+    ----------
+    proj : NumPy array
+        Tilt series of shape [nangles, ny, nx] of float32
+
+    """
+    nx, thickness, ny = vol.shape
+    thetas = np.asarray(thetas)
+    proj = np.zeros([len(thetas), ny, nx], np.float32)
+    if cuda:
+        ncores = 1
+    elif ncores is None:
+        ncores = max(1, int(0.9 * mp.cpu_count()))
+    # Split the slices evenly over the threads so that all of them are busy
+    slab_size = max(1, min(slab_size, -(-nx // ncores)))
+    if cuda:
+        projector = Astra3DProjector(thetas, ny, thickness, slab_size)
+    else:
+        projector = SparseProjector(thetas, ny, thickness, slab_size)
+
+    def project_slab(start):
+        stop = min(start + slab_size, nx)
+        slab = np.zeros(projector.vol_shape, np.float32)
+        slab[0:stop - start] = vol[start:stop]
+        proj[:, :, start:stop] = np.transpose(projector.forward(slab)[0:stop - start], [1, 2, 0])
+
+    starts = range(0, nx, slab_size)
+    try:
+        with ThreadPoolExecutor(ncores) as executor:
+            for _ in tqdm.tqdm(executor.map(project_slab, starts), total=len(starts),
+                               disable=not (show_progressbar)):
+                pass
+    finally:
+        if cuda:
+            projector.delete()
+    return proj
+
+
+def sirt_batch(projector, sinos, niterations, constrain=False, thresh=0, rec=None):
+    """
+    Run SIRT on a slab of sinograms using a batched projector.
+
+    Matches the ASTRA SIRT update, in which the residual is weighted by the
+    inverse row sums and the update by the inverse column sums of the
+    system matrix.
+
+    Args
+    ----------
+    projector : SparseProjector or Astra3DProjector
+        Projector for the full set of projections
+    sinos : NumPy array
+        Sinograms of shape [nslices, nangles, ny]
+    niterations : int
+        Number of iterations to perform
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    rec : NumPy array
+        Starting volume.  If None, the reconstruction starts from zero.
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstructed volume of shape [nslices, thickness, ny]
+
+    """
+    if rec is None:
+        rec = np.zeros(projector.vol_shape, np.float32)
+    row_sums = projector.forward(np.ones(projector.vol_shape, np.float32))[0:1]
+    col_sums = projector.backward(np.ones(projector.sino_shape, np.float32))[0:1]
+    for _ in range(niterations):
+        residual = sinos - projector.forward(rec)
+        np.divide(residual, row_sums, out=residual, where=row_sums > 0)
+        update = projector.backward(residual)
+        np.divide(update, col_sums, out=update, where=col_sums > 0)
+        rec += update
+        if constrain:
+            np.maximum(rec, thresh, out=rec)
+    return rec
+
+
+def _slice_norm(a):
+    """Return the norm of each slice of a slab of shape [nslices, ...]."""
+    return np.sqrt(np.sum(np.square(a, dtype=np.float64), axis=tuple(range(1, a.ndim))))
+
+
+def _safe_divide(a, b):
+    """Divide a by b, giving zero wherever b is zero."""
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape), where=b != 0)
+
+
+def cgls_batch(projector, sinos, niterations, constrain=False, thresh=0, rec=None, tol=None, check_every=10,
+               iterations=None):
+    """
+    Run CGLS on a slab of sinograms using a batched projector.
+
+    Conjugate gradient least squares is run independently for each slice,
+    with the step sizes of all slices computed at once.  Slices stop
+    iterating once the relative change of their residual norm between two
+    checks falls below 'tol'.  The iterations are carried out in double
+    precision, as the Krylov recurrences lose accuracy quickly in single
+    precision.
+
+    Args
+    ----------
+    projector : SparseProjector or Astra3DProjector
+        Projector for the full set of projections
+    sinos : NumPy array
+        Sinograms of shape [nslices, nangles, ny]
+    niterations : int
+        Maximum number of iterations to perform
+    constrain : boolean
+        If True, the final reconstruction is clipped below at 'thresh'.  The
+        iterations themselves are unconstrained.
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    rec : NumPy array
+        Starting volume.  If None, the reconstruction starts from zero.
+    tol : float
+        Relative change of the residual norm below which a slice stops.  If
+        None, all 'niterations' iterations are performed.
+    check_every : int
+        Number of iterations between residual checks
+    iterations : NumPy array
+        If given, receives the number of iterations performed for each slice
 
     Returns
     ----------
-    Numpy array
-        Reconstruction of input sinogram
+    rec : NumPy array
+        Reconstructed volume of shape [nslices, thickness, ny]
 
     """
-    astra.data2d.store(sino_id, sino)
-    astra.algorithm.run(alg_id, iters)
-    return astra.data2d.get(rec_id)
+    nslices = sinos.shape[0]
+    if rec is None:
+        rec = np.zeros(projector.vol_shape, np.float32)
+    x = rec.astype(np.float64)
+    residual = sinos - projector.forward(x)
+    grad = projector.backward(residual)
+    direction = grad.copy()
+    gamma = _slice_norm(grad) ** 2
+    res_prev = _slice_norm(residual)
+    active = gamma > 0
+    slice_iterations = np.zeros(nslices, int)
+    for i in range(niterations):
+        if not np.any(active):
+            break
+        q = projector.forward(direction)
+        alpha = np.where(active, _safe_divide(gamma, _slice_norm(q) ** 2), 0)[:, np.newaxis, np.newaxis]
+        x += alpha * direction
+        residual -= alpha * q
+        grad = projector.backward(residual)
+        gamma_new = _slice_norm(grad) ** 2
+        beta = _safe_divide(gamma_new, gamma)[:, np.newaxis, np.newaxis]
+        direction = grad + beta * direction
+        gamma = gamma_new
+        slice_iterations[active] += 1
+        active &= gamma > 0
+        if tol is not None and (i + 1) % check_every == 0:
+            res = _slice_norm(residual)
+            active &= np.abs(res_prev - res) >= tol * res_prev
+            res_prev = res
+    rec[:] = x
+    if constrain:
+        np.maximum(rec, thresh, out=rec)
+    if iterations is not None:
+        iterations[:] = slice_iterations
+    return rec
 
 
-def run_dart(sino, iters, dart_iters, p,
-             alg_id, proj_id, mask_id, rec_id, sino_id,
-             thresholds, gray_levels):
+def lsqr_batch(projector, sinos, niterations, constrain=False, thresh=0, rec=None, tol=None, check_every=10,
+               iterations=None):
     """
-    Run discrete algebraic reoncsturction technique (DART) algorithm.
+    Run LSQR on a slab of sinograms using a batched projector.
 
-    Adapted from pseudo-code published in:
-    K. J. Batenburg and J. Sijbers, "DART: A Practical Reconstruction
-    Algorithm for Discrete Tomography," doi: 10.1109/TIP.2011.2131661.
+    The Golub-Kahan bidiagonalization of Paige and Saunders is run
+    independently for each slice, with the scalar recurrences of all
+    slices computed at once.  The residual norm is taken from the
+    recurrence, so early stopping needs no extra projections.  As for
+    cgls_batch, the iterations are carried out in double precision.
 
     Args
     ----------
-    sino : NumPy array
-       Sinogram of shape (nangles, ny)
-    iters : int
-        Number of iterations for the SART reconstruction
-    dart_iters : int
-        Number of iterations for the DART reconstruction
-    p : float
-        Probability for free pixel determination
-    alg_id : int
-        ASTRA algorithm identity
-    proj_id : int
-        ASTRA projector identity
-    mask_id : boolean
-        ASTRA mask identity
-    rec_id : boolean
-        ASTRA reconstruction identity
-    sino_id : int
-        ASTRA sinogram identity
-    thresholds : list or NumPy array
-        Thresholds for DART reconstruction
-    gray_levels : list or NumPy array
-        Gray levels for DART reconstruction
+    projector : SparseProjector or Astra3DProjector
+        Projector for the full set of projections
+    sinos : NumPy array
+        Sinograms of shape [nslices, nangles, ny]
+    niterations : int
+        Maximum number of iterations to perform
+    constrain : boolean
+        If True, the final reconstruction is clipped below at 'thresh'.  The
+        iterations themselves are unconstrained.
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    rec : NumPy array
+        Starting volume.  If None, the reconstruction starts from zero.
+    tol : float
+        Relative change of the residual norm below which a slice stops.  If
+        None, all 'niterations' iterations are performed.
+    check_every : int
+        Number of iterations between residual checks
+    iterations : NumPy array
+        If given, receives the number of iterations performed for each slice
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstructed volume of shape [nslices, thickness, ny]
+
+    """
+    nslices = sinos.shape[0]
+    if rec is None:
+        rec = np.zeros(projector.vol_shape, np.float32)
+    x = rec.astype(np.float64)
+    u = sinos - projector.forward(x)
+    beta = _slice_norm(u)
+    u = _safe_divide(u, beta[:, np.newaxis, np.newaxis])
+    v = projector.backward(u)
+    alpha = _slice_norm(v)
+    v = _safe_divide(v, alpha[:, np.newaxis, np.newaxis])
+    w = v.copy()
+    phibar = beta
+    rhobar = alpha
+    res_prev = phibar
+    active = (beta > 0) & (alpha > 0)
+    slice_iterations = np.zeros(nslices, int)
+    for i in range(niterations):
+        if not np.any(active):
+            break
+        u = projector.forward(v) - alpha[:, np.newaxis, np.newaxis] * u
+        beta = _slice_norm(u)
+        u = _safe_divide(u, beta[:, np.newaxis, np.newaxis])
+        v = projector.backward(u) - beta[:, np.newaxis, np.newaxis] * v
+        alpha = _slice_norm(v)
+        v = _safe_divide(v, alpha[:, np.newaxis, np.newaxis])
+
+        rho = np.hypot(rhobar, beta)
+        c = _safe_divide(rhobar, rho)
+        s = _safe_divide(beta, rho)
+        theta = s * alpha
+        rhobar = -c * alpha
+        phi = c * phibar
+        phibar = s * phibar
+
+        step = np.where(active, _safe_divide(phi, rho), 0)[:, np.newaxis, np.newaxis]
+        x += step * w
+        w = v - _safe_divide(theta, rho)[:, np.newaxis, np.newaxis] * w
+        slice_iterations[active] += 1
+        active &= (phibar > 0) & (alpha > 0)
+        if tol is not None and (i + 1) % check_every == 0:
+            active &= np.abs(res_prev - phibar) >= tol * res_prev
+            res_prev = phibar
+    rec[:] = x
+    if constrain:
+        np.maximum(rec, thresh, out=rec)
+    if iterations is not None:
+        iterations[:] = slice_iterations
+    return rec
+
+
+def tv_gradient(vol):
+    """
+    Compute the forward-difference gradient of each slice of a volume slab.
 
+    Args
+    ----------
+    vol : NumPy array
+        Volume of shape [nslices, thickness, ny]
 
     Returns
     ----------
-    Numpy array
-        Reconstruction of input sinogram
+    grad : NumPy array
+        Gradient of shape [2, nslices, thickness, ny] with the differences
+        along the thickness and the width.  The last difference along
+        each axis is zero.
 
     """
-    thickness, ny = astra.data2d.get(rec_id).shape
-    astra.data2d.store(sino_id, sino)
-    astra.data2d.store(rec_id, np.zeros([thickness, ny]))
-    astra.data2d.store(mask_id, np.ones([thickness, ny]))
-    astra.algorithm.run(alg_id, iters)
-    curr_rec = astra.data2d.get(rec_id)
-    dart_rec = copy.deepcopy(curr_rec)
-    for j in range(dart_iters):
-        segmented = dart_segment(dart_rec, thresholds, gray_levels)
-        boundary = get_dart_boundaries(segmented)
-
-        # Define free and fixed pixels
-        free = np.random.rand(*dart_rec.shape)
-        free = free < 1 - p
-        free = np.logical_or(boundary, free)
-        fixed = ~free
-        free_idx = np.where(free)
-        fixed_idx = np.where(fixed)
-
-        # Set fixed pixels to segmented values
-        dart_rec[fixed_idx[0], fixed_idx[1]] = segmented[fixed_idx[0], fixed_idx[1]]
-
-        # Calculate sinogram of free pixels
-        fixed_rec = copy.deepcopy(dart_rec)
-        fixed_rec[free_idx[0], free_idx[1]] = 0
-        _, fixed_sino = astra.creators.create_sino(fixed_rec, proj_id)
-        free_sino = sino - fixed_sino
-
-        # Run SART reconstruction on free sinogram with free pixel mask
-        astra.data2d.store(rec_id, dart_rec)
-        astra.data2d.store(mask_id, free)
-        astra.data2d.store(sino_id, free_sino)
-        astra.algorithm.run(alg_id, iters)
-        dart_rec = astra.data2d.get(rec_id)
+    grad = np.zeros((2,) + vol.shape, vol.dtype)
+    grad[0, :, :-1] = vol[:, 1:] - vol[:, :-1]
+    grad[1, :, :, :-1] = vol[:, :, 1:] - vol[:, :, :-1]
+    return grad
+
+
+def tv_divergence(grad):
+    """
+    Compute the divergence of a gradient field, the negative adjoint of tv_gradient.
+
+    Args
+    ----------
+    grad : NumPy array
+        Gradient field of shape [2, nslices, thickness, ny]
+
+    Returns
+    ----------
+    div : NumPy array
+        Divergence of shape [nslices, thickness, ny]
+
+    """
+    div = np.zeros(grad.shape[1:], grad.dtype)
+    div[:, :-1] += grad[0, :, :-1]
+    div[:, 1:] -= grad[0, :, :-1]
+    div[:, :, :-1] += grad[1, :, :, :-1]
+    div[:, :, 1:] -= grad[1, :, :, :-1]
+    return div
+
+
+def tv_batch(projector, sinos, niterations, tv_weight=1.0, constrain=False, thresh=0, rec=None, tol=None,
+             check_every=10, iterations=None):
+    """
+    Run total variation regularized reconstruction on a slab of sinograms.
+
+    Minimizes 0.5 * ||Ax - b||^2 + tv_weight * TV(x) for each slice, where
+    TV is the isotropic total variation, using the preconditioned
+    primal-dual algorithm of Chambolle and Pock.  The step sizes are the
+    inverse row and column sums of the system matrix and of the gradient
+    operator, as in SIRT, so no operator norm is required.
+
+    T. Pock and A. Chambolle, "Diagonal preconditioning for first order
+    primal-dual algorithms in convex optimization," doi: 10.1109/ICCV.2011.6126441.
+
+    Slices stop iterating once their relative primal-dual gap falls below
+    'tol'.  The gap is the conditional primal-dual gap of E. Y. Sidky, J. H.
+    Jorgensen, and X. Pan, doi: 10.1088/0031-9155/57/10/3065, which tends
+    to zero as the iterations converge.
+
+    Args
+    ----------
+    projector : SparseProjector or Astra3DProjector
+        Projector for the full set of projections
+    sinos : NumPy array
+        Sinograms of shape [nslices, nangles, ny]
+    niterations : int
+        Maximum number of iterations to perform
+    tv_weight : float
+        Weight of the total variation term.  It scales with the intensity
+        of the projection data.
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    rec : NumPy array
+        Starting volume.  If None, the reconstruction starts from zero.
+    tol : float
+        Relative primal-dual gap below which a slice stops.  If None, all
+        'niterations' iterations are performed.
+    check_every : int
+        Number of iterations between checks of the primal-dual gap
+    iterations : NumPy array
+        If given, receives the number of iterations performed for each slice
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstructed volume of shape [nslices, thickness, ny]
+
+    """
+    nslices = sinos.shape[0]
+    if rec is None:
+        rec = np.zeros(projector.vol_shape, np.float32)
+    row_sums = projector.forward(np.ones(projector.vol_shape, np.float32))[0:1]
+    col_sums = projector.backward(np.ones(projector.sino_shape, np.float32))[0:1]
+    sigma = np.divide(1, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)
+    # Each pixel enters at most four differences and each difference two pixels
+    tau = 1 / (col_sums + 4)
+    sigma_grad = 0.5
+
+    x = rec.astype(np.float32)
+    x_bar = x.copy()
+    dual_sino = np.zeros(projector.sino_shape, np.float32)
+    dual_grad = np.zeros((2,) + projector.vol_shape, np.float32)
+    active = np.any(sinos, axis=(1, 2))
+    slice_iterations = np.zeros(nslices, int)
+    for i in range(niterations):
+        if not np.any(active):
+            break
+        dual_sino += sigma * (projector.forward(x_bar) - sinos)
+        dual_sino /= 1 + sigma
+        dual_grad += sigma_grad * tv_gradient(x_bar)
+        dual_grad /= np.maximum(np.sqrt(np.sum(np.square(dual_grad), 0)) / tv_weight, 1)
+        adjoint = projector.backward(dual_sino) - tv_divergence(dual_grad)
+        step = np.where(active[:, np.newaxis, np.newaxis], tau, 0)
+        x_new = x - step * adjoint
+        if constrain:
+            np.maximum(x_new, thresh, out=x_new)
+        x_bar = 2 * x_new - x
+        x = x_new
+        slice_iterations[active] += 1
+        if tol is not None and (i + 1) % check_every == 0:
+            residual = projector.forward(x) - sinos
+            tv = np.sum(np.sqrt(np.sum(np.square(tv_gradient(x)), 0)), axis=(1, 2), dtype=np.float64)
+            primal = 0.5 * _slice_norm(residual) ** 2 + tv_weight * tv
+            dual = -0.5 * _slice_norm(dual_sino) ** 2 - np.sum(dual_sino * sinos, axis=(1, 2), dtype=np.float64)
+            if constrain:
+                dual -= thresh * np.sum(np.minimum(-adjoint, 0), axis=(1, 2), dtype=np.float64)
+            active &= np.abs(primal - dual) >= tol * np.abs(primal)
+    rec[:] = x
+    if iterations is not None:
+        iterations[:] = slice_iterations
+    return rec
+
+
+def run_matrix(sinos, thetas, method, niterations, thickness, constrain=False, thresh=0,
+               slab_size=128, show_progressbar=True, out=None, tol=None, check_every=10,
+               iterations=None, roi_y=None, roi_z=None, initial=None, nsubsets=None, ordering="golden",
+               tv_weight=1.0):
+    """
+    Reconstruct a tilt series in slabs using a cached sparse system matrix.
+
+    The system matrix is built once for the acquisition geometry and each
+    slab of up to 'slab_size' slices is reconstructed with sparse-dense
+    matrix products.  The final slab is zero-padded.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Tilt series data of shape [nangles, ny, nx]
+    thetas : NumPy array
+        Projection angles in radians
+    method : str
+        Reconstruction algorithm to use.  Must be 'SIRT', 'SART', 'CGLS',
+        'LSQR', or 'TV'
+    niterations : int
+        Number of iterations
+    thickness : int
+        Height of the reconstructed volume
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    slab_size : int
+        Number of slices reconstructed at once
+    show_progressbar : bool
+        If True, show a progress bar for the reconstruction
+    out : array-like
+        Array of shape [nx, thickness, ny] which receives the reconstruction.
+        If None, a new array is allocated.
+    tol : float
+        If given, each slice stops once the relative change of its residual
+        norm falls below this value.  'niterations' is then the maximum
+        number of iterations.
+    check_every : int
+        Number of iterations between residual checks
+    iterations : NumPy array
+        If given, receives the number of iterations performed for each slice
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct.
+        If None, the full thickness is reconstructed.
+    initial : array-like
+        Starting volume of the same shape as the reconstruction.  If None,
+        each slab starts from zero.
+    nsubsets : int
+        Number of subsets for SART (see sart_batch)
+    ordering : str
+        Order in which the SART subsets are visited (see get_subset_order)
+    tv_weight : float
+        Weight of the total variation term for TV (see tv_batch)
+
+    Returns
+    ----------
+    rec : NumPy array
+        Reconstructed volume of shape [nx, thickness, ny]
 
-        # Smooth reconstruction
-        if j < dart_iters - 1:
-            smooth = gaussian_filter(dart_rec, sigma=1)
-            curr_rec[free_idx[0], free_idx[1]] = smooth[free_idx[0], free_idx[1]]
+    """
+    nangles, ny, nx = sinos.shape
+    slab_size = min(slab_size, nx)
+    method = method.lower()
+    if method not in ["sirt", "sart", "cgls", "lsqr", "tv"]:
+        raise ValueError("Method %s is not available with the matrix engine" % method)
+    if method == "sirt":
+        solver = sirt_batch
+    elif method == "sart":
+        solver = partial(sart_batch, ordering=ordering)
+    elif method == "cgls":
+        solver = cgls_batch
+    elif method == "lsqr":
+        solver = lsqr_batch
+    else:
+        solver = partial(tv_batch, tv_weight=tv_weight)
+
+    projector = SparseProjector(thetas, ny, thickness, slab_size, roi_y=roi_y, roi_z=roi_z)
+    if method == "sart":
+        # The subset matrices and their normalizations are shared by all slabs
+        solver = partial(solver, subsets=get_subset_projectors(projector, nsubsets))
+    if out is None:
+        rec = np.zeros((nx,) + projector.vol_shape[1:], np.float32)
+    else:
+        rec = out
+
+    logger.info("Reconstructing with sparse matrix %s algorithm (%s slices per slab)"
+                % (method.upper(), slab_size))
+    slab = np.zeros(projector.sino_shape, np.float32)
+    for start in tqdm.tqdm(range(0, nx, slab_size), disable=not (show_progressbar)):
+        stop = min(start + slab_size, nx)
+        slab[:] = 0
+        slab[0:stop - start] = np.transpose(sinos[:, :, start:stop], [2, 0, 1])
+        slab_rec = np.zeros(projector.vol_shape, np.float32)
+        if initial is not None:
+            slab_rec[0:stop - start] = initial[start:stop]
+        if method in ["cgls", "lsqr", "tv"]:
+            # These solvers check for convergence themselves
+            slab_iterations = np.zeros(slab_size, int)
+            slab_rec = solver(projector, slab, niterations, constrain=constrain, thresh=thresh, rec=slab_rec,
+                              tol=tol, check_every=check_every, iterations=slab_iterations)
+            slab_iterations = slab_iterations[0:stop - start]
+        elif tol is None:
+            slab_rec = solver(projector, slab, niterations, constrain, thresh, rec=slab_rec)
+            slab_iterations = niterations
         else:
-            curr_rec = dart_rec
-    return curr_rec
+            slab_iterations = np.zeros(slab_size, int)
+            res_prev = np.full(slab_size, np.inf)
+            # Empty slices, including the zero padding, are never iterated
+            active = np.any(slab, axis=(1, 2))
+            while np.any(active) and slab_iterations.max() < niterations:
+                n = min(check_every, niterations - slab_iterations.max())
+                slab_rec[active] = solver(projector, slab[active], n, constrain, thresh, rec=slab_rec[active])
+                slab_iterations[active] += n
+                res = np.linalg.norm(projector.forward(slab_rec[active]) - slab[active], axis=(1, 2))
+                prev = res_prev[active]
+                done = (res == 0) | (np.isfinite(prev) & (np.abs(prev - res) < tol * np.where(np.isfinite(prev), prev, 0)))
+                res_prev[active] = res
+                active[np.flatnonzero(active)[done]] = False
+            slab_iterations = slab_iterations[0:stop - start]
+        if iterations is not None:
+            iterations[start:stop] = slab_iterations
+        rec[start:stop] = slab_rec[0:stop - start]
+    return rec
+
+
+def bin_sinograms(sinos, factor):
+    """
+    Bin tilt series data along the detector axis for a coarse reconstruction.
+
+    Groups of 'factor' detector pixels are averaged, trimming the remainder
+    evenly from both edges, and the result is divided by 'factor' so that a
+    reconstruction on the coarse grid has the same intensity scale as one
+    on the full grid.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Tilt series data of shape [nangles, ny, nx]
+    factor : int
+        Binning factor
+
+    Returns
+    ----------
+    binned : NumPy array
+        Binned tilt series of shape [nangles, ny // factor, nx]
+
+    """
+    nangles, ny, nx = sinos.shape
+    nbins = ny // factor
+    start = (ny - nbins * factor) // 2
+    binned = np.asarray(sinos[:, start:start + nbins * factor, :], np.float32)
+    return binned.reshape([nangles, nbins, factor, nx]).sum(2) / factor ** 2
+
+
+def upsample_volume(rec, factor, shape):
+    """
+    Upsample a coarse reconstruction onto a finer grid.
+
+    Each slice is linearly interpolated by 'factor' and the result is
+    centered in the output, with the edge values repeated to fill the
+    pixels trimmed by bin_sinograms.
+
+    Args
+    ----------
+    rec : NumPy array
+        Coarse reconstruction of shape [nx, thickness, ny]
+    factor : int
+        Upsampling factor
+    shape : tuple
+        Shape (thickness, ny) of the slices on the finer grid
+
+    Returns
+    ----------
+    upsampled : NumPy array
+        Reconstruction of shape [nx, shape[0], shape[1]]
+
+    """
+    upsampled = zoom(rec, (1, factor, factor), order=1, mode="nearest", grid_mode=True)
+    pad = [(0, 0)]
+    for size, target in zip(upsampled.shape[1:], shape):
+        pad.append(((target - size) // 2, target - size - (target - size) // 2))
+    return np.pad(upsampled, pad, mode="edge").astype(np.float32)
+
+
+def run_multigrid(sinos, thetas, method, levels, niterations, thickness, constrain=False, thresh=0,
+                  cuda=False, ncores=None, show_progressbar=True, engine="astra", slab_size=128,
+                  chunk_size=64, roi_y=None, roi_z=None, nsubsets=None, ordering="golden", tv_weight=1.0):
+    """
+    Compute a starting volume by coarse-to-fine reconstruction.
+
+    The sinograms are binned by each factor in 'levels' in turn and
+    reconstructed, starting each level from the upsampled result of the
+    previous one.  The result of the finest level is upsampled to the full
+    resolution and cropped to the region of interest.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Tilt series data of shape [nangles, ny, nx]
+    thetas : NumPy array
+        Projection angles in radians
+    method : str
+        Reconstruction algorithm to use.  Must be 'SIRT', 'SART', 'CGLS',
+        'LSQR', or 'TV'
+    levels : list
+        Binning factors in decreasing order.  Each factor must be a
+        multiple of the next one.
+    niterations : int or list
+        Number of iterations for each level
+    thickness : int
+        Height of the full resolution reconstruction
+    constrain : boolean
+        If True, constrain the reconstruction above the value given by 'thresh'
+    thresh : integer or float
+        Value above which to constrain the reconstructed data
+    cuda : boolean
+        If True, use the CUDA-accelerated Astra algorithms
+    ncores : int
+        Number of cores to use for multithreaded CPU-based reconstructions
+    show_progressbar : bool
+        If True, show a progress bar for each level
+    engine : str
+        Reconstruction engine used for each level (see run)
+    slab_size : int
+        Number of slices per slab for the 'astra3d' and 'matrix' engines
+    chunk_size : int
+        Number of slices held in memory at one time by the multi-core CPU
+        reconstruction
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis of the
+        full resolution reconstruction
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction of the full
+        resolution reconstruction
+    nsubsets : int
+        Number of subsets for SART (see OrderedSubsets)
+    ordering : str
+        Order in which the SART subsets are visited (see get_subset_order)
+    tv_weight : float
+        Weight of the total variation term for TV (see tv_batch)
+
+    Returns
+    ----------
+    initial : NumPy array
+        Starting volume for the full resolution reconstruction
+
+    """
+    nangles, ny, nx = sinos.shape
+    levels = [int(i) for i in levels]
+    if np.isscalar(niterations):
+        niterations = [niterations] * len(levels)
+    if len(niterations) != len(levels):
+        raise ValueError("Number of multigrid iterations (%s) does not match the number of levels (%s)"
+                         % (len(niterations), len(levels)))
+    for coarse, fine in zip(levels, levels[1:] + [1]):
+        if fine < 1 or coarse <= fine or coarse % fine != 0:
+            raise ValueError("Multigrid levels must decrease and each must be a multiple of the next: %s"
+                             % levels)
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+
+    rec = None
+    previous = None
+    for factor, n in zip(levels, niterations):
+        binned = bin_sinograms(sinos, factor)
+        shape = (thickness // factor, binned.shape[1])
+        if rec is not None:
+            rec = upsample_volume(rec, previous // factor, shape)
+        logger.info("Multigrid level with %sx binning (%s iterations)" % (factor, n))
+        rec = run_sinograms(binned, thetas, method, n, constrain, thresh, cuda, shape[0], ncores,
+                            show_progressbar=show_progressbar, engine=engine, slab_size=slab_size,
+                            chunk_size=chunk_size, initial=rec, nsubsets=nsubsets, ordering=ordering,
+                            tv_weight=tv_weight)
+        previous = factor
+    return upsample_volume(rec, previous, (thickness, ny))[:, z0:z1, y0:y1]
+
+
+def create_output_volume(filename, shape, chunk_size=1):
+    """
+    Create an on-disk array to receive a reconstruction.
+
+    The format is chosen from the file extension: '.hdf5' or '.h5' creates
+    an HDF5 dataset named 'reconstruction', '.zarr' creates a Zarr array
+    (requires the zarr package), '.npy' creates a NumPy memmap with a .npy
+    header, and any other extension creates a raw NumPy memmap.
+
+    Args
+    ----------
+    filename : str
+        Name of the file to create.  Existing files are overwritten.
+    shape : list or tuple
+        Shape of the reconstruction [nx, thickness, ny]
+    chunk_size : int
+        Number of slices per chunk for HDF5 and Zarr output. Default is 1.
+
+    Returns
+    ----------
+    out : array-like
+        Writable float32 array of the requested shape.  The file of an HDF5
+        dataset stays open and must be closed by the caller with
+        out.file.close() once the reconstruction is written.
+
+    """
+    shape = tuple(int(i) for i in shape)
+    chunks = (min(chunk_size, shape[0]),) + shape[1:]
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in [".hdf5", ".h5"]:
+        h5file = h5py.File(filename, "w")
+        out = h5file.create_dataset("reconstruction", shape=shape, dtype=np.float32, chunks=chunks)
+    elif ext == ".zarr":
+        if not has_zarr:
+            raise ValueError("The zarr package is required for Zarr output")
+        out = zarr.open(filename, mode="w", shape=shape, chunks=chunks, dtype=np.float32)
+    elif ext == ".npy":
+        out = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float32, shape=shape)
+    else:
+        out = np.memmap(filename, mode="w+", dtype=np.float32, shape=shape)
+    return out
 
 
 def run(stack, method, niterations=20, constrain=None, thresh=0, cuda=None, thickness=None, ncores=None,
-        filter="shepp-logan", gray_levels=None, dart_iterations=None, p=0.99, show_progressbar=True):
+        filter="shepp-logan", gray_levels=None, dart_iterations=None, p=0.99, show_progressbar=True,
+        engine="astra", slab_size=128, out=None, chunk_size=64, tol=None, max_iterations=None, check_every=10,
+        seed=None, slices=None, roi_y=None, roi_z=None, initial=None, multigrid=None, multigrid_iterations=None,
+        nsubsets=None, ordering="golden", tv_weight=1.0, aligned_geometry=False, iterations_out=None):
     """
     Perform reconstruction of input tilt series.
 
@@ -145,7 +2551,9 @@ def run(stack, method, niterations=20, constrain=None, thresh=0, cuda=None, thic
        TomoStack containing the input tilt series
     method : string
         Reconstruction algorithm to use.  Must be either 'FBP' (default), 'SIRT',
-        'SART', or 'DART
+        'SART', 'DART', 'CGLS', 'LSQR', or 'TV'.  CGLS, LSQR, and TV are run
+        on slabs of slices with the 'matrix' engine, or with the 'astra3d'
+        engine if CUDA is used.
     niterations : integer
         Number of iterations for reconstruction
     constrain : boolean
@@ -170,31 +2578,247 @@ def run(stack, method, niterations=20, constrain=None, thresh=0, cuda=None, thic
         Probability for setting free pixels in DART reconstruction
     show_progressbar : bool
         If True, show a progress bar for the reconstruction. Default is True.
+    engine : str
+        Reconstruction engine.  'astra' (default) reconstructs one sinogram
+        at a time using the ASTRA 2D algorithms.  'astra3d' reconstructs
+        slabs of slices in a single call using the ASTRA 3D parallel-beam
+        geometry (requires CUDA).  'numpy' performs FBP without ASTRA.
+        'matrix' performs SIRT or SART on slabs of slices using a sparse
+        system matrix which is computed once for all slices.
+    slab_size : int
+        Number of slices per slab for the 'astra3d', 'numpy', and 'matrix'
+        engines. Default is 128.
+    out : array-like
+        Array of shape [nx, thickness, ny] into which the slices are written
+        as they are reconstructed, e.g. a NumPy memmap or an HDF5 or Zarr
+        dataset (see create_output_volume).  If None, a new array is allocated.
+    chunk_size : int
+        Number of slices held in memory at one time by the multi-core CPU
+        reconstruction. Default is 64.
+    tol : float
+        If given, SIRT, SART, CGLS and LSQR reconstructions of each slice
+        stop once the relative change of the residual norm between two
+        checks falls below this value, and TV reconstructions once the
+        relative primal-dual gap does.  Only CGLS, LSQR, and TV support it
+        with the 'astra3d' engine.
+    max_iterations : int
+        Maximum number of iterations when 'tol' is given.  If None,
+        'niterations' is used.
+    check_every : int
+        Number of iterations between residual checks when 'tol' is given.
+        Default is 10.
+    iterations_out : NumPy array
+        Integer array with one element per reconstructed slice which
+        receives the number of iterations performed for that slice, e.g. to
+        see where 'tol' stopped the reconstruction.  If None, the counts are
+        not returned.
+    seed : int
+        Seed for the random selection of free pixels in DART.  The same seed
+        gives the same result regardless of the number of cores.  If None,
+        a random seed is used.
+    slices : slice
+        Slices along the tilt axis to reconstruct.  If None, all slices are
+        reconstructed.
+    roi_y : tuple
+        Range (y0, y1) of pixels perpendicular to the tilt axis to
+        reconstruct.  If None, the full width is reconstructed.
+    roi_z : tuple
+        Range (z0, z1) of pixels along the beam direction to reconstruct,
+        where the full height is given by 'thickness'.  If None, the full
+        thickness is reconstructed.
+    initial : NumPy array
+        Starting volume for an iterative method of the same shape as the
+        reconstruction, e.g. a previous reconstruction to continue.  If
+        None, the reconstruction starts from zero.
+    multigrid : list
+        Binning factors of the coarse levels of a multiresolution SIRT,
+        SART, CGLS, LSQR, or TV reconstruction, e.g. [4, 2].  The sinograms are first binned by
+        the first factor and reconstructed, and the result is upsampled as
+        the starting volume of the next level.  The final level at full
+        resolution performs 'niterations' iterations.  Each factor must be a
+        multiple of the next one.  If None, no coarse levels are used.
+    multigrid_iterations : int or list
+        Number of iterations for each coarse level.  If None, 'niterations'
+        is used for every level.
+    nsubsets : int
+        Number of subsets of projections for ordered-subsets SART with all
+        engines.  Each SART iteration is then a pass over all subsets.  If
+        None, each projection is its own subset.
+    ordering : str
+        Order in which the SART subsets are visited: 'sequential',
+        'random', or 'golden' (default), which interleaves the subsets by
+        the golden ratio.
+    tv_weight : float
+        Weight of the total variation term for TV reconstruction.  It
+        scales with the intensity of the projection data.  Default is 1.0.
+    aligned_geometry : bool
+        If True, the alignment stored in metadata.Tomography (shifts,
+        xshift, yshift, and tiltaxis) is taken as not yet applied to the
+        data.  It is applied in the projection geometry of the 'astra3d'
+        engine instead of resampling the projections (see
+        get_alignment_vectors).  Requires CUDA.  Default is False.
 
     Returns
     ----------
-    rec : Numpy array
-        Containing the reconstructed volume
+    rec : Numpy array or array-like
+        Containing the reconstructed volume of shape [nx, thickness, ny], or
+        of the selected slices and region of interest.  If 'out' is provided,
+        it is returned.
 
     """
     if len(stack.data.shape) == 2:
-        nangles, ny = stack.data.shape
         stack.data = stack.data[:, :, np.newaxis]
-        nx = 1
+    if slices is None:
+        sinos = stack.data
     else:
-        nangles, ny, nx = stack.data.shape
+        sinos = stack.data[:, :, slices]
+    nangles, ny, nx = sinos.shape
 
     thetas = np.pi * stack.metadata.Tomography.tilts / 180.0
 
     if thickness is None:
         thickness = ny
+    vectors = None
+    if aligned_geometry:
+        if slices is not None:
+            raise ValueError("Slices cannot be selected when reconstructing with the aligned geometry")
+        if multigrid is not None:
+            raise ValueError("A multigrid reconstruction cannot be combined with the aligned geometry")
+        metadata = stack.metadata.Tomography
+        vectors = get_alignment_vectors(thetas, ny, nx, metadata.get_item("shifts", None),
+                                        metadata.get_item("xshift", None) or 0,
+                                        metadata.get_item("yshift", None) or 0,
+                                        metadata.get_item("tiltaxis", None) or 0)
+    if multigrid is not None and method.lower() in ["sirt", "sart", "cgls", "lsqr", "tv"]:
+        if initial is not None:
+            raise ValueError("An initial volume cannot be combined with a multigrid reconstruction")
+        if multigrid_iterations is None:
+            multigrid_iterations = niterations
+        initial = run_multigrid(sinos, thetas, method, multigrid, multigrid_iterations, thickness,
+                                constrain, thresh, cuda, ncores, show_progressbar, engine, slab_size,
+                                chunk_size, roi_y, roi_z, nsubsets, ordering, tv_weight)
+    return run_sinograms(sinos, thetas, method, niterations, constrain, thresh, cuda, thickness, ncores,
+                         filter, gray_levels, dart_iterations, p, show_progressbar, engine, slab_size,
+                         out, chunk_size, tol, max_iterations, check_every, seed, roi_y, roi_z, initial,
+                         nsubsets, ordering, tv_weight, vectors, iterations_out)
+
+
+def run_sinograms(sinos, thetas, method, niterations=20, constrain=None, thresh=0, cuda=None, thickness=None,
+                  ncores=None, filter="shepp-logan", gray_levels=None, dart_iterations=None, p=0.99,
+                  show_progressbar=True, engine="astra", slab_size=128, out=None, chunk_size=64, tol=None,
+                  max_iterations=None, check_every=10, seed=None, roi_y=None, roi_z=None, initial=None,
+                  nsubsets=None, ordering="golden", tv_weight=1.0, vectors=None, iterations_out=None):
+    """
+    Reconstruct tilt series data given as an array.
+
+    Args
+    ----------
+    sinos : NumPy array
+        Tilt series data of shape [nangles, ny, nx]
+    thetas : NumPy array
+        Projection angles in radians
+    method : string
+        Reconstruction algorithm to use.  Must be either 'FBP', 'SIRT',
+        'SART', 'DART', 'CGLS', 'LSQR', or 'TV'
+    vectors : NumPy array
+        ASTRA parallel3d_vec vectors of each projection (see
+        get_alignment_vectors).  If given, the 'astra3d' engine is used.
+
+    See run for the remaining arguments.
+
+    Returns
+    ----------
+    rec : Numpy array or array-like
+        Containing the reconstructed volume of shape [nx, thickness, ny]
 
-    rec = np.zeros([nx, thickness, ny], np.float32)
+    """
+    nangles, ny, nx = sinos.shape
+    if thickness is None:
+        thickness = ny
+    z0, z1, y0, y1 = get_roi(thickness, ny, roi_y, roi_z)
+    rec_shape = (nx, z1 - z0, y1 - y0)
+
+    if out is None:
+        rec = np.zeros(rec_shape, np.float32)
+    elif tuple(out.shape) != rec_shape:
+        raise ValueError("Shape of output %s does not match the reconstruction shape %s"
+                         % (tuple(out.shape), rec_shape))
+    else:
+        rec = out
+    if initial is not None:
+        if method.lower() == "fbp":
+            raise ValueError("An initial volume cannot be used with FBP")
+        if tuple(initial.shape) != rec_shape:
+            raise ValueError("Shape of initial volume %s does not match the reconstruction shape %s"
+                             % (tuple(initial.shape), rec_shape))
+
+    if method.lower() == "sart":
+        # Check the subset options before any worker processes are started
+        get_subsets(thetas, nsubsets)
+        get_subset_order(1, ordering)
+
+    if tol is not None and method.lower() in ["sirt", "sart", "cgls", "lsqr", "tv"]:
+        if max_iterations is not None:
+            niterations = max_iterations
+    else:
+        tol = None
+    if iterations_out is None:
+        iterations = np.zeros(nx, int)
+    elif len(iterations_out) != nx:
+        raise ValueError("Length of iterations_out (%s) does not match the number of slices (%s)"
+                         % (len(iterations_out), nx))
+    else:
+        iterations = iterations_out
+    iterations[:] = 1 if method.lower() == "fbp" else niterations
+    if method.lower() == "dart" and seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    if vectors is not None:
+        if not cuda:
+            raise ValueError("Reconstruction with the aligned geometry requires CUDA")
+        if engine.lower() not in ["astra", "astra3d"]:
+            raise ValueError("The aligned geometry is not available with the %s engine" % engine)
+        engine = "astra3d"
+    if method.lower() in ["cgls", "lsqr", "tv"] and engine.lower() == "astra":
+        engine = "astra3d" if cuda else "matrix"
+        logger.info("Using the %s engine for %s" % (engine, method.upper()))
+    if not has_astra and engine.lower() not in ["numpy", "matrix"]:
+        raise ValueError("The %s engine requires ASTRA. Use the 'numpy' or 'matrix' engine instead" % engine)
+
+    if engine.lower() == "astra3d":
+        if not cuda:
+            raise ValueError("The astra3d engine requires CUDA")
+        if tol is not None and method.lower() not in ["cgls", "lsqr", "tv"]:
+            raise ValueError("Early stopping with 'tol' is not available for %s with the astra3d engine"
+                             % method.upper())
+        rec = run_astra3d(sinos, thetas, method, niterations, thickness, constrain, thresh,
+                          filter, slab_size, show_progressbar, out=rec, roi_y=roi_y, roi_z=roi_z,
+                          initial=initial, nsubsets=nsubsets, ordering=ordering, tol=tol,
+                          check_every=check_every, iterations=iterations, tv_weight=tv_weight,
+                          vectors=vectors)
+        astra.clear()
+        return rec
+    elif engine.lower() == "numpy":
+        if method.lower() != "fbp":
+            raise ValueError("Method %s is not available with the numpy engine" % method)
+        rec = run_numpy_fbp(sinos, thetas, thickness, filter, slab_size, show_progressbar, out=rec,
+                            roi_y=roi_y, roi_z=roi_z)
+        return rec
+    elif engine.lower() == "matrix":
+        rec = run_matrix(sinos, thetas, method, niterations, thickness, constrain, thresh,
+                         slab_size, show_progressbar, out=rec, tol=tol, check_every=check_every,
+                         iterations=iterations, roi_y=roi_y, roi_z=roi_z, initial=initial,
+                         nsubsets=nsubsets, ordering=ordering, tv_weight=tv_weight)
+        return rec
+    elif engine.lower() != "astra":
+        raise ValueError("Unknown reconstruction engine: %s" % engine)
 
     proj_geom = astra.create_proj_geom("parallel", 1.0, ny, thetas)
-    vol_geom = astra.create_vol_geom((thickness, ny))
+    vol_geom = get_vol_geom(thickness, ny, roi_y, roi_z)
     rec_id = astra.data2d.create("-vol", vol_geom)
     sino_id = astra.data2d.create("-sino", proj_geom, np.zeros([nangles, ny]))
+    if tol is not None:
+        fp_sino_id = astra.data2d.create("-sino", proj_geom, 0)
 
     if cuda:
         proj_id = astra.create_projector("cuda", proj_geom, vol_geom)
@@ -212,8 +2836,8 @@ def run(stack, method, niterations=20, constrain=None, thresh=0, cuda=None, thic
             alg = astra.algorithm.create(cfg)
 
             for i in tqdm.tqdm(range(0, nx), disable=not (show_progressbar)):
-                astra.data2d.store(sino_id, stack.data[:, :, i])
-                astra.data2d.store(rec_id, np.zeros([thickness, ny]))
+                astra.data2d.store(sino_id, sinos[:, :, i])
+                astra.data2d.store(rec_id, 0)
                 astra.algorithm.run(alg, niterations)
                 rec[i, :, :] = astra.data2d.get(rec_id)
         elif method.lower() == "sirt":
@@ -229,132 +2853,103 @@ def run(stack, method, niterations=20, constrain=None, thresh=0, cuda=None, thic
                 cfg["option"] = {}
                 cfg["option"]["MinConstraint"] = thresh
             alg = astra.algorithm.create(cfg)
+            if tol is not None:
+                fp_alg = astra.algorithm.create(get_fp_config(proj_id, fp_sino_id, rec_id, cuda=True))
 
             for i in tqdm.tqdm(range(0, nx), disable=not (show_progressbar)):
-                astra.data2d.store(sino_id, stack.data[:, :, i])
-                astra.data2d.store(rec_id, np.zeros([thickness, ny]))
-                astra.algorithm.run(alg, niterations)
-                rec[i, :, :] = astra.data2d.get(rec_id)
+                slice_initial = None if initial is None else initial[i]
+                if tol is not None:
+                    rec[i], iterations[i] = run_alg_tol(sinos[:, :, i], niterations, sino_id, alg,
+                                                        rec_id, fp_alg, fp_sino_id, tol, check_every,
+                                                        slice_initial)
+                    continue
+                rec[i, :, :] = run_alg(sinos[:, :, i], niterations, sino_id, alg, rec_id, slice_initial)
 
         elif method.lower() == "sart":
             logger.info(
-                "Reconstructing with CUDA-accelerated SART algorithm (%s iterations)"
-                % niterations
+                "Reconstructing with CUDA-accelerated OS-SART algorithm (%s subsets, %s iterations)"
+                % (len(get_subsets(thetas, nsubsets)), niterations)
             )
-            cfg = astra.astra_dict("SART_CUDA")
-            cfg["ProjectorId"] = proj_id
-            cfg["ProjectionDataId"] = sino_id
-            cfg["ReconstructionDataId"] = rec_id
-            if constrain:
-                cfg["option"] = {}
-                cfg["option"]["MinConstraint"] = thresh
-            alg = astra.algorithm.create(cfg)
+            # Each iteration is a pass over all subsets, as on the CPU and with the other engines
+            alg = OrderedSubsets(thetas, ny, vol_geom, sino_id, rec_id, nsubsets, ordering, constrain, thresh,
+                                 cuda=True)
+            if tol is not None:
+                fp_alg = astra.algorithm.create(get_fp_config(proj_id, fp_sino_id, rec_id, cuda=True))
 
             for i in tqdm.tqdm(range(0, nx), disable=not (show_progressbar)):
-                astra.data2d.store(sino_id, stack.data[:, :, i])
-                astra.data2d.store(rec_id, np.zeros([thickness, ny]))
-                astra.algorithm.run(alg, niterations)
-                rec[i, :, :] = astra.data2d.get(rec_id)
+                slice_initial = None if initial is None else initial[i]
+                if tol is not None:
+                    rec[i], iterations[i] = run_alg_tol(sinos[:, :, i], niterations, sino_id, alg,
+                                                        rec_id, fp_alg, fp_sino_id, tol, check_every,
+                                                        slice_initial)
+                    continue
+                rec[i, :, :] = run_alg(sinos[:, :, i], niterations, sino_id, alg, rec_id, slice_initial)
 
         elif method.lower() == "dart":
-            thresholds = [(gray_levels[i] + gray_levels[i + 1]) // 2 for i in range(len(gray_levels) - 1)]
-            mask = np.ones([thickness, ny])
-            mask_id = astra.data2d.create('-vol', vol_geom, mask)
-            cfg = astra.astra_dict('SART_CUDA')
-            cfg["ProjectorId"] = proj_id
-            cfg['ProjectionDataId'] = sino_id
-            cfg['ReconstructionDataId'] = rec_id
-            cfg['option'] = {}
-            cfg['option']['MinConstraint'] = 0
-            cfg['option']['MaxConstraint'] = 255
-            cfg['option']['ReconstructionMaskId'] = mask_id
-            alg = astra.algorithm.create(cfg)
-
+            dart = DartEngine(thetas, ny, thickness, gray_levels, niterations, dart_iterations, p, cuda=True,
+                              roi_y=roi_y, roi_z=roi_z)
             for i in tqdm.tqdm(range(0, nx), disable=not (show_progressbar)):
-                sinogram = stack.data[:, :, i]
-                astra.data2d.store(sino_id, sinogram)
-                astra.data2d.store(rec_id, np.zeros([thickness, ny]))
-                astra.data2d.store(mask_id, np.ones([thickness, ny]))
-                rec[i, :, :] = run_dart(sinogram, niterations, dart_iterations, p,
-                                        alg, proj_id, mask_id, rec_id, sino_id, thresholds, gray_levels)
+                rec[i] = dart.reconstruct(sinos[:, :, i], np.random.default_rng([seed, i]),
+                                          None if initial is None else initial[i])
     else:
         if ncores is None:
-            ncores = min(nx, int(0.9 * mp.cpu_count()))
+            ncores = max(1, min(nx, int(0.9 * mp.cpu_count())))
 
         proj_id = astra.create_projector("linear", proj_geom, vol_geom)
 
         if method.lower() == "fbp":
             logger.info("Reconstructing with CPU-based FBP algorithm")
-            cfg = astra.astra_dict("FBP")
-            cfg["ProjectorId"] = proj_id
-            cfg["ProjectionDataId"] = sino_id
-            cfg["ReconstructionDataId"] = rec_id
-            cfg["option"] = {}
-            cfg["option"]["FilterType"] = filter.lower()
+            cfg = get_cpu_alg_config(method, proj_id, sino_id, rec_id, constrain, thresh, filter)
             niterations = 1
         elif method.lower() == "sirt":
             logger.info("Reconstructing with CPU-based SIRT algorithm")
-            cfg = astra.astra_dict("SIRT")
-            cfg["ProjectorId"] = proj_id
-            cfg["ProjectionDataId"] = sino_id
-            cfg["ReconstructionDataId"] = rec_id
-            if constrain:
-                cfg["option"] = {}
-                cfg["option"]["MinConstraint"] = thresh
+            cfg = get_cpu_alg_config(method, proj_id, sino_id, rec_id, constrain, thresh, filter)
         elif method.lower() == "sart":
-            logger.info("Reconstructing with CPU-based SART algorithm")
-            cfg = astra.astra_dict("SIRT")
-            cfg["ProjectorId"] = proj_id
-            cfg["ProjectionDataId"] = sino_id
-            cfg["ReconstructionDataId"] = rec_id
-            if constrain:
-                cfg["option"] = {}
-                cfg["option"]["MinConstraint"] = thresh
+            logger.info("Reconstructing with CPU-based OS-SART algorithm (%s subsets)"
+                        % len(get_subsets(thetas, nsubsets)))
         elif method.lower() == "dart":
-            thresholds = [(gray_levels[i] + gray_levels[i + 1]) // 2 for i in range(len(gray_levels) - 1)]
-            mask = np.ones([thickness, ny])
-            mask_id = astra.data2d.create('-vol', vol_geom, mask)
-            cfg = astra.astra_dict('SART')
-            cfg["ProjectorId"] = proj_id
-            cfg['ProjectionDataId'] = sino_id
-            cfg['ReconstructionDataId'] = rec_id
-            cfg['option'] = {}
-            cfg['option']['MinConstraint'] = 0
-            cfg['option']['MaxConstraint'] = 255
-            cfg['option']['ReconstructionMaskId'] = mask_id
-
-        alg = astra.algorithm.create(cfg)
+            logger.info("Reconstructing with CPU-based DART algorithm")
 
         if method.lower() in ['fbp', 'sirt', 'sart']:
-            if ncores == 1:
+            if method.lower() == "sart":
+                alg = OrderedSubsets(thetas, ny, vol_geom, sino_id, rec_id, nsubsets, ordering, constrain, thresh)
+            else:
+                alg = astra.algorithm.create(cfg)
+            if ncores == 1 and tol is not None:
+                fp_alg = astra.algorithm.create(get_fp_config(proj_id, fp_sino_id, rec_id))
                 for i in tqdm.tqdm(range(0, nx), disable=not (show_progressbar)):
-                    rec[i] = run_alg(stack.data[:, :, i], niterations, sino_id, alg, rec_id)
+                    rec[i], iterations[i] = run_alg_tol(sinos[:, :, i], niterations, sino_id, alg,
+                                                        rec_id, fp_alg, fp_sino_id, tol, check_every,
+                                                        None if initial is None else initial[i])
+            elif ncores == 1:
+                for i in tqdm.tqdm(range(0, nx), disable=not (show_progressbar)):
+                    rec[i] = run_alg(sinos[:, :, i], niterations, sino_id, alg, rec_id,
+                                     None if initial is None else initial[i])
             else:
                 logger.info("Using %s CPU cores to reconstruct %s slices" % (ncores, nx))
-                with mp.Pool(ncores) as pool:
-                    for i, result in enumerate(
-                        pool.starmap(run_alg,
-                                     [(stack.data[:, :, i], niterations, sino_id, alg, rec_id) for i in range(0, nx)],)):
-                        rec[i] = result
+                rec = run_pool(sinos, thetas, method, niterations, thickness, constrain, thresh,
+                               filter, ncores, show_progressbar, out=rec, chunk_size=chunk_size,
+                               tol=tol, check_every=check_every, iterations=iterations,
+                               roi_y=roi_y, roi_z=roi_z, initial=initial, nsubsets=nsubsets,
+                               ordering=ordering)
         elif method.lower() == 'dart':
+            dart_args = {"gray_levels": gray_levels, "dart_iterations": dart_iterations, "p": p}
             if ncores == 1:
+                dart = DartEngine(thetas, ny, thickness, niterations=niterations, roi_y=roi_y, roi_z=roi_z,
+                                  **dart_args)
                 for i in tqdm.tqdm(range(0, nx), disable=not (show_progressbar)):
-                    rec[i] = run_dart(stack.data[:, :, i], niterations, dart_iterations, p,
-                                      alg, proj_id, mask_id, rec_id, sino_id, thresholds, gray_levels)
+                    rec[i] = dart.reconstruct(sinos[:, :, i], np.random.default_rng([seed, i]),
+                                              None if initial is None else initial[i])
             else:
                 logger.info("Using %s CPU cores to reconstruct %s slices" % (ncores, nx))
-                with mp.Pool(ncores) as pool:
-                    for i, result in enumerate(
-                        pool.starmap(run_dart,
-                                     [(stack.data[:, :, i], niterations, dart_iterations, p,
-                                       alg, proj_id, mask_id, rec_id, sino_id, thresholds, gray_levels)
-                                      for i in range(0, nx)],)):
-                        rec[i] = result
+                rec = run_pool(sinos, thetas, method, niterations, thickness, ncores=ncores,
+                               show_progressbar=show_progressbar, out=rec, chunk_size=chunk_size,
+                               dart_args=dart_args, seed=seed, roi_y=roi_y, roi_z=roi_z, initial=initial)
     astra.clear()
     return rec
 
 
-def dart_segment(rec, thresholds, gray_vals):
+def dart_segment(rec, thresholds, gray_vals, out=None):
     """
     Segmentation step for DART Reconstruction.
 
@@ -366,6 +2961,8 @@ def dart_segment(rec, thresholds, gray_vals):
         Threshold values for segmentation.
     gray_vals : list or NumPy array
         Grayscale values to assign the segmented regions.
+    out : NumPy array
+        If given, the segmentation is written to this array.
 
     Returns
     ----------
@@ -374,18 +2971,23 @@ def dart_segment(rec, thresholds, gray_vals):
 
     """
     bins = np.digitize(rec, bins=thresholds, right=False)
-    segmented = np.array(gray_vals)[bins]
+    segmented = np.take(np.asarray(gray_vals), bins, out=out)
     return segmented
 
 
-def get_dart_boundaries(segmented):
+def get_dart_boundaries(segmented, out=None):
     """
     Boundary step for DART Reconstruction.
 
+    A pixel is on a boundary if any of its eight neighbors has a different
+    value.  Pixels outside the image are taken to be zero.
+
     Args
     ----------
     segmented : NumPy array
         Segmented reconstruction.
+    out : NumPy array
+        If given, boolean array to which the boundaries are written.
 
     Returns
     ----------
@@ -393,23 +2995,30 @@ def get_dart_boundaries(segmented):
         Boundaries of the segmented reconstruction.
 
     """
-    kernel = np.array([[1, 1, 1],
-                       [1, -8, 1],
-                       [1, 1, 1]])
-    edges = convolve(segmented.astype(np.int32), kernel, mode='constant', cval=0)
-    boundaries = edges != 0
-    return boundaries
+    rows, cols = segmented.shape
+    padded = np.pad(segmented, 1)
+    if out is None:
+        out = np.zeros([rows, cols], bool)
+    else:
+        out[:] = False
+    for i in range(3):
+        for j in range(3):
+            if i != 1 or j != 1:
+                out |= padded[i:i + rows, j:j + cols] != segmented
+    return out
 
 
-def astra_error(sinogram, angles, method='sirt', iterations=50, constrain=True, thresh=0, cuda=False):
+def astra_error(sinogram, angles, method='sirt', iterations=50, constrain=True, thresh=0, cuda=False,
+                snapshots=None, show_progressbar=True):
     """
     Perform SIRT reconstruction using the Astra toolbox algorithms.
 
     Args
     ----------
     sinogram : NumPy array
-       Tilt series data either of the form [angles, x] or [angles, y, x] where
-       y is the tilt axis and x is the projection axis.
+       Tilt series data either of the form [angles, x] or [angles, x, y] where
+       y is the tilt axis and x is the projection axis.  In the latter case,
+       each slice along y is evaluated in turn.
     angles : list or NumPy array
         Projection angles in degrees.
     method : str
@@ -425,15 +3034,42 @@ def astra_error(sinogram, angles, method='sirt', iterations=50, constrain=True,
     cuda : boolean
         If True, use the CUDA-accelerated Astra algorithms. Otherwise,
         use the CPU-based algorithms
+    snapshots : list or NumPy array
+        Indices of the iterations (starting at 0) for which the
+        reconstruction is kept.  If None (default), every iteration is kept.
+        Only these reconstructions are held in memory, so an empty list
+        tracks the residual alone.  Indices must be unique and lie in
+        [0, iterations).
+    show_progressbar : bool
+        If True, show a progress bar. Default is True.
+
     Returns
     ----------
     rec : Numpy array
-        3D array of the form [y, z, x] containing the reconstructed object.
+        Reconstructions at the selected iterations, of shape
+        [nsnapshots, x, x], or [y, nsnapshots, x, x] for several slices.
+    residual_error : NumPy array
+        Residual norm at each iteration, of shape [iterations] or
+        [y, iterations].
 
     """
     thetas = angles * np.pi / 180
 
-    nangles, ny = sinogram.shape
+    if sinogram.ndim == 2:
+        sinograms = sinogram[:, :, np.newaxis]
+    else:
+        sinograms = sinogram
+    nangles, ny, nslices = sinograms.shape
+
+    if snapshots is None:
+        snapshots = np.arange(iterations)
+    snapshots = [int(i) for i in snapshots]
+    invalid = [i for i in snapshots if i < 0 or i >= iterations]
+    if len(invalid) > 0:
+        raise ValueError("Snapshot indices %s are outside the range of %s iterations" % (invalid, iterations))
+    if len(set(snapshots)) != len(snapshots):
+        raise ValueError("Snapshot indices must be unique")
+    keep = {i: n for n, i in enumerate(snapshots)}
 
     proj_geom = astra.create_proj_geom("parallel", 1.0, ny, thetas)
     vol_geom = astra.create_vol_geom((ny, ny))
@@ -446,8 +3082,9 @@ def astra_error(sinogram, angles, method='sirt', iterations=50, constrain=True,
     else:
         alg_name = method.upper()
         proj_id = astra.create_projector("linear", proj_geom, vol_geom)
-
-    astra.data2d.store(sino_id, sinogram)
+        fp_sino_id = astra.data2d.create("-sino", proj_geom, 0)
+        fp_alg = astra.algorithm.create(get_fp_config(proj_id, fp_sino_id, rec_id))
+        fp_sino = astra.data2d.get_shared(fp_sino_id)
 
     cfg = astra.astra_dict(alg_name)
     cfg["ProjectionDataId"] = sino_id
@@ -459,16 +3096,25 @@ def astra_error(sinogram, angles, method='sirt', iterations=50, constrain=True,
 
     alg = astra.algorithm.create(cfg)
 
-    rec = np.zeros([iterations, ny, ny], np.float32)
-    residual_error = np.zeros(iterations)
-
-    for i in tqdm.tqdm(range(iterations)):
-        astra.algorithm.run(alg, 1)
-        rec[i] = astra.data2d.get(rec_id)
-        if cuda:
-            residual_error[i] = astra.algorithm.get_res_norm(alg)
-        else:
-            curr_id, curr = astra.create_sino(rec[i], proj_id)
-            residual_error[i] = np.linalg.norm((sinogram - curr))
+    rec = np.zeros([nslices, len(snapshots), ny, ny], np.float32)
+    residual_error = np.zeros([nslices, iterations])
+
+    with tqdm.tqdm(total=nslices * iterations, disable=not (show_progressbar)) as pbar:
+        for j in range(nslices):
+            sino = sinograms[:, :, j]
+            astra.data2d.store(sino_id, sino)
+            astra.data2d.store(rec_id, 0)
+            for i in range(iterations):
+                astra.algorithm.run(alg, 1)
+                if i in keep:
+                    rec[j, keep[i]] = astra.data2d.get_shared(rec_id)
+                if cuda:
+                    residual_error[j, i] = astra.algorithm.get_res_norm(alg)
+                else:
+                    astra.algorithm.run(fp_alg)
+                    residual_error[j, i] = np.linalg.norm(sino - fp_sino)
+                pbar.update(1)
     astra.clear()
+    if sinogram.ndim == 2:
+        return rec[0], residual_error[0]
     return rec, residual_error
@@ -9,8 +9,8 @@ Simulation module for ETSpy package.
 """
 import numpy as np
 from scipy import ndimage
-import astra
 from etspy.io import create_stack
+from etspy import recon
 import hyperspy.api as hs
 
 
@@ -179,7 +179,7 @@ def create_model_tilt_series(model, angles=None, cuda=None):
 
     """
     if cuda is None:
-        cuda = astra.use_cuda()
+        cuda = recon.use_cuda()
 
     if type(angles) is not np.ndarray:
         angles = np.arange(0, 180, 2)
@@ -187,22 +187,7 @@ def create_model_tilt_series(model, angles=None, cuda=None):
     if type(model) is hs.signals.Signal2D:
         model = model.data
 
-    xdim, zdim, ydim = model.shape
-    ntilts = len(angles)
-
-    proj_data = np.zeros([ntilts, ydim, xdim])
-    vol_geom = astra.create_vol_geom([zdim, ydim])
-    thetas = np.radians(angles)
-
-    proj_geom = astra.create_proj_geom("parallel", 1.0, ydim, thetas)
-    if cuda is False:
-        proj_id = astra.create_projector("linear", proj_geom, vol_geom)
-    else:
-        proj_id = astra.create_projector("cuda", proj_geom, vol_geom)
-
-    for i in range(0, model.shape[0]):
-        sino_id, proj_data[:, :, i] = astra.create_sino(model[i, :, :], proj_id)
-
+    proj_data = recon.forward_project(model, np.radians(angles), cuda)
     stack = create_stack(proj_data, angles)
     return stack
 
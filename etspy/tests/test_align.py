@@ -12,6 +12,96 @@ class TestAlignFunctions:
         with pytest.raises(ValueError):
             etspy.align.apply_shifts(stack, shifts)
 
+    def test_pair_shifts_pc(self):
+        stack = ds.get_needle_data()
+        rng = np.random.default_rng(0)
+        shifts = rng.uniform(-5, 5, [20, 2])
+        shifted = np.array([etspy.align.ndimage.shift(stack.data[i], shifts[i]) for i in range(20)])
+        pair_shifts = etspy.align.calculate_pair_shifts_pc(shifted, upsample_factor=3, chunk_size=6)
+        ref = np.array([etspy.align.pcc(shifted[i], shifted[i + 1], upsample_factor=3)[0] for i in range(19)])
+        assert pair_shifts.shape == (19, 2)
+        assert np.allclose(pair_shifts, ref, atol=1e-5)
+
+    def test_pair_shifts_pc_threads(self):
+        stack = ds.get_needle_data(True)
+        sequential = etspy.align.calculate_pair_shifts_pc(stack.data, upsample_factor=3, chunk_size=5, ncores=1)
+        threaded = etspy.align.calculate_pair_shifts_pc(stack.data, upsample_factor=3, chunk_size=5, ncores=4)
+        assert np.allclose(threaded, sequential, atol=1e-5)
+
+    def test_shifts_stackreg_threads(self):
+        stack = ds.get_needle_data(True)
+        start = stack.data.shape[0] // 2
+        sequential = etspy.align.calculate_shifts_stackreg(stack, start, False, ncores=1)
+        with etspy.align.ThreadPoolExecutor(4) as executor:
+            threaded = etspy.align.calculate_shifts_stackreg(stack, start, False, executor=executor)
+        assert np.allclose(threaded, sequential)
+        assert np.all(threaded[start] == 0)
+
+    def test_global_shifts_outlier(self):
+        rng = np.random.default_rng(0)
+        shifts = rng.uniform(-5, 5, [30, 2])
+        shifts -= shifts[15]
+        pairs = np.array([[i, j] for i in range(30) for j in range(i + 1, min(i + 4, 30))])
+        pair_shifts = shifts[pairs[:, 1]] - shifts[pairs[:, 0]] + rng.normal(0, 0.05, [len(pairs), 2])
+        pair_shifts[10] += 20
+        result = etspy.align.solve_global_shifts(pairs, pair_shifts, 30, 15)
+        assert result.shape == (30, 2)
+        assert np.all(result[15] == 0)
+        assert np.abs(result - shifts).max() < 0.2
+
+    def test_global_shifts_pc(self):
+        rng = np.random.default_rng(0)
+        image = etspy.align.ndimage.gaussian_filter(rng.normal(size=[64, 64]), 2)
+        shifts = rng.uniform(-4, 4, [20, 2])
+        data = np.array([etspy.align.ndimage.shift(image, -shifts[i], mode='grid-wrap') for i in range(20)])
+        # A failed projection breaks the chain of neighboring pairs
+        data[5] = rng.normal(size=[64, 64]) * image.std()
+        stack = etspy.create_stack(data, np.linspace(-57, 57, 20))
+        sequential = etspy.align.calculate_shifts_pc(stack, 10, False, 5, False)
+        result = etspy.align.calculate_shifts_pc(stack, 10, False, 5, False, neighbors=3)
+        errors = np.abs(np.delete(result - shifts + shifts[10], 5, axis=0))
+        assert errors.max() < 1
+        assert np.abs(sequential - shifts + shifts[10])[0:5].max() > 5
+
+    def test_neighbor_shifts_pc(self):
+        stack = ds.get_needle_data(True)
+        pairs, pair_shifts = etspy.align.calculate_neighbor_shifts_pc(stack.data[0:12], 3, chunk_size=5)
+        assert pairs.shape == (30, 2)
+        assert np.all((pairs[:, 1] > pairs[:, 0]) & (pairs[:, 1] <= pairs[:, 0] + 3))
+        ref = np.array([etspy.align.pcc(stack.data[i], stack.data[j])[0] for i, j in pairs])
+        assert np.allclose(pair_shifts, ref)
+
+    def test_bin_images(self):
+        data = np.arange(2 * 9 * 10, dtype=float).reshape([2, 9, 10])
+        binned = etspy.align.bin_images(data, 2)
+        assert binned.shape == (2, 4, 5)
+        assert np.allclose(binned[1, 2, 3], data[1, 4:6, 6:8].mean())
+
+    def test_pyramid_shifts(self):
+        rng = np.random.default_rng(0)
+        image = etspy.align.ndimage.gaussian_filter(rng.normal(size=[600, 600]), 2)
+        shifts = rng.uniform(-20, 20, [6, 2])
+        data = np.array([etspy.align.ndimage.shift(image, -shifts[i], mode='grid-wrap') for i in range(6)])
+        data = data[:, 50:550, 30:570]
+        pairs, pair_shifts = etspy.align.calculate_neighbor_shifts_pyramid(data, 1, [8, 2], 128, 10)
+        assert np.all(pairs[:, 1] == pairs[:, 0] + 1)
+        assert np.abs(pair_shifts - np.diff(shifts, axis=0)).max() < 0.3
+
+    def test_pyramid_unknown_method(self):
+        data = np.zeros([3, 64, 64])
+        with pytest.raises(ValueError):
+            etspy.align.calculate_neighbor_shifts_pyramid(data, method='COM')
+
+    def test_calc_shifts_cl(self):
+        x = np.arange(128)
+        line = np.exp(-(x - 60) ** 2 / 50) + 0.5 * np.exp(-(x - 75) ** 2 / 20)
+        shifts = np.linspace(-5, 5, 9)
+        data = np.array([np.tile(etspy.align.ndimage.shift(line, shift), (32, 1)) for shift in shifts])
+        stack = etspy.create_stack(data, np.linspace(-40, 40, 9))
+        yshifts = etspy.align.calc_shifts_cl(stack, 4, 0.05, 8)
+        assert yshifts[4] == 0
+        assert np.allclose(yshifts, -shifts, atol=0.05)
+
     def test_pad_line(self):
         line = np.zeros(100)
         padded = etspy.align.pad_line(line, 200)
@@ -70,6 +160,21 @@ class TestAlignStackRegister:
         assert reg.axes_manager.navigation_shape == \
             stack.inav[0:20].axes_manager.navigation_shape
 
+    def test_register_stackreg_global(self):
+        stack = ds.get_needle_data(True)
+        reg = stack.stack_register('StackReg', neighbors=2)
+        assert type(reg) is etspy.TomoStack
+        assert reg.data.shape == stack.data.shape
+        assert np.all(reg.metadata.Tomography.shifts[stack.data.shape[0] // 2] == 0)
+
+    def test_register_stackreg_pyramid(self):
+        stack = ds.get_needle_data(True)
+        reg = stack.stack_register('StackReg', pyramid=[4], pyramid_window=128)
+        ref = stack.stack_register('StackReg')
+        assert type(reg) is etspy.TomoStack
+        assert reg.data.shape == stack.data.shape
+        assert np.abs(reg.metadata.Tomography.shifts - ref.metadata.Tomography.shifts).max() < 0.5
+
     def test_register_com_cl(self):
         stack = ds.get_needle_data()
         stack.metadata.Tomography.shifts = \
@@ -81,6 +186,24 @@ class TestAlignStackRegister:
         assert reg.axes_manager.navigation_shape == \
             stack.inav[0:20].axes_manager.navigation_shape
 
+    def test_register_pm(self):
+        stack = ds.get_needle_data(True)
+        data = stack.data[::2].reshape([39, 128, 2, 128, 2]).mean((2, 4))
+        stack = etspy.create_stack(data, stack.metadata.Tomography.tilts[::2])
+        rng = np.random.default_rng(0)
+        shifts = np.zeros([39, 2])
+        shifts[:, 0] = rng.uniform(-3, 3, 39)
+        misaligned = etspy.align.apply_shifts(stack, shifts)
+        reg = misaligned.stack_register('PM', iterations=3)
+        errors = reg.metadata.Tomography.shifts[:, 0]
+        # Translations of the object cannot be recovered by projection matching
+        thetas = np.radians(stack.metadata.Tomography.tilts)
+        modes = np.stack([np.cos(thetas), np.sin(thetas)], axis=1)
+        errors -= modes @ np.linalg.lstsq(modes, errors, rcond=None)[0]
+        assert type(reg) is etspy.TomoStack
+        assert reg.data.shape == stack.data.shape
+        assert np.abs(errors).mean() < 0.2
+
     def test_register_unknown_method(self):
         stack = ds.get_needle_data()
         stack.metadata.Tomography.shifts = \
@@ -272,6 +272,20 @@ class TestErrorPlots:
         assert (1 - (3.8709e12 / error.data[0])) < 0.001
         assert (1 - (2.8624e12 / error.data[1])) < 0.001
 
+    def test_sirt_error_multiple_slices(self):
+        stack = ds.get_needle_data(True)
+        rec_stack, error = stack.recon_error([100, 128], iterations=3, snapshots=[2],
+                                             constrain=True, cuda=False)
+        assert error.data.shape == (2, 3)
+        assert rec_stack.data.shape == (2, 1, stack.data.shape[1], stack.data.shape[1])
+
+    def test_sirt_error_no_snapshots(self):
+        stack = ds.get_needle_data(True)
+        rec_stack, error = stack.recon_error(128, iterations=3, snapshots=[],
+                                             constrain=True, cuda=False)
+        assert rec_stack is None
+        assert error.data.shape == (3,)
+
 
 class TestTiltAlign:
 
@@ -380,3 +394,17 @@ class TestPlotSlices:
         rec = RecStack(np.zeros([10, 10, 10]))
         fig = rec.plot_slices()
         assert type(fig) is matplotlib.figure.Figure
+
+
+class TestForwardProject:
+    def test_forward_project(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = slices.reconstruct('SIRT', iterations=20, cuda=False)
+        proj = rec.forward_project(slices.metadata.Tomography.tilts, cuda=False)
+        assert type(proj) is TomoStack
+        assert proj.data.shape == slices.data.shape
+        assert proj.data.dtype == np.float32
+        assert np.array_equal(proj.metadata.Tomography.tilts, slices.metadata.Tomography.tilts)
+        assert proj.axes_manager.signal_axes[0].offset == slices.axes_manager.signal_axes[0].offset
+        assert np.abs(proj.data - slices.data).mean() < 0.2 * np.abs(slices.data).mean()
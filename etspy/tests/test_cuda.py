@@ -115,6 +115,132 @@ class TestReconRunCUDA:
         assert rec.data.shape[0] == slices.data.shape[2]
         assert type(rec) is numpy.ndarray
 
+    def test_run_sart_subsets_cuda(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = recon.run(slices, 'SART', niterations=2, cuda=True, nsubsets=7, ordering='sequential')
+        ref = recon.run(slices, 'SART', niterations=2, cuda=False, ncores=1, nsubsets=7, ordering='sequential')
+        assert numpy.allclose(rec, ref, atol=1e-2 * numpy.abs(ref).max())
+
+    def test_run_sirt_tol_cuda(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        iterations = numpy.zeros(slices.data.shape[2], int)
+        rec = recon.run(slices, 'SIRT', cuda=True, tol=0.2, max_iterations=100, iterations_out=iterations)
+        assert rec.shape == (2, slices.data.shape[1], slices.data.shape[1])
+        assert numpy.all(iterations < 100)
+
+    def test_run_sirt_initial_cuda(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        initial = recon.run(slices, 'SIRT', niterations=2, cuda=True)
+        rec = recon.run(slices, 'SIRT', niterations=2, cuda=True, initial=initial)
+        ref = recon.run(slices, 'SIRT', niterations=4, cuda=True)
+        assert numpy.allclose(rec, ref, atol=1e-2 * numpy.abs(ref).max())
+
+
+@pytest.mark.skipif(not astra.use_cuda(), reason="CUDA not detected")
+class TestReconRunAstra3D:
+    def test_run_fbp_astra3d(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = recon.run(slices, 'FBP', cuda=True, engine='astra3d', slab_size=2)
+        rec_2d = recon.run(slices, 'FBP', cuda=True)
+        assert rec.shape == (5, slices.data.shape[1], slices.data.shape[1])
+        assert numpy.allclose(rec, rec_2d, atol=1e-2 * numpy.abs(rec_2d).max())
+
+    def test_run_sirt_astra3d(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = recon.run(slices, 'SIRT', niterations=2, cuda=True, engine='astra3d', slab_size=2)
+        assert rec.shape == (5, slices.data.shape[1], slices.data.shape[1])
+        assert type(rec) is numpy.ndarray
+
+    def test_run_sart_astra3d(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = recon.run(slices, 'SART', niterations=2, cuda=True, engine='astra3d', slab_size=2,
+                        constrain=True, thresh=0)
+        assert rec.shape == (5, slices.data.shape[1], slices.data.shape[1])
+        assert rec.min() >= 0
+
+    def test_recon_astra3d(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = slices.reconstruct('SIRT', iterations=2, cuda=True, engine='astra3d')
+        assert type(rec) is etspy.base.RecStack
+        assert rec.data.shape[0] == 5
+
+    def test_run_fbp_astra3d_roi(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = recon.run(slices, 'FBP', cuda=True, engine='astra3d', slab_size=2, roi_y=(60, 180), roi_z=(90, 150))
+        ref = recon.run(slices, 'FBP', cuda=True, engine='astra3d', slab_size=2)
+        assert rec.shape == (5, 60, 120)
+        assert numpy.allclose(rec, ref[:, 90:150, 60:180], atol=1e-2 * numpy.abs(ref).max())
+
+    def test_run_cgls_astra3d(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        iterations = numpy.zeros(slices.data.shape[2], int)
+        rec = recon.run(slices, 'CGLS', niterations=20, cuda=True, slab_size=2, tol=0.5, iterations_out=iterations)
+        rec_matrix = recon.run(slices, 'CGLS', niterations=20, cuda=False, tol=0.5)
+        assert rec.shape == (5, slices.data.shape[1], slices.data.shape[1])
+        assert numpy.all(iterations <= 20)
+        assert numpy.allclose(rec, rec_matrix, atol=1e-2 * numpy.abs(rec_matrix).max())
+
+    def test_run_tv_astra3d(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = recon.run(slices, 'TV', niterations=20, cuda=True, slab_size=2, tv_weight=100, constrain=True)
+        assert rec.shape == (5, slices.data.shape[1], slices.data.shape[1])
+        assert rec.min() >= 0
+
+    def test_run_sirt_astra3d_multigrid(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = recon.run(slices, 'SIRT', niterations=2, cuda=True, engine='astra3d', slab_size=2,
+                        multigrid=[4, 2], multigrid_iterations=5)
+        assert rec.shape == (5, slices.data.shape[1], slices.data.shape[1])
+
+    def test_run_sirt_aligned_geometry(self):
+        stack = ds.get_needle_data(True)
+        shifts = numpy.zeros([stack.data.shape[0], 2])
+        shifts[:, 0] = numpy.linspace(-3, 3, stack.data.shape[0])
+        unaligned = etspy.align.apply_shifts(stack, -shifts)
+        unaligned.metadata.Tomography.shifts = shifts
+        rec = recon.run(unaligned, 'SIRT', niterations=10, cuda=True, aligned_geometry=True)
+        ref = recon.run(stack, 'SIRT', niterations=10, cuda=True, engine='astra3d')
+        assert rec.shape == ref.shape
+        assert numpy.abs(rec - ref).mean() < 0.1 * numpy.abs(ref).mean()
+
+    def test_run_sirt_aligned_geometry_slabs(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        shifts = numpy.zeros([slices.data.shape[0], 2])
+        shifts[:, 0] = numpy.linspace(-3, 3, slices.data.shape[0])
+        slices.metadata.Tomography.shifts = shifts
+        rec = recon.run(slices, 'SIRT', niterations=5, cuda=True, aligned_geometry=True, slab_size=2)
+        ref = recon.run(slices, 'SIRT', niterations=5, cuda=True, aligned_geometry=True, slab_size=5)
+        assert numpy.allclose(rec, ref, atol=1e-3 * numpy.abs(ref).max())
+        # Shifts along the tilt axis couple the slices, which are then reconstructed as one slab
+        shifts[:, 1] = 0.5
+        rec = recon.run(slices, 'SIRT', niterations=5, cuda=True, aligned_geometry=True, slab_size=2)
+        ref = recon.run(slices, 'SIRT', niterations=5, cuda=True, aligned_geometry=True, slab_size=5)
+        assert numpy.allclose(rec, ref)
+
+
+@pytest.mark.skipif(not astra.use_cuda(), reason="CUDA not detected")
+class TestForwardProjectCUDA:
+    def test_forward_project_cuda(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:125, :].deepcopy()
+        rec = slices.reconstruct('SIRT', iterations=5, cuda=False)
+        proj = rec.forward_project(slices.metadata.Tomography.tilts, cuda=True, slab_size=2)
+        ref = rec.forward_project(slices.metadata.Tomography.tilts, cuda=False)
+        assert proj.data.shape == slices.data.shape
+        assert numpy.allclose(proj.data, ref.data, atol=1e-2 * numpy.abs(ref.data).max())
+
 
 @pytest.mark.skipif(not astra.use_cuda(), reason="CUDA not detected")
 class TestStackRegisterCUDA:
@@ -128,3 +254,9 @@ class TestStackRegisterCUDA:
             stack.inav[0:20].axes_manager.signal_shape
         assert reg.axes_manager.navigation_shape == \
             stack.inav[0:20].axes_manager.navigation_shape
+
+    def test_register_pm_cuda(self):
+        stack = ds.get_needle_data(True)
+        reg = stack.stack_register('PM', iterations=2, cuda=True)
+        assert type(reg) is TomoStack
+        assert reg.data.shape == stack.data.shape
@@ -1,8 +1,13 @@
 import etspy
-from etspy import recon
+from etspy import recon, align
+from etspy.io import create_stack
 from etspy import datasets as ds
 import numpy
 import pytest
+import subprocess
+import sys
+import h5py
+import astra
 
 
 class TestReconstruction:
@@ -123,6 +128,209 @@ class TestReconRun:
         assert type(rec) is numpy.ndarray
 
 
+class TestReconPool:
+    def test_run_fbp_pool(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        rec_pool = recon.run(slices, 'FBP', cuda=False, ncores=2)
+        rec_serial = recon.run(slices, 'FBP', cuda=False, ncores=1)
+        assert rec_pool.shape == (4, slices.data.shape[1], slices.data.shape[1])
+        assert numpy.allclose(rec_pool, rec_serial)
+
+    def test_run_sirt_pool(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        rec_pool = recon.run(slices, 'SIRT', niterations=2, constrain=True, cuda=False, ncores=2)
+        rec_serial = recon.run(slices, 'SIRT', niterations=2, constrain=True, cuda=False, ncores=1)
+        assert rec_pool.dtype == numpy.float32
+        assert numpy.allclose(rec_pool, rec_serial)
+
+    def test_run_dart_pool(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        gray_levels = [0., 35., 70.]
+        rec_pool = recon.run(slices, 'DART', niterations=2, cuda=False, gray_levels=gray_levels,
+                             dart_iterations=2, ncores=2, seed=1)
+        rec_serial = recon.run(slices, 'DART', niterations=2, cuda=False, gray_levels=gray_levels,
+                               dart_iterations=2, ncores=1, seed=1)
+        assert numpy.array_equal(rec_pool, rec_serial)
+
+
+class TestDart:
+    def test_dart_segment(self):
+        rec = numpy.array([[0., 10., 40.], [60., 90., 20.]])
+        segmented = recon.dart_segment(rec, [25, 75], [0., 50., 100.])
+        assert numpy.array_equal(segmented, [[0., 0., 50.], [50., 100., 0.]])
+
+    def test_dart_boundaries(self):
+        segmented = numpy.zeros([8, 8])
+        segmented[3:5, 3:5] = 1.5
+        boundaries = recon.get_dart_boundaries(segmented)
+        assert boundaries.dtype == bool
+        assert boundaries[2:6, 2:6].all()
+        assert boundaries.sum() == 16
+
+
+class TestReconOutOfCore:
+    def test_recon_hdf5_output(self, tmp_path):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        rec = slices.reconstruct('FBP', cuda=False, out=str(tmp_path / "rec.hdf5"), chunk_size=2)
+        assert type(rec) is etspy.base.LazyRecStack
+        assert rec.data.shape == (4, slices.data.shape[1], slices.data.shape[1])
+        rec.compute()
+        assert type(rec) is etspy.base.RecStack
+
+    def test_recon_hdf5_output_file(self, tmp_path):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        filename = str(tmp_path / "rec.hdf5")
+        rec = slices.reconstruct('FBP', cuda=False, out=filename, chunk_size=2)
+        with h5py.File(filename, "r") as h5file:
+            assert h5file["reconstruction"].chunks[0] == 2
+            assert numpy.allclose(h5file["reconstruction"][:], rec.data.compute())
+        rec.close_file()
+        # The file is no longer held open for writing
+        h5py.File(filename, "w").close()
+
+    def test_recon_hdf5_output_dataset(self, tmp_path):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        ny = slices.data.shape[1]
+        with h5py.File(str(tmp_path / "rec.hdf5"), "w") as h5file:
+            dset = h5file.create_dataset("rec", [4, ny, ny], numpy.float32)
+            rec = slices.reconstruct('FBP', cuda=False, out=dset)
+            # The caller's file is still open for writing
+            assert h5file.mode == "r+"
+            assert type(rec) is etspy.base.LazyRecStack
+            assert numpy.allclose(dset[:], rec.data.compute())
+
+    def test_recon_memmap_output(self, tmp_path):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        rec = slices.reconstruct('SIRT', iterations=2, cuda=False, ncores=2, out=str(tmp_path / "rec.npy"))
+        ref = slices.reconstruct('SIRT', iterations=2, cuda=False, ncores=1)
+        assert type(rec) is etspy.base.LazyRecStack
+        assert numpy.allclose(numpy.load(tmp_path / "rec.npy"), ref.data)
+
+    def test_run_output_wrong_shape(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:124, :].deepcopy()
+        out = numpy.zeros([3, 10, 10], numpy.float32)
+        with pytest.raises(ValueError):
+            recon.run(slices, 'FBP', cuda=False, out=out)
+
+
+class TestReconEngines:
+    def test_run_astra3d_no_cuda(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            recon.run(slices, 'FBP', cuda=False, engine='astra3d')
+
+    def test_run_unknown_engine(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            recon.run(slices, 'FBP', cuda=False, engine='UNKNOWN')
+
+    def test_run_numpy_fbp(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = recon.run(slices, 'FBP', cuda=False, engine='numpy')
+        ref = recon.run(slices, 'FBP', cuda=False, ncores=1)
+        assert rec.shape == ref.shape
+        assert numpy.corrcoef(rec.ravel(), ref.ravel())[0, 1] > 0.99
+
+    def test_recon_numpy_fbp(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        rec = slices.reconstruct('FBP', engine='numpy')
+        assert type(rec) is etspy.base.RecStack
+        assert rec.data.shape[2] == slices.data.shape[1]
+
+    def test_run_numpy_sirt(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            recon.run(slices, 'SIRT', cuda=False, engine='numpy')
+
+    def test_run_matrix_sirt(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].deepcopy()
+        rec = recon.run(slices, 'SIRT', niterations=2, constrain=True, cuda=False, engine='matrix', slab_size=2)
+        ref = recon.run(slices, 'SIRT', niterations=2, constrain=True, cuda=False, ncores=1)
+        assert rec.shape == ref.shape
+        assert numpy.allclose(rec, ref, atol=1e-3)
+
+    def test_recon_matrix_sart(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        rec = slices.reconstruct('SART', iterations=2, constrain=True, cuda=False, engine='matrix')
+        assert type(rec) is etspy.base.RecStack
+        assert rec.data.shape[2] == slices.data.shape[1]
+
+    def test_run_matrix_fbp(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            recon.run(slices, 'FBP', cuda=False, engine='matrix')
+
+    def test_joseph_matrix(self):
+        thetas = numpy.radians(numpy.concatenate([numpy.arange(-76, 77, 4.), [45, -45, 90]]))
+        matrix = recon.get_joseph_matrix(thetas, 40, 30, roi_y=(5, 35), roi_z=(2, 28))
+        ref = recon.get_system_matrix(thetas, 40, 30, roi_y=(5, 35), roi_z=(2, 28))
+        assert matrix.shape == ref.shape
+        assert abs(matrix - ref).max() < 1e-3
+
+    def test_run_without_astra(self, tmp_path):
+        code = "\n".join([
+            "import sys",
+            "sys.modules['astra'] = None",
+            "import numpy",
+            "from etspy import recon, datasets as ds",
+            "assert not recon.has_astra and not recon.use_cuda()",
+            "slices = ds.get_needle_data(True).isig[120:122, :].deepcopy()",
+            "fbp = slices.reconstruct('FBP', engine='numpy', show_progressbar=False)",
+            "sirt = slices.reconstruct('SIRT', iterations=2, engine='matrix', show_progressbar=False)",
+            "numpy.save(sys.argv[1], sirt.data)",
+            "try:",
+            "    slices.reconstruct('SIRT', iterations=2, show_progressbar=False)",
+            "except ValueError:",
+            "    sys.exit(0)",
+            "sys.exit(1)",
+        ])
+        filename = str(tmp_path / "sirt.npy")
+        result = subprocess.run([sys.executable, "-c", code, filename], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        stack = ds.get_needle_data(True)
+        ref = stack.isig[120:122, :].deepcopy().reconstruct('SIRT', iterations=2, engine='matrix')
+        assert numpy.allclose(numpy.load(filename), ref.data, atol=1e-2 * numpy.abs(ref.data).max())
+
+    def test_filter_sinograms(self):
+        stack = ds.get_needle_data(True)
+        sinos = stack.isig[120:123, :].data
+        filtered = recon.filter_sinograms(sinos, 'ram-lak', axis=1)
+        assert filtered.shape == sinos.shape
+        filtered_t = recon.filter_sinograms(sinos.transpose([2, 0, 1]), 'ram-lak', axis=2)
+        assert numpy.allclose(filtered_t.transpose([1, 2, 0]), filtered)
+
+    def test_fbp_filter_ramps(self):
+        ramp = recon.get_fbp_filter('ram-lak', 64, ramp='linear')
+        assert numpy.allclose(ramp, numpy.linspace(0.5 / 64, 1 - 0.5 / 64, 33))
+        filt = recon.get_fbp_filter('hann', 64, cutoff=0.25)
+        assert numpy.all(filt[17:] == 0)
+        with pytest.raises(ValueError):
+            recon.get_fbp_filter('ram-lak', 64, ramp='wrong')
+
+    def test_filter_stack_shared_filter(self):
+        stack = ds.get_needle_data(True)
+        stack = stack.inav[0:3]
+        filtered = etspy.utils.filter_stack(stack, filter_name='cosine', cutoff=0.5)
+        ref = recon.filter_sinograms(stack.data, 'cosine', 0.5, axis=1, ramp='linear')
+        assert numpy.allclose(filtered.data, ref)
+
+
 class TestAstraError:
     def test_astra_sirt_error_cpu(self):
         stack = ds.get_needle_data(True)
@@ -143,3 +351,569 @@ class TestAstraError:
                                              constrain=True, thresh=0, cuda=False)
         assert type(error) is numpy.ndarray
         assert rec_stack.shape == (2, ny, ny)
+
+
+class TestGeometryCache:
+    def test_geometry_key(self):
+        thetas = numpy.linspace(-numpy.pi / 2, numpy.pi / 2, 10)
+        key = recon.geometry_key("matrix", thetas, 64, 64, "linear")
+        assert key == recon.geometry_key("matrix", thetas.copy(), 64, 64, "linear")
+        assert key != recon.geometry_key("matrix", thetas, 64, 32, "linear")
+        assert key != recon.geometry_key("matrix", thetas[1:], 64, 64, "linear")
+
+    def test_cache_lru(self):
+        cache = recon.GeometryCache(maxsize=2)
+        calls = []
+        for key in ["a", "b", "a", "c"]:
+            cache.get(key, lambda: calls.append(key) or len(calls))
+        assert calls == ["a", "b", "c"]
+        assert len(cache) == 2
+        assert "b" not in cache
+        assert "a" in cache
+
+    def test_cache_max_bytes(self):
+        cache = recon.GeometryCache(max_bytes=1000)
+        cache.get("a", lambda: numpy.zeros(100))
+        cache.get("b", lambda: numpy.zeros(50))
+        assert cache.nbytes == 400 and "a" not in cache
+        cache.get("c", lambda: numpy.zeros(200))
+        assert "c" not in cache and "b" in cache
+        matrix = cache.get("d", lambda: recon.get_system_matrix(numpy.zeros(1), 4, 4))
+        assert cache.nbytes == 400 + matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        cache.configure(max_bytes=0)
+        assert len(cache) == 0 and cache.nbytes == 0
+
+    def test_configure_geometry_cache(self):
+        max_bytes = recon.geometry_cache.max_bytes
+        thetas = numpy.linspace(-numpy.pi / 2, numpy.pi / 2, 10)
+        recon.SparseProjector(thetas, 32, 32, 4)
+        recon.configure_geometry_cache(max_bytes=100)
+        assert len(recon.geometry_cache) == 0
+        recon.configure_geometry_cache(max_bytes=max_bytes)
+        recon.SparseProjector(thetas, 32, 32, 4)
+        assert len(recon.geometry_cache) == 1
+        recon.clear_geometry_cache()
+        assert len(recon.geometry_cache) == 0
+
+    def test_cache_on_disk(self, tmp_path):
+        thetas = numpy.linspace(-numpy.pi / 2, numpy.pi / 2, 10)
+        key = recon.geometry_key("matrix", thetas, 32, 32, "linear")
+        matrix = recon.GeometryCache(cache_dir=str(tmp_path)).get(
+            key, lambda: recon.get_system_matrix(thetas, 32, 32))
+        assert (tmp_path / (key + ".npz")).exists()
+        loaded = recon.GeometryCache(cache_dir=str(tmp_path)).get(key, lambda: None)
+        assert loaded.shape == (10 * 32, 32 * 32)
+        assert abs(loaded - matrix).max() == 0
+
+    def test_sparse_projector_cached(self):
+        thetas = numpy.linspace(-numpy.pi / 2, numpy.pi / 2, 10)
+        recon.geometry_cache.clear()
+        first = recon.SparseProjector(thetas, 32, 32, 4)
+        second = recon.SparseProjector(thetas, 32, 32, 8)
+        assert len(recon.geometry_cache) == 1
+        assert first.matrix is second.matrix
+
+
+class TestReconEarlyStopping:
+    def test_run_sirt_tol(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].deepcopy()
+        slices.data[:, :, 0] = 0
+        iterations = numpy.zeros(slices.data.shape[2], int)
+        rec = recon.run(slices, 'SIRT', cuda=False, ncores=1, tol=0.2, max_iterations=100, iterations_out=iterations)
+        assert rec.shape == (3, slices.data.shape[1], slices.data.shape[1])
+        assert iterations[0] == 0
+        assert numpy.all(iterations[1:] < 100)
+        assert numpy.all(rec[0] == 0)
+
+    def test_run_sirt_tol_matches_fixed(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        iterations = numpy.zeros(slices.data.shape[2], int)
+        rec = recon.run(slices, 'SIRT', cuda=False, ncores=1, tol=0, max_iterations=20, iterations_out=iterations)
+        ref = recon.run(slices, 'SIRT', niterations=20, cuda=False, ncores=1)
+        assert numpy.all(iterations == 20)
+        assert numpy.allclose(rec, ref)
+
+    def test_run_matrix_tol(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].deepcopy()
+        iterations = numpy.zeros(slices.data.shape[2], int)
+        rec = recon.run(slices, 'SIRT', cuda=False, engine='matrix', tol=0.2, max_iterations=100, iterations_out=iterations)
+        ref_iterations = numpy.zeros(slices.data.shape[2], int)
+        ref = recon.run(slices, 'SIRT', cuda=False, ncores=2, tol=0.2, max_iterations=100, iterations_out=ref_iterations)
+        assert numpy.all(iterations == ref_iterations)
+        assert numpy.allclose(rec, ref, atol=1e-3)
+
+    def test_recon_tol_metadata(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = slices.reconstruct('SIRT', cuda=False, tol=0.2, max_iterations=50)
+        assert type(rec) is etspy.base.RecStack
+        assert len(rec.metadata.Reconstruction.iterations) == 2
+
+    def test_astra_error_snapshots_cpu(self):
+        stack = ds.get_needle_data(True)
+        [ntilts, ny, nx] = stack.data.shape
+        angles = stack.metadata.Tomography.tilts
+        sino = stack.isig[120, :].data
+        rec_all, error_all = recon.astra_error(sino, angles, iterations=4, cuda=False)
+        rec_stack, error = recon.astra_error(sino, angles, iterations=4, snapshots=[1, 3], cuda=False)
+        assert rec_stack.shape == (2, ny, ny)
+        assert numpy.allclose(rec_stack, rec_all[[1, 3]])
+        assert numpy.allclose(error, error_all)
+
+    def test_astra_error_multiple_slices_cpu(self):
+        stack = ds.get_needle_data(True)
+        [ntilts, ny, nx] = stack.data.shape
+        angles = stack.metadata.Tomography.tilts
+        sinos = stack.isig[120:123, :].data
+        rec_stack, error = recon.astra_error(sinos, angles, iterations=2, snapshots=[], cuda=False)
+        assert rec_stack.shape == (3, 0, ny, ny)
+        assert error.shape == (3, 2)
+
+    def test_astra_error_bad_snapshots(self):
+        stack = ds.get_needle_data(True)
+        angles = stack.metadata.Tomography.tilts
+        sino = stack.isig[120, :].data
+        for snapshots in [[4], [-1], [1, 1]]:
+            with pytest.raises(ValueError):
+                recon.astra_error(sino, angles, iterations=4, snapshots=snapshots, cuda=False)
+
+
+class TestReconROI:
+    def test_run_fbp_roi(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:126, :].deepcopy()
+        ref = recon.run(slices, 'FBP', cuda=False, ncores=1, engine='numpy')
+        rec = recon.run(slices, 'FBP', cuda=False, ncores=1, engine='numpy',
+                        slices=slice(2, 5), roi_y=(60, 180), roi_z=(90, 150))
+        assert rec.shape == (3, 60, 120)
+        assert numpy.allclose(rec, ref[2:5, 90:150, 60:180], atol=1e-3)
+
+    def test_run_sirt_roi_matrix(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].deepcopy()
+        rec = recon.run(slices, 'SIRT', niterations=2, cuda=False, ncores=1, roi_y=(60, 180), roi_z=(90, 150))
+        rec_matrix = recon.run(slices, 'SIRT', niterations=2, cuda=False, engine='matrix',
+                               roi_y=(60, 180), roi_z=(90, 150))
+        assert rec.shape == (3, 60, 120)
+        assert numpy.allclose(rec, rec_matrix, atol=1e-3)
+
+    def test_recon_roi_axes(self):
+        stack = ds.get_needle_data(True)
+        rec = stack.reconstruct('FBP', cuda=False, slices=slice(100, 104), roi_y=(60, 180), roi_z=(90, 150))
+        assert type(rec) is etspy.base.RecStack
+        assert rec.data.shape == (4, 60, 120)
+        assert rec.axes_manager[0].offset == 100 * stack.axes_manager[1].scale
+        assert rec.axes_manager[1].offset == 60 * stack.axes_manager[2].scale
+        assert rec.axes_manager[2].offset == 90 * stack.axes_manager[2].scale
+
+    def test_run_roi_outside(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            recon.run(slices, 'FBP', cuda=False, roi_y=(100, 300))
+
+
+class TestReconMultigrid:
+    def test_bin_upsample(self):
+        sinos = numpy.ones([5, 255, 3], numpy.float32)
+        binned = recon.bin_sinograms(sinos, 4)
+        assert binned.shape == (5, 63, 3)
+        assert numpy.allclose(binned, 0.25)
+        rec = recon.upsample_volume(numpy.ones([3, 50, 63], numpy.float32), 4, (201, 255))
+        assert rec.shape == (3, 201, 255)
+        assert numpy.allclose(rec, 1)
+
+    def test_run_sirt_multigrid(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].deepcopy()
+        thetas = numpy.pi * slices.metadata.Tomography.tilts / 180.0
+        sinos = numpy.transpose(slices.data, [2, 0, 1])
+        projector = recon.SparseProjector(thetas, sinos.shape[2], sinos.shape[2], 3)
+        rec = recon.run(slices, 'SIRT', niterations=5, cuda=False, engine='matrix')
+        rec_multigrid = recon.run(slices, 'SIRT', niterations=5, cuda=False, engine='matrix',
+                                  multigrid=[4, 2], multigrid_iterations=10)
+        assert rec_multigrid.shape == rec.shape
+        assert numpy.linalg.norm(projector.forward(rec_multigrid) - sinos) < \
+            numpy.linalg.norm(projector.forward(rec) - sinos)
+
+    def test_run_multigrid_engines(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = recon.run(slices, 'SIRT', niterations=2, cuda=False, ncores=1, multigrid=[2])
+        rec_pool = recon.run(slices, 'SIRT', niterations=2, cuda=False, ncores=2, multigrid=[2])
+        rec_matrix = recon.run(slices, 'SIRT', niterations=2, cuda=False, engine='matrix', multigrid=[2])
+        assert numpy.allclose(rec, rec_pool)
+        assert numpy.allclose(rec, rec_matrix, atol=1e-3)
+
+    def test_recon_multigrid_roi(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = slices.reconstruct('SART', iterations=2, cuda=False, roi_y=(60, 180), roi_z=(90, 150),
+                                 multigrid=[4], multigrid_iterations=[5])
+        assert type(rec) is etspy.base.RecStack
+        assert rec.data.shape == (2, 60, 120)
+
+    def test_run_multigrid_bad_levels(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            recon.run(slices, 'SIRT', niterations=2, cuda=False, multigrid=[2, 4])
+        with pytest.raises(ValueError):
+            recon.run(slices, 'SIRT', niterations=2, cuda=False, multigrid=[4, 2], multigrid_iterations=[5])
+
+
+class TestReconInitial:
+    def test_recon_sirt_continue(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = slices.reconstruct('SIRT', iterations=2, cuda=False, engine='matrix')
+        rec = slices.reconstruct('SIRT', iterations=3, cuda=False, engine='matrix', initial=rec)
+        ref = slices.reconstruct('SIRT', iterations=5, cuda=False, engine='matrix')
+        assert numpy.allclose(rec.data, ref.data, atol=1e-3)
+
+    def test_run_sirt_initial_engines(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        initial = recon.run(slices, 'SIRT', niterations=2, cuda=False, ncores=1)
+        ref = recon.run(slices, 'SIRT', niterations=4, cuda=False, ncores=1)
+        rec = recon.run(slices, 'SIRT', niterations=2, cuda=False, ncores=1, initial=initial)
+        rec_pool = recon.run(slices, 'SIRT', niterations=2, cuda=False, ncores=2, initial=initial)
+        assert numpy.allclose(rec, ref, atol=1e-3)
+        assert numpy.allclose(rec_pool, ref, atol=1e-3)
+
+    def test_recon_initial_fbp(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = slices.reconstruct('SART', iterations=2, cuda=False, initial='fbp', roi_y=(60, 180))
+        assert type(rec) is etspy.base.RecStack
+        assert rec.data.shape == (2, slices.data.shape[1], 120)
+
+    def test_run_dart_initial(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        initial = recon.run(slices, 'SIRT', niterations=10, cuda=False, ncores=1)
+        kwargs = dict(niterations=2, cuda=False, gray_levels=[0., 35., 70.], dart_iterations=1, seed=0,
+                      initial=initial)
+        rec = recon.run(slices, 'DART', ncores=1, **kwargs)
+        rec_pool = recon.run(slices, 'DART', ncores=2, **kwargs)
+        assert numpy.array_equal(rec, rec_pool)
+
+    def test_recon_initial_bad(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            slices.reconstruct('SIRT', iterations=2, cuda=False, initial='sirt')
+        with pytest.raises(ValueError):
+            slices.reconstruct('SIRT', iterations=2, cuda=False, initial=numpy.zeros([1, 10, 10]))
+        with pytest.raises(ValueError):
+            slices.reconstruct('FBP', cuda=False, initial='fbp')
+
+
+class TestReconOrderedSubsets:
+    def test_get_subsets(self):
+        thetas = numpy.linspace(-70, 70, 15)[::-1]
+        subsets = recon.get_subsets(thetas, 4)
+        assert len(subsets) == 4
+        assert sorted(numpy.concatenate(subsets)) == list(range(15))
+        assert list(subsets[0]) == [14, 10, 6, 2]
+        assert len(recon.get_subsets(thetas)) == 15
+        with pytest.raises(ValueError):
+            recon.get_subsets(thetas, 16)
+
+    def test_get_subset_order(self):
+        for ordering in ['sequential', 'random', 'golden']:
+            order = recon.get_subset_order(10, ordering)
+            assert sorted(order) == list(range(10))
+        assert list(recon.get_subset_order(5, 'golden')) == [0, 3, 1, 4, 2]
+        with pytest.raises(ValueError):
+            recon.get_subset_order(10, 'bad')
+
+    def test_run_os_sart(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        thetas = numpy.pi * slices.metadata.Tomography.tilts / 180.0
+        sinos = numpy.transpose(slices.data, [2, 0, 1])
+        projector = recon.SparseProjector(thetas, sinos.shape[2], sinos.shape[2], 2)
+        rec_sirt = recon.run(slices, 'SIRT', niterations=10, cuda=False, ncores=1)
+        rec = recon.run(slices, 'SART', niterations=1, cuda=False, ncores=1, nsubsets=10)
+        rec_matrix = recon.run(slices, 'SART', niterations=1, cuda=False, engine='matrix', nsubsets=10)
+        assert numpy.allclose(rec, rec_matrix, atol=1e-3)
+        assert numpy.linalg.norm(projector.forward(rec) - sinos) < \
+            numpy.linalg.norm(projector.forward(rec_sirt) - sinos)
+
+    def test_run_os_sart_pool(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = recon.run(slices, 'SART', niterations=1, cuda=False, ncores=1, nsubsets=7, ordering='sequential')
+        rec_pool = recon.run(slices, 'SART', niterations=1, cuda=False, ncores=2, nsubsets=7,
+                             ordering='sequential')
+        assert numpy.allclose(rec, rec_pool)
+
+    def test_sart_batch_shared_subsets(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        thetas = numpy.pi * slices.metadata.Tomography.tilts / 180.0
+        sinos = numpy.ascontiguousarray(numpy.transpose(slices.data, [2, 0, 1]), numpy.float32)
+        projector = recon.SparseProjector(thetas, sinos.shape[2], sinos.shape[2], 2)
+        subsets = recon.get_subset_projectors(projector, 5)
+        assert len(subsets) == 5
+        rec = recon.sart_batch(projector, sinos, 2, nsubsets=5, ordering='sequential')
+        rec_shared = recon.sart_batch(projector, sinos, 2, ordering='sequential', subsets=subsets)
+        assert numpy.allclose(rec, rec_shared)
+
+    def test_recon_os_sart_bad_ordering(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            slices.reconstruct('SART', iterations=1, cuda=False, ordering='bad')
+
+
+class TestReconKrylov:
+    def test_cgls_lsqr_batch(self):
+        stack = ds.get_needle_data(True)
+        thetas = numpy.pi * stack.metadata.Tomography.tilts / 180.0
+        sinos = numpy.transpose(stack.isig[120:122, :].data, [2, 0, 1]).astype(numpy.float32)
+        projector = recon.SparseProjector(thetas, sinos.shape[2], sinos.shape[2], 2)
+        matrix = projector.matrix.astype(numpy.float64)
+        for j in range(2):
+            b = sinos[j].ravel().astype(numpy.float64)
+            x = numpy.zeros(matrix.shape[1])
+            r = b.copy()
+            g = matrix.T @ r
+            p = g.copy()
+            gamma = g @ g
+            for i in range(5):
+                q = matrix @ p
+                alpha = gamma / (q @ q)
+                x += alpha * p
+                r -= alpha * q
+                g = matrix.T @ r
+                p = g + (g @ g) / gamma * p
+                gamma = g @ g
+            rec_cgls = recon.cgls_batch(projector, sinos, 5)
+            rec_lsqr = recon.lsqr_batch(projector, sinos, 5)
+            assert numpy.allclose(rec_cgls[j].ravel(), x, atol=1e-3)
+            assert numpy.allclose(rec_lsqr[j].ravel(), x, atol=1e-3)
+
+    def test_run_cgls(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        thetas = numpy.pi * slices.metadata.Tomography.tilts / 180.0
+        sinos = numpy.transpose(slices.data, [2, 0, 1])
+        projector = recon.SparseProjector(thetas, sinos.shape[2], sinos.shape[2], 2)
+        rec_sirt = recon.run(slices, 'SIRT', niterations=50, cuda=False, engine='matrix')
+        rec = recon.run(slices, 'CGLS', niterations=10, cuda=False)
+        assert rec.shape == rec_sirt.shape
+        assert numpy.linalg.norm(projector.forward(rec) - sinos) < \
+            numpy.linalg.norm(projector.forward(rec_sirt) - sinos)
+
+    def test_run_tol_return_type(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = recon.run(slices, 'SIRT', cuda=False, ncores=1, tol=0.2, max_iterations=20)
+        assert type(rec) is numpy.ndarray
+        with pytest.raises(ValueError):
+            recon.run(slices, 'SIRT', cuda=False, ncores=1, tol=0.2, iterations_out=numpy.zeros(3, int))
+
+    def test_run_lsqr_tol(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].deepcopy()
+        slices.data[:, :, 1] = 0
+        iterations = numpy.zeros(slices.data.shape[2], int)
+        rec = recon.run(slices, 'LSQR', cuda=False, tol=0.5, max_iterations=100, check_every=2, iterations_out=iterations)
+        assert iterations[1] == 0
+        assert numpy.all(rec[1] == 0)
+        assert numpy.all(iterations < 100)
+
+    def test_recon_cgls(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        rec = slices.reconstruct('CGLS', iterations=5, constrain=True, cuda=False, tol=0.5)
+        assert type(rec) is etspy.base.RecStack
+        assert rec.data.min() >= 0
+        assert len(rec.metadata.Reconstruction.iterations) == 2
+
+
+class TestReconTV:
+    def test_tv_gradient_adjoint(self):
+        rng = numpy.random.default_rng(0)
+        vol = rng.random([2, 20, 30])
+        grad = rng.random([2, 2, 20, 30])
+        assert numpy.isclose(numpy.sum(recon.tv_gradient(vol) * grad),
+                             -numpy.sum(vol * recon.tv_divergence(grad)))
+
+    def test_run_tv(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        ref = recon.run(slices, 'CGLS', niterations=30, cuda=False)
+        sparse_slices = slices.inav[::4].deepcopy()
+        sparse_slices.metadata.Tomography.tilts = slices.metadata.Tomography.tilts[::4]
+        rng = numpy.random.default_rng(0)
+        sparse_slices.data = sparse_slices.data + rng.normal(0, 0.05 * slices.data.max(), sparse_slices.data.shape)
+        rec_sirt = recon.run(sparse_slices, 'SIRT', niterations=100, constrain=True, cuda=False, engine='matrix')
+        rec = recon.run(sparse_slices, 'TV', niterations=200, constrain=True, cuda=False, tv_weight=1000)
+        assert rec.shape == ref.shape
+        assert rec.min() >= 0
+        assert numpy.abs(rec - ref).mean() < numpy.abs(rec_sirt - ref).mean()
+
+    def test_recon_tv_tol(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].inav[::4].deepcopy()
+        slices.metadata.Tomography.tilts = stack.metadata.Tomography.tilts[::4]
+        slices.data[:, :, 1] = 0
+        rec = slices.reconstruct('TV', iterations=500, constrain=True, cuda=False, tv_weight=1000, tol=0.5)
+        iterations = rec.metadata.Reconstruction.iterations
+        assert type(rec) is etspy.base.RecStack
+        assert iterations[1] == 0
+        assert numpy.all(iterations < 500)
+
+
+class TestReconChannels:
+    def test_recon_channels_list(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:123, :].deepcopy()
+        inverted = slices.deepcopy()
+        inverted.data = inverted.data.max() - inverted.data
+        recs = slices.reconstruct_channels([inverted], 'SIRT', iterations=2, cuda=False, slices=slice(0, 3, 2))
+        ref = inverted.reconstruct('SIRT', iterations=2, cuda=False, slices=slice(0, 3, 2))
+        assert len(recs) == 2
+        assert type(recs[1]) is etspy.base.RecStack
+        assert recs[1].data.shape == ref.data.shape
+        assert numpy.allclose(recs[1].data, ref.data)
+        assert recs[1].axes_manager[0].offset == ref.axes_manager[0].offset
+        assert recs[1].axes_manager[0].scale == ref.axes_manager[0].scale
+
+    def test_recon_channels_axis(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        data = numpy.stack([slices.data, 2 * slices.data])
+        channels = etspy.base.TomoStack(data)
+        channels.axes_manager[0].name = 'Tilt'
+        channels.metadata.add_node('Tomography')
+        channels.metadata.Tomography.add_dictionary(slices.metadata.Tomography.as_dictionary())
+        recs = channels.reconstruct_channels(method='FBP', cuda=False)
+        ref = slices.reconstruct('FBP', cuda=False)
+        assert len(recs) == 2
+        assert numpy.allclose(recs[0].data, ref.data, atol=1e-5 * numpy.abs(ref.data).max())
+        assert numpy.allclose(recs[1].data, 2 * ref.data, atol=1e-5 * numpy.abs(ref.data).max())
+
+    def test_recon_channels_bad_tilts(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        other = slices.deepcopy()
+        other.metadata.Tomography.tilts = other.metadata.Tomography.tilts + 1
+        with pytest.raises(ValueError):
+            slices.reconstruct_channels([other], 'FBP', cuda=False)
+
+    def test_recon_channels_aligned_geometry(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[:, 120:122].deepcopy()
+        other = slices.deepcopy()
+        with pytest.raises(ValueError):
+            slices.reconstruct_channels([other], 'SIRT', iterations=2, cuda=False, aligned_geometry=True)
+
+
+class TestReconAlignedGeometry:
+    def test_alignment_vectors_identity(self):
+        stack = ds.get_needle_data(True)
+        thetas = numpy.pi * stack.metadata.Tomography.tilts / 180.0
+        vectors = recon.get_alignment_vectors(thetas, 256, 256)
+        proj_geom = astra.create_proj_geom("parallel3d", 1.0, 1.0, 256, 256, thetas)
+        assert numpy.allclose(vectors, astra.geom_2vec(proj_geom)["Vectors"])
+
+    def test_alignment_vectors_match_resampling(self):
+        ny, nx = 64, 48
+        rng = numpy.random.default_rng(0)
+        shifts = rng.uniform(-4, 4, [2, 2])
+        rows, cols = numpy.mgrid[0:ny, 0:nx]
+        image = numpy.exp(-((cols - 30) ** 2 + (rows - 20) ** 2) / 4.5).astype(numpy.float32)
+        stack = create_stack(numpy.stack([image, image]), numpy.zeros(2))
+        aligned = align.apply_shifts(stack, shifts).trans_stack(2.5, -1.5, 7.0)
+        thetas = numpy.array([0.0, 0.5])
+        vectors = recon.get_alignment_vectors(thetas, ny, nx, shifts, 2.5, -1.5, 7.0)
+        ref_vectors = recon.get_alignment_vectors(thetas, ny, nx)
+        for i in range(2):
+            weights = aligned.data[i] / aligned.data[i].sum()
+            col, row = (weights * cols).sum(), (weights * rows).sum()
+            ref_pos = ref_vectors[i, 3:6] + (row - (ny - 1) / 2) * ref_vectors[i, 6:9] \
+                + (col - (nx - 1) / 2) * ref_vectors[i, 9:12]
+            pos = vectors[i, 3:6] + (20 - (ny - 1) / 2) * vectors[i, 6:9] + (30 - (nx - 1) / 2) * vectors[i, 9:12]
+            assert numpy.allclose(pos, ref_pos, atol=0.05)
+
+    def test_aligned_geometry_requires_cuda(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:121, :].deepcopy()
+        with pytest.raises(ValueError):
+            recon.run(slices, 'SIRT', niterations=2, cuda=False, aligned_geometry=True)
+
+    def test_aligned_geometry_slices(self):
+        stack = ds.get_needle_data(True)
+        with pytest.raises(ValueError):
+            recon.run(stack, 'SIRT', niterations=2, cuda=True, aligned_geometry=True, slices=slice(0, 2))
+
+    def test_alignment_vectors_separate_slices(self):
+        thetas = numpy.linspace(-numpy.pi / 3, numpy.pi / 3, 5)
+        shifts = numpy.zeros([5, 2])
+        shifts[:, 0] = numpy.arange(5)
+        assert recon.vectors_separate_slices(recon.get_alignment_vectors(thetas, 64, 32))
+        assert recon.vectors_separate_slices(recon.get_alignment_vectors(thetas, 64, 32, shifts, yshift=2))
+        shifts[:, 1] = 1
+        assert not recon.vectors_separate_slices(recon.get_alignment_vectors(thetas, 64, 32, shifts))
+        assert not recon.vectors_separate_slices(recon.get_alignment_vectors(thetas, 64, 32, xshift=1))
+        assert not recon.vectors_separate_slices(recon.get_alignment_vectors(thetas, 64, 32, tiltaxis=2))
+
+
+class TestForwardProject:
+    def test_forward_project_matches_astra(self):
+        rng = numpy.random.default_rng(0)
+        vol = rng.random([5, 32, 40]).astype(numpy.float32)
+        thetas = numpy.radians(numpy.arange(-60, 61, 15))
+        proj = recon.forward_project(vol, thetas, cuda=False, slab_size=2, ncores=2)
+        proj_geom = astra.create_proj_geom('parallel', 1.0, 40, thetas)
+        vol_geom = astra.create_vol_geom(32, 40)
+        proj_id = astra.create_projector('linear', proj_geom, vol_geom)
+        assert proj.shape == (len(thetas), 40, 5)
+        assert proj.dtype == numpy.float32
+        for i in range(5):
+            sino_id, sino = astra.create_sino(vol[i], proj_id)
+            astra.data2d.delete(sino_id)
+            assert numpy.allclose(proj[:, :, i], sino, atol=1e-4)
+
+
+class TestStreamingReconstructor:
+    def test_streaming_matches_fbp(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        tilts = slices.metadata.Tomography.tilts
+        ref = recon.run(slices, 'FBP', engine='numpy', show_progressbar=False)
+        streaming = etspy.base.StreamingReconstructor(256, 2)
+        for i in numpy.random.default_rng(0).permutation(len(tilts)):
+            streaming.add(slices.data[i], tilts[i])
+        rec = streaming.preview()
+        assert type(rec) is etspy.base.RecStack
+        assert streaming.nprojections == len(tilts)
+        assert numpy.allclose(rec.data, ref, atol=1e-4 * numpy.abs(ref).max())
+
+    def test_streaming_uneven_tilts(self):
+        stack = ds.get_needle_data(True)
+        slices = stack.isig[120:122, :].deepcopy()
+        tilts = slices.metadata.Tomography.tilts
+        ref = recon.run(slices, 'FBP', engine='numpy', show_progressbar=False)
+        idx = numpy.concatenate([numpy.arange(0, 38), numpy.arange(38, 77, 4)])
+        uneven = create_stack(slices.data[idx], tilts[idx])
+        unweighted = recon.run(uneven, 'FBP', engine='numpy', show_progressbar=False)
+        streaming = etspy.base.StreamingReconstructor(256, 2)
+        for i in idx:
+            streaming.add(slices.data[i], tilts[i])
+        assert numpy.abs(streaming.preview().data - ref).mean() < numpy.abs(unweighted - ref).mean()
+
+    def test_streaming_bad_projection(self):
+        streaming = etspy.base.StreamingReconstructor(64, 2)
+        streaming.add(numpy.zeros([64, 2]), 0)
+        with pytest.raises(ValueError):
+            streaming.add(numpy.zeros([64, 3]), 10)
+        with pytest.raises(ValueError):
+            streaming.add(numpy.zeros([64, 2]), 0)
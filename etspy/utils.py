@@ -14,6 +14,7 @@ import logging
 import tqdm
 from scipy import ndimage
 from etspy.align import calculate_shifts_stackreg
+from etspy import recon
 from pystackreg import StackReg
 from multiprocessing import Pool
 
@@ -324,45 +325,7 @@ def filter_stack(stack, filter_name="shepp-logan", cutoff=0.5):
         Filtered version of the input TomoStack.
 
     """
-    nangles, ny = stack.data.shape[0:2]
-
-    filter_length = max(64, 2 ** (int(np.ceil(np.log2(2 * ny)))))
-    freq_indices = np.arange(filter_length // 2 + 1)
-    filter = np.linspace(
-        cutoff / filter_length, 1 - cutoff / filter_length, len(freq_indices)
-    )
-    omega = 2 * np.pi * freq_indices / filter_length
-
-    if filter_name == "ram-lak":
-        pass
-    elif filter_name == "shepp-logan":
-        filter[1:] = filter[1:] * np.sinc(omega[1:] / (2 * np.pi))
-    elif filter_name in ["hanning", "hann",]:
-        filter[1:] = filter[1:] * (1 + np.cos(omega[1:])) / 2
-    elif filter_name in [
-        "cosine",
-        "cos",
-    ]:
-        filter[1:] = filter[1:] * np.cos(omega[1:] / 2)
-    else:
-        raise ValueError("Invalid filter type: %s." % filter_name)
-
-    filter = np.concatenate((filter, filter[-2:0:-1]))
-
-    nfilter = filter.shape[0]
-    pad_length = int((nfilter - ny) / 2)
-
-    if len(stack.data.shape) == 2:
-        padded = np.pad(stack.data, [[0, 0], [pad_length, pad_length]])
-        proj_fft = np.fft.fft(padded, axis=1)
-        filtered = np.fft.ifft(proj_fft * filter, axis=1).real
-        filtered = filtered[:, pad_length:-pad_length]
-
-    elif len(stack.data.shape) == 3:
-        padded = np.pad(stack.data, [[0, 0], [pad_length, pad_length], [0, 0]])
-        proj_fft = np.fft.fft(padded, axis=1)
-        filtered = np.fft.ifft(proj_fft * filter[:, np.newaxis], axis=1).real
-        filtered = filtered[:, pad_length:-pad_length, :]
+    filtered = recon.filter_sinograms(stack.data, filter_name, cutoff, axis=1, ramp="linear")
     result = stack.deepcopy()
     result.data = filtered
     return result